@@ -4,11 +4,18 @@ import cv2.aruco as aruco
 import numpy as np
 from picamera2 import Picamera2
 
-# --- カメラパラメータ（概算） ---
-camera_matrix = np.array([[600, 0, 320],
-                          [0, 600, 240],
-                          [0, 0, 1]], dtype=float)
-dist_coeffs = np.zeros((5,1))
+from vision.calibration import CALIBRATION_PATH, Calibration
+
+# --- カメラパラメータ（校正ファイルが無ければ概算） ---
+if CALIBRATION_PATH.exists():
+    calibration = Calibration.load(CALIBRATION_PATH)
+    camera_matrix = calibration.camera_matrix
+    dist_coeffs = calibration.dist_coeffs
+else:
+    camera_matrix = np.array([[600, 0, 320],
+                              [0, 600, 240],
+                              [0, 0, 1]], dtype=float)
+    dist_coeffs = np.zeros((5,1))
 
 # --- ARマーカーサイズ（mm単位） ---
 marker_size_mm = 50
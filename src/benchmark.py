@@ -0,0 +1,371 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from collections.abc import Callable
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+import cv2
+import numpy as np
+
+from gpio import GPIO, DigitalPin, PwmPin
+from main import STAGE_PATH, create_stage
+from pathfinding import PathPlanner
+from stage import Stage
+from stage_loader import ROOT, CompiledStage, compile_stage, read_layout
+from vision.recording import FrameRecorder, ReplaySource
+
+BENCHMARK_DIR = ROOT / ".cache" / "benchmark"
+SAMPLE_IMAGE_PATH = ROOT / "stub" / "ar-sample.jpg"
+# サンプル画像を縮小する大きさ (robot_parts.camera.FRAME_SIZEと同じ)
+SAMPLE_FRAME_SIZE = (640, 480)
+
+BENCHMARKS = ["planner", "detect", "gpio", "drive"]
+# 比較で遅くなったとみなす中央値の比
+REGRESSION_THRESHOLD: float = 1.1
+
+Summary = dict[str, Any]
+
+
+def summarize(samples: list[float] | np.ndarray, unit: str, **extra: Any) -> Summary:
+    """
+    計測値の統計をJSONに書ける辞書にする
+
+    Args:
+        samples (list[float] | np.ndarray): 計測値
+        unit (str): 計測値の単位
+        **extra (Any): 一緒に書き出す値
+
+    Returns:
+        Summary: 件数, 平均, 標準偏差, 最小, パーセンタイル (p50, p90, p99), 最大
+    """
+    values = np.asarray(samples, dtype=float)
+    if not len(values):
+        return {"unit": unit, "count": 0, **extra}
+    p50, p90, p99 = np.percentile(values, [50, 90, 99]).tolist()
+    return {
+        "unit": unit,
+        "count": len(values),
+        "mean": float(values.mean()),
+        "stdev": float(values.std()),
+        "min": float(values.min()),
+        "p50": p50,
+        "p90": p90,
+        "p99": p99,
+        "max": float(values.max()),
+        **extra,
+    }
+
+
+def _time_calls(
+    function: Callable[[], object], repeat: int, scale: float
+) -> np.ndarray:
+    """
+    関数を1回ずつ計測して、かかった時間をscale倍して返す
+    """
+    times = np.empty(repeat)
+    for i in range(repeat):
+        start = time.perf_counter_ns()
+        function()
+        times[i] = (time.perf_counter_ns() - start) * 1e-9 * scale
+    return times
+
+
+def bench_planner(
+    stage: Stage, repeat: int, queries: int, seed: int = 0
+) -> dict[str, Summary]:
+    """
+    PathPlannerの初期化 (形状と自由空間グラフの計算) と経路計画の時間を測る
+    経路計画はステージ上の一様な乱数の点の組で測る
+    """
+    init = _time_calls(lambda: PathPlanner(stage), repeat, 1e3)
+    planner = PathPlanner(stage)
+    rng = np.random.default_rng(seed)
+    points = rng.uniform((0, 0), (stage.x_size, stage.y_size), (queries, 2, 2))
+    times = []
+    failures = 0
+    for start, end in points.tolist():
+        begin = time.perf_counter_ns()
+        try:
+            planner.plan_path(tuple(start), tuple(end))
+        except ValueError:
+            failures += 1
+            continue
+        times.append((time.perf_counter_ns() - begin) * 1e-6)
+    return {
+        "planner_init": summarize(init, "ms", nodes=len(planner.graph[0])),
+        "plan_path": summarize(times, "ms", failures=failures),
+    }
+
+
+def _sample_recording(directory: Path, size: tuple[int, int]) -> Path:
+    """
+    サンプル画像をYUV420のフレーム1枚の記録にする (再生すると同じフレームを繰り返す)
+    """
+    image = cv2.imread(str(SAMPLE_IMAGE_PATH))
+    if image is None:
+        raise FileNotFoundError(f"画像が見つかりません: {SAMPLE_IMAGE_PATH}")
+    image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    path = directory / "ar-sample.npy"
+    recorder = FrameRecorder(path, capacity=1)
+    recorder.record(cv2.cvtColor(image, cv2.COLOR_BGR2YUV_I420))
+    recorder.close()
+    return path
+
+
+def bench_detect(recordings: list[Path], frames: int) -> dict[str, Summary]:
+    """
+    detect_arの1回あたりの時間を、サンプル画像と記録したフレームの再生で検出方法ごとに測る
+    カメラの代わりにReplaySourceを使うので、撮影の待ち時間は含まない
+    """
+    results: dict[str, Summary] = {}
+    with tempfile.TemporaryDirectory() as directory:
+        # cameraは読み込み時にROBOCON_REPLAYのファイルを開くので、先にサンプルの記録を作る
+        sample = _sample_recording(Path(directory), SAMPLE_FRAME_SIZE)
+        os.environ.setdefault("ROBOCON_REPLAY", str(sample))
+        from robot_parts import camera
+
+        if camera.FRAME_SIZE != SAMPLE_FRAME_SIZE:
+            sample = _sample_recording(Path(directory), camera.FRAME_SIZE)
+
+        original = camera.CAMERA
+        try:
+            for name, path in [("sample", sample)] + [(p.stem, p) for p in recordings]:
+                for mode in ("full", "tracking", "pyramid"):
+                    camera.CAMERA = ReplaySource(path)
+                    camera.TRACKER.reset()
+                    found = []
+
+                    def detect() -> None:
+                        observations = camera.detect_ar(mode)
+                        found.append(len(observations or []))
+
+                    times = _time_calls(detect, frames, 1e3)
+                    results[f"detect_ar[{name}/{mode}]"] = summarize(
+                        times,
+                        "ms",
+                        fps=float(1e3 / times.mean()),
+                        markers_per_frame=float(np.mean(found)),
+                    )
+        finally:
+            camera.CAMERA = original
+    return results
+
+
+def bench_gpio(calls: int) -> dict[str, Summary]:
+    """
+    mockのGPIOに出力する1回あたりの時間を測る (実機のGPIOでは測らない)
+    """
+    if not hasattr(GPIO, "add_listener"):
+        return {}
+    verbose = GPIO.VERBOSE
+    GPIO.VERBOSE = False
+    try:
+        pin = DigitalPin(0, GPIO.OUT)
+        pwm = PwmPin(1)
+        states = [GPIO.HIGH, GPIO.LOW] * (calls // 2)
+        duties = [50.0, 0.0] * (calls // 2)
+        output = _time_calls(lambda: pin.set_state(states.pop()), len(states), 1e6)
+        duty = _time_calls(lambda: pwm.set_dc(duties.pop()), len(duties), 1e6)
+    finally:
+        GPIO.VERBOSE = verbose
+    return {
+        "gpio_output": summarize(output, "us"),
+        "gpio_pwm": summarize(duty, "us"),
+    }
+
+
+class _CommandTimes:
+    """
+    Driverの指令の時刻と長さを集める記録先 (TelemetrySink)
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.__loop = loop
+        self.commands: list[tuple[float, float]] = []
+
+    def record(
+        self,
+        linear_velocity: float = 0,
+        angular_velocity: float = 0,
+        duration: float = 0,
+    ) -> None:
+        if linear_velocity or angular_velocity:
+            self.commands.append((self.__loop.time(), duration))
+
+
+async def bench_drive(
+    stage: Stage, compiled: CompiledStage, laps: int, speedup: float = 20
+) -> dict[str, Summary]:
+    """
+    Robot.driveを実際のイベントループで動かし、指令の間隔が予定よりどれだけ遅れたかを測る
+    1回の指令の後の間隔は、指令の長さとDriverの待ち時間の和になるはず
+    時間がかからないよう、速さはspeedup倍、待ち時間は1/speedupにする
+    """
+    robot, driver = stage.robot, stage.robot.driver
+    driver.mm_per_sec *= speedup
+    driver.rad_per_sec *= speedup
+    driver.settle_time /= speedup
+    robot.settle_time /= speedup
+    sink = _CommandTimes(asyncio.get_running_loop())
+    driver.telemetry = sink
+
+    route = compiled.route("start", f"goal{stage.goals[-1].goal_id}")
+    lateness = []
+    for lap in range(laps):
+        sink.commands.clear()
+        await robot.drive(route if lap % 2 == 0 else route[::-1])
+        for (start, duration), (end, _) in zip(sink.commands, sink.commands[1:]):
+            lateness.append((end - start - duration - driver.settle_time) * 1e3)
+    driver.telemetry = None
+    return {"drive_jitter": summarize(lateness, "ms", speedup=speedup)}
+
+
+def _commit() -> str:
+    """
+    現在のコミット (変更があれば末尾に-dirty)
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        dirty = (
+            subprocess.run(["git", "diff", "--quiet", "HEAD"], cwd=ROOT).returncode == 1
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{commit}-dirty" if dirty else commit
+
+
+def run_benchmarks(
+    benchmarks: list[str] = BENCHMARKS,
+    recordings: list[Path] | None = None,
+    stage_path: Path = STAGE_PATH,
+    quick: bool = False,
+) -> dict[str, Any]:
+    """
+    ベンチマークを実行して、結果をJSONに書ける辞書で返す
+
+    Args:
+        benchmarks (list[str], optional): 実行するベンチマーク (BENCHMARKSの一部). デフォルトは全て.
+        recordings (list[Path] | None, optional): detect_arを測るFrameRecorderの記録. デフォルトはNone (サンプル画像のみ).
+        stage_path (Path, optional): ステージファイル. デフォルトはSTAGE_PATH.
+        quick (bool, optional): 回数を減らして短時間で終わらせるかどうか. デフォルトはFalse.
+
+    Returns:
+        dict[str, Any]: 実行環境と、ベンチマークごとの統計 (results)
+    """
+    scale = 0.1 if quick else 1
+
+    async def run() -> dict[str, Summary]:
+        # Handの初期化にイベントループが要るため、ループの中でステージを作る
+        layout = read_layout(stage_path)
+        stage = create_stage(layout)
+        results: dict[str, Summary] = {}
+        if "planner" in benchmarks:
+            results |= bench_planner(stage, int(20 * scale) or 1, int(500 * scale))
+        if "detect" in benchmarks:
+            results |= bench_detect(recordings or [], int(200 * scale))
+        if "gpio" in benchmarks:
+            results |= bench_gpio(int(100_000 * scale))
+        if "drive" in benchmarks:
+            compiled = compile_stage(stage, layout.digest)
+            results |= await bench_drive(stage, compiled, int(10 * scale) or 1)
+        return results
+
+    return {
+        "commit": _commit(),
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "results": asyncio.run(run()),
+    }
+
+
+def compare(
+    baseline: dict[str, Any],
+    current: dict[str, Any],
+    threshold: float = REGRESSION_THRESHOLD,
+) -> list[str]:
+    """
+    2つの結果の中央値を比べた表を作る
+
+    Args:
+        baseline (dict[str, Any]): 比べる元の結果
+        current (dict[str, Any]): 今回の結果
+        threshold (float, optional): 遅くなったとみなす比. デフォルトはREGRESSION_THRESHOLD.
+
+    Returns:
+        list[str]: 表の各行 (遅くなったものには末尾に印を付ける)
+    """
+    lines = [f"{baseline['commit']} -> {current['commit']} (p50)"]
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None or "p50" not in before or "p50" not in result:
+            continue
+        ratio = result["p50"] / before["p50"] if before["p50"] > 0 else float("nan")
+        mark = "  <- 遅くなった" if ratio > threshold else ""
+        lines.append(
+            f"  {name:<36}{before['p50']:10.3f} -> {result['p50']:10.3f} "
+            f"{result['unit']:<3} (x{ratio:.2f}){mark}"
+        )
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="経路計画, AR検出, GPIO, 走行のベンチマークを実行してJSONに書き出す"
+    )
+    parser.add_argument(
+        "--only", nargs="+", choices=BENCHMARKS, default=BENCHMARKS, metavar="NAME"
+    )
+    parser.add_argument(
+        "--recording",
+        type=Path,
+        action="append",
+        default=[],
+        help="detect_arを測るFrameRecorderの記録 (複数指定できる)",
+    )
+    parser.add_argument("--stage", type=Path, default=STAGE_PATH)
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=None,
+        help="書き出し先. デフォルトは.cache/benchmark/<commit>.json",
+    )
+    parser.add_argument("--compare", type=Path, default=None, help="比べる元の結果")
+    parser.add_argument("--quick", action="store_true", help="回数を減らす")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.only, args.recording, args.stage, args.quick)
+    output = args.output or BENCHMARK_DIR / f"{report['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with output.open("w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    for name, result in report["results"].items():
+        if "p50" in result:
+            print(
+                f"{name:<38} p50 {result['p50']:10.3f} p99 {result['p99']:10.3f} "
+                f"{result['unit']}"
+            )
+    print(f"書き出しました: {output}")
+    if args.compare is not None:
+        with args.compare.open() as f:
+            print("\n".join(compare(json.load(f), report)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+import asyncio
+
+import numpy as np
+
+from localization import Localizer, Observation
+from robot import Robot
+from stage import Stage
+
+
+def _wrap(angle: float) -> float:
+    return (angle + np.pi) % (2 * np.pi) - np.pi
+
+
+class StateEstimator:
+    """
+    拡張カルマンフィルタでロボットの位置と向きを推定するクラス
+    Driverの指令速度で予測し、ARマーカーによる姿勢と超音波センサの距離で補正する
+    推定結果はRobot.position / Robot.rotationに書き込む
+    Attributes:
+        rate (float): 予測ステップの実行頻度 (Hz)
+        covariance (np.ndarray): 状態 (x, y, rotation) の共分散行列 (3, 3)
+    """
+
+    rate: float
+    covariance: np.ndarray
+
+    __robot: Robot
+    __localizer: Localizer | None
+    __range_offset: float
+
+    __state: np.ndarray
+    __process_noise: np.ndarray
+    __pose_noise: np.ndarray
+    __range_noise: float
+    __gate: float
+
+    __segments: np.ndarray
+
+    __jacobian: np.ndarray
+    __gain: np.ndarray
+    __row: np.ndarray
+    __identity: np.ndarray
+    __vector: np.ndarray
+    __correction: np.ndarray
+    __product: np.ndarray
+    __scratch: np.ndarray
+    __system: np.ndarray
+
+    def __init__(
+        self,
+        robot: Robot,
+        stage: Stage,
+        localizer: Localizer | None = None,
+        rate: float = 50,
+        range_offset: float = 0,
+        motion_noise: tuple[float, float] = (0.05, 0.05),
+        pose_noise: tuple[float, float] = (30, np.radians(5)),
+        range_noise: float = 20,
+        gate: float = 11.3,
+    ):
+        """
+        Args:
+            robot (Robot): 推定対象のロボット
+            stage (Stage): 超音波センサの距離予測に使うステージ
+            localizer (Localizer | None, optional): ARマーカーの観測から姿勢を求めるLocalizer. デフォルトはNone.
+            rate (float, optional): 予測ステップの実行頻度 (Hz). デフォルトは50.
+            range_offset (float, optional): ロボット中心から前向きの超音波センサまでの距離 (mm). デフォルトは0.
+            motion_noise (tuple[float, float], optional): 並進・回転の指令に対する誤差の割合. デフォルトは(0.05, 0.05).
+            pose_noise (tuple[float, float], optional): ARマーカーによる位置 (mm)・向き (rad) の標準偏差. デフォルトは(30, 5°).
+            range_noise (float, optional): 超音波センサの標準偏差 (mm). デフォルトは20.
+            gate (float, optional): 外れ値とみなすマハラノビス距離の二乗. デフォルトは11.3 (自由度3の99%).
+        """
+        self.rate = rate
+        self.__robot = robot
+        self.__localizer = localizer
+        self.__range_offset = range_offset
+
+        self.__state = np.array([*robot.position, robot.rotation], dtype=float)
+        self.covariance = np.diag([10.0**2, 10.0**2, np.radians(2) ** 2])
+        self.__process_noise = np.array(motion_noise, dtype=float)
+        self.__pose_noise = np.diag(
+            [pose_noise[0] ** 2, pose_noise[0] ** 2, pose_noise[1] ** 2]
+        )
+        self.__range_noise = range_noise**2
+        self.__gate = gate
+
+        # 超音波センサが当たりうる線分 (x1, y1, x2, y2)
+        self.__segments = np.array(
+            [(*p, *q) for p, q in stage.segments()], dtype=float
+        ).reshape(-1, 4)
+
+        self.__jacobian = np.eye(3)
+        self.__gain = np.zeros((3, 3))
+        self.__row = np.zeros(3)
+        self.__identity = np.eye(3)
+        # 予測・補正のたびに配列を確保しないための作業領域
+        self.__vector = np.zeros(3)
+        self.__correction = np.zeros(3)
+        self.__product = np.zeros((3, 3))
+        self.__scratch = np.zeros((3, 3))
+        self.__system = np.zeros((3, 4))
+
+    @property
+    def state(self) -> tuple[tuple[float, float], float]:
+        """
+        推定中の ((x, y), rotation)
+        """
+        x, y, rotation = self.__state
+        return (float(x), float(y)), float(rotation)
+
+    async def run(self) -> None:
+        """
+        一定周期で予測ステップを実行し続ける非同期メソッド
+        実行中はRobot.driveがこの推定値を使って向きを補正する
+        経過時間はイベントループの時計で測る (シミュレーションの仮想時計でも進み方が合う)
+        """
+        loop = asyncio.get_running_loop()
+        period = 1 / self.rate
+        self.__state[:] = (*self.__robot.position, self.__robot.rotation)
+        self.__robot.estimator = self
+        last = loop.time()
+        try:
+            while True:
+                await asyncio.sleep(period)
+                now = loop.time()
+                self.predict(now - last)
+                last = now
+        finally:
+            self.__robot.estimator = None
+
+    def predict(self, dt: float) -> None:
+        """
+        Driverの指令速度でdt秒分の状態を予測する
+
+        Args:
+            dt (float): 経過時間 (s)
+        """
+        driver = self.__robot.driver
+        v, w = driver.linear_velocity, driver.angular_velocity
+        if not v and not w:
+            return
+
+        x = self.__state
+        distance, angle = v * dt, w * dt
+        cos, sin = np.cos(x[2]), np.sin(x[2])
+        x[0] += distance * cos
+        x[1] += distance * sin
+        x[2] = _wrap(x[2] + angle)
+
+        f = self.__jacobian
+        f[0, 2] = -distance * sin
+        f[1, 2] = distance * cos
+        p = self.covariance
+        np.matmul(f, p, out=self.__product)
+        np.matmul(self.__product, f.T, out=p)
+        # 移動量に比例した誤差を加える
+        along = (self.__process_noise[0] * distance) ** 2
+        p[0, 0] += along * cos * cos
+        p[0, 1] += along * cos * sin
+        p[1, 0] += along * cos * sin
+        p[1, 1] += along * sin * sin
+        p[2, 2] += (self.__process_noise[1] * angle) ** 2
+        self.__write_back()
+
+    def update_pose(self, pose: tuple[tuple[float, float], float]) -> bool:
+        """
+        ARマーカーなどから得た姿勢の観測で補正する
+
+        Args:
+            pose (tuple[tuple[float, float], float]): 観測した ((x, y), rotation)
+
+        Returns:
+            bool: 観測を採用したかどうか (外れ値は棄却する)
+        """
+        (zx, zy), zr = pose
+        x, p = self.__state, self.covariance
+        innovation = self.__vector
+        innovation[:] = (zx - x[0], zy - x[1], _wrap(zr - x[2]))
+        s = np.add(p, self.__pose_noise, out=self.__product)
+        # S [K^T | S^-1 y] = [P | y] を一度に解く (P, Sは対称なのでK = P S^-1)
+        system = self.__system
+        system[:, :3] = p
+        system[:, 3] = innovation
+        system[:] = np.linalg.solve(s, system)
+        if innovation @ system[:, 3] > self.__gate:
+            return False
+
+        k = self.__gain
+        k[:] = system[:, :3].T
+        x += np.matmul(k, innovation, out=self.__correction)
+        x[2] = _wrap(x[2])
+        np.subtract(self.__identity, k, out=self.__product)
+        np.matmul(self.__product, p, out=self.__scratch)
+        p[:] = self.__scratch
+        self.__write_back()
+        return True
+
+    def update_ar(self, observations: list[Observation] | None) -> bool:
+        """
+        detect_arの観測をLocalizerで姿勢に変換して補正する
+
+        Args:
+            observations (list[Observation] | None): detect_arが返す観測
+
+        Returns:
+            bool: 観測を採用したかどうか
+        """
+        if not observations or self.__localizer is None:
+            return False
+        pose = self.__localizer.localize(observations, float(self.__state[2]))
+        if pose is None:
+            return False
+        return self.update_pose(pose)
+
+    def update_range(self, distance: float) -> bool:
+        """
+        前向きの超音波センサで測った壁までの距離で補正する
+
+        Args:
+            distance (float): 測定距離 (mm)
+
+        Returns:
+            bool: 観測を採用したかどうか (壁が見つからない、外れ値の場合は棄却する)
+        """
+        expected = self.expected_range()
+        if expected is None:
+            return False
+        predicted, h = expected
+        innovation = distance + self.__range_offset - predicted
+
+        p = self.covariance
+        ph = np.matmul(p, h, out=self.__vector)
+        s = float(h @ ph) + self.__range_noise
+        if innovation * innovation / s > self.__gate:
+            return False
+
+        x = self.__state
+        # x += k y, P -= k (Ph)^T (k = Ph / s)
+        outer = np.multiply.outer(ph, ph, out=self.__product)
+        outer /= s
+        p -= outer
+        ph *= innovation / s
+        x += ph
+        x[2] = _wrap(x[2])
+        self.__write_back()
+        return True
+
+    def expected_range(self) -> tuple[float, np.ndarray] | None:
+        """
+        超音波センサの観測モデル
+        現在の推定姿勢から前方の壁までの距離とそのヤコビアンを求める
+        (range_offsetは含まない. ヤコビアンの配列は次の呼び出しで上書きされる)
+
+        Returns:
+            tuple[float, np.ndarray] | None: (距離, ヤコビアン (3,)). 壁が無ければNone
+        """
+        x, y, rotation = self.__state
+        cos, sin = np.cos(rotation), np.sin(rotation)
+        segments = self.__segments
+        # 線分 p + u e と半直線 o + t d の交点: t = (p - o)×e / d×e, u = (p - o)×d / d×e
+        px, py = segments[:, 0] - x, segments[:, 1] - y
+        ex, ey = segments[:, 2] - segments[:, 0], segments[:, 3] - segments[:, 1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            den = cos * ey - sin * ex
+            t = (px * ey - py * ex) / den
+            u = (px * sin - py * cos) / den
+        t = np.where((np.abs(den) > 1e-9) & (t > 0) & (0 <= u) & (u <= 1), t, np.inf)
+        i = int(np.argmin(t))
+        if not np.isfinite(t[i]):
+            return None
+
+        best = float(t[i])
+        h = self.__row
+        h[:] = (
+            -ey[i] / den[i],
+            ex[i] / den[i],
+            best * (ey[i] * sin + ex[i] * cos) / den[i],
+        )
+        return best, h
+
+    def __write_back(self) -> None:
+        x, y, rotation = self.__state
+        self.__robot.position = (float(x), float(y))
+        self.__robot.rotation = float(rotation)
@@ -0,0 +1,328 @@
+import asyncio
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+import numpy as np
+
+# 記録する値の単位 (s) と上限 (これより大きい値は上限として数える)
+UNIT: float = 1e-6
+MAX_VALUE: float = 60
+
+
+class HdrHistogram:
+    """
+    HDR Histogram形式のヒストグラム
+    値を整数 (UNIT単位) にし、2の冪ごとの区間をさらに等分した区切りで数えるので、
+    1µsから数十秒までを決まった相対誤差で、固定の小さな配列に記録できる
+    記録は整数演算と配列への加算だけなので、制御ループの中で呼んでも遅れない
+    """
+
+    __sub_bits: int
+    __counts: np.ndarray
+    __max_count: int
+    __total: int
+    __sum: float
+    __min: int
+    __max: int
+
+    def __init__(self, significant_digits: int = 2, max_value: float = MAX_VALUE):
+        """
+        Args:
+            significant_digits (int, optional): 区切りの細かさ (有効数字の桁数). デフォルトは2 (相対誤差1%未満).
+            max_value (float, optional): 記録する値の上限 (s). デフォルトはMAX_VALUE.
+        """
+        # 1つの2の冪の区間を 2 * 10^digits 以上に分ける
+        self.__sub_bits = int(np.ceil(np.log2(2 * 10**significant_digits)))
+        self.__max_count = int(max_value / UNIT)
+        self.__counts = np.zeros(self.__index(self.__max_count) + 1, dtype=np.int64)
+        self.__total = 0
+        self.__sum = 0.0
+        self.__min = self.__max_count
+        self.__max = 0
+
+    def __index(self, count: int) -> int:
+        sub_count = 1 << self.__sub_bits
+        if count < sub_count:
+            return count
+        shift = count.bit_length() - self.__sub_bits
+        half = sub_count >> 1
+        return sub_count + (shift - 1) * half + ((count >> shift) - half)
+
+    def __value(self, index: int) -> float:
+        """
+        区切りの中央の値 (s)
+        """
+        sub_count = 1 << self.__sub_bits
+        if index < sub_count:
+            return index * UNIT
+        half = sub_count >> 1
+        shift = (index - sub_count) // half + 1
+        low = ((index - sub_count) % half + half) << shift
+        return (low + (1 << shift) / 2) * UNIT
+
+    def record(self, value: float) -> None:
+        """
+        値を1つ記録する
+
+        Args:
+            value (float): 値 (s, 負なら0, 上限を超えたら上限として数える)
+        """
+        count = min(max(int(value / UNIT), 0), self.__max_count)
+        self.__counts[self.__index(count)] += 1
+        self.__total += 1
+        self.__sum += count
+        self.__min = min(self.__min, count)
+        self.__max = max(self.__max, count)
+
+    def __len__(self) -> int:
+        return self.__total
+
+    @property
+    def mean(self) -> float:
+        return self.__sum * UNIT / self.__total if self.__total else 0.0
+
+    @property
+    def min(self) -> float:
+        return self.__min * UNIT if self.__total else 0.0
+
+    @property
+    def max(self) -> float:
+        return self.__max * UNIT
+
+    def percentile(self, q: float) -> float:
+        """
+        パーセンタイルの値 (s, 区切りの中央の値)
+
+        Args:
+            q (float): パーセンタイル (0 to 100)
+
+        Returns:
+            float: 値 (記録が無ければ0)
+        """
+        if not self.__total:
+            return 0.0
+        rank = max(int(np.ceil(q / 100 * self.__total)), 1)
+        index = int(np.searchsorted(np.cumsum(self.__counts), rank))
+        return min(max(self.__value(index), self.min), self.max)
+
+    def merge(self, other: "HdrHistogram") -> None:
+        """
+        同じ設定のヒストグラムの記録を足し合わせる
+        """
+        if len(other.__counts) != len(self.__counts):
+            raise ValueError("区切りの違うヒストグラムは足し合わせられません")
+        self.__counts += other.__counts
+        self.__total += other.__total
+        self.__sum += other.__sum
+        self.__min = min(self.__min, other.__min)
+        self.__max = max(self.__max, other.__max)
+
+    def reset(self) -> None:
+        self.__counts[:] = 0
+        self.__total = 0
+        self.__sum = 0.0
+        self.__min = self.__max_count
+        self.__max = 0
+
+    def summary(self) -> dict[str, float]:
+        """
+        件数, 平均, 最小, パーセンタイル (p50, p90, p99, p99.9), 最大 (s)
+        """
+        return {
+            "count": self.__total,
+            "mean": self.mean,
+            "min": self.min,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "p99.9": self.percentile(99.9),
+            "max": self.max,
+        }
+
+
+@dataclass
+class PulseStats:
+    """
+    1種類のアクチュエータのパルスの記録
+    Attributes:
+        overshoot (HdrHistogram): 実際の長さから指令した長さを引いた値
+        requested (float): 指令した長さの合計 (s)
+        actual (float): 実際の長さの合計 (s)
+    """
+
+    overshoot: HdrHistogram = field(default_factory=HdrHistogram)
+    requested: float = 0
+    actual: float = 0
+
+    @property
+    def drift(self) -> float:
+        """
+        実際の長さの合計が指令した長さの合計よりどれだけ長いかの割合
+        """
+        return self.actual / self.requested - 1 if self.requested else 0.0
+
+
+class Instrumentation:
+    """
+    イベントループの遅れとアクチュエータのパルスの長さを計測するクラス
+    ループの遅れは、一定間隔で眠るタスクが予定よりどれだけ遅れて起きたかで測る
+    パルスはpulseで眠った時間を種類ごとに記録する
+    ループの遅れが小さいのにパルスが伸びていればアクチュエータ側の処理が、
+    両方が同じように伸びていればループの混雑が原因だと分かる
+    Attributes:
+        loop_lag (HdrHistogram): イベントループの遅れ
+        pulses (dict[str, PulseStats]): アクチュエータの種類ごとのパルスの記録
+    """
+
+    loop_lag: HdrHistogram
+    pulses: dict[str, PulseStats]
+
+    __interval: float
+    __task: asyncio.Task | None
+
+    def __init__(self, interval: float = 0.01):
+        """
+        Args:
+            interval (float, optional): ループの遅れを測る間隔 (s). デフォルトは0.01.
+        """
+        self.loop_lag = HdrHistogram()
+        self.pulses = {}
+        self.__interval = interval
+        self.__task = None
+
+    def start(
+        self,
+        log_interval: float | None = None,
+        log: Callable[[str], object] = print,
+    ) -> None:
+        """
+        実行中のイベントループでループの遅れの計測を始める
+
+        Args:
+            log_interval (float | None, optional): 計測結果を出力する間隔 (s). Noneなら出力しない.
+            log (Callable[[str], object], optional): 出力先. デフォルトはprint.
+        """
+        self.stop()
+        self.__task = asyncio.get_running_loop().create_task(
+            self.__monitor(log_interval, log)
+        )
+
+    def stop(self) -> None:
+        """
+        ループの遅れの計測をやめる
+        """
+        if self.__task is not None:
+            self.__task.cancel()
+            self.__task = None
+
+    async def __monitor(
+        self, log_interval: float | None, log: Callable[[str], object]
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        last_log = loop.time()
+        while True:
+            expected = loop.time() + self.__interval
+            await asyncio.sleep(self.__interval)
+            now = loop.time()
+            self.loop_lag.record(now - expected)
+            if log_interval is not None and now - last_log >= log_interval:
+                log(self.report())
+                last_log = now
+
+    def record_pulse(self, kind: str, requested: float, actual: float) -> None:
+        """
+        アクチュエータのパルスを1つ記録する
+
+        Args:
+            kind (str): アクチュエータの種類 ("wheel", "shoulder", "hand" など)
+            requested (float): 指令した長さ (s)
+            actual (float): 実際の長さ (s)
+        """
+        stats = self.pulses.get(kind)
+        if stats is None:
+            stats = self.pulses[kind] = PulseStats()
+        stats.overshoot.record(actual - requested)
+        stats.requested += requested
+        stats.actual += actual
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """
+        計測結果をJSONに書ける辞書にする (時間はs)
+        """
+        result = {"loop_lag": self.loop_lag.summary()}
+        for kind, stats in self.pulses.items():
+            result[f"pulse[{kind}]"] = stats.overshoot.summary() | {
+                "requested": stats.requested,
+                "actual": stats.actual,
+                "drift": stats.drift,
+            }
+        return result
+
+    def report(self) -> str:
+        """
+        計測結果を1行ごとにまとめた文字列 (時間はms)
+        """
+
+        def line(name: str, histogram: HdrHistogram) -> str:
+            return (
+                f"{name:<16}n={len(histogram):<6} "
+                f"p50 {histogram.percentile(50) * 1e3:7.2f} "
+                f"p99 {histogram.percentile(99) * 1e3:7.2f} "
+                f"max {histogram.max * 1e3:7.2f} ms"
+            )
+
+        lines = [line("loop lag", self.loop_lag)]
+        for kind, stats in self.pulses.items():
+            lines.append(
+                line(f"{kind} pulse", stats.overshoot)
+                + f"  drift {stats.drift * 100:+.2f}%"
+            )
+        return "\n".join(lines)
+
+
+INSTRUMENTATION: Instrumentation | None = None
+
+
+def enable(interval: float = 0.01) -> Instrumentation:
+    """
+    計測を有効にする (以降のpulseが記録される. ループの遅れはstartで測り始める)
+
+    Args:
+        interval (float, optional): ループの遅れを測る間隔 (s). デフォルトは0.01.
+
+    Returns:
+        Instrumentation: 計測結果を持つオブジェクト
+    """
+    global INSTRUMENTATION
+    disable()
+    INSTRUMENTATION = Instrumentation(interval)
+    return INSTRUMENTATION
+
+
+def disable() -> None:
+    """
+    計測を無効にする
+    """
+    global INSTRUMENTATION
+    if INSTRUMENTATION is not None:
+        INSTRUMENTATION.stop()
+        INSTRUMENTATION = None
+
+
+async def pulse(kind: str, duration: float) -> None:
+    """
+    アクチュエータを動かしている間だけ眠る (asyncio.sleepの代わりに使う)
+    計測が有効なら、実際に眠った時間を記録する (途中でキャンセルされたものは記録しない)
+
+    Args:
+        kind (str): アクチュエータの種類
+        duration (float): 指令する長さ (s)
+    """
+    instrumentation = INSTRUMENTATION
+    if instrumentation is None:
+        await asyncio.sleep(duration)
+        return
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    await asyncio.sleep(duration)
+    instrumentation.record_pulse(kind, duration, loop.time() - start)
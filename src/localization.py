@@ -0,0 +1,96 @@
+import numpy as np
+
+from robot import Robot
+from stage import Stage
+
+Observation = tuple[float, float, int]
+
+
+class Localizer:
+    """
+    ステージに登録されたARマーカーの観測からロボットの位置と向きを推定するクラス
+    Attributes:
+        camera_offset (float): ロボット中心からカメラまでの前方向の距離 (mm)
+    """
+
+    camera_offset: float
+
+    __index: np.ndarray
+    __positions: np.ndarray
+
+    def __init__(self, stage: Stage, camera_offset: float = 0):
+        self.camera_offset = camera_offset
+
+        # マーカーID → ar_markersの添字 (未登録は-1)
+        max_id = max((m.marker_id for m in stage.ar_markers), default=-1)
+        self.__index = np.full(max_id + 1, -1, dtype=np.intp)
+        for i, marker in enumerate(stage.ar_markers):
+            self.__index[marker.marker_id] = i
+        self.__positions = np.array(
+            [m.position for m in stage.ar_markers], dtype=float
+        ).reshape(-1, 2)
+
+    def localize(
+        self,
+        observations: list[Observation] | np.ndarray,
+        rotation: float | None = None,
+    ) -> tuple[tuple[float, float], float] | None:
+        """
+        見えている全てのARマーカーから最小二乗でロボットの位置と向きを求める
+        マーカーが1つしか見えていない場合は向きを求められないため、rotationを既知として位置だけを求める
+
+        Args:
+            observations (list[Observation] | np.ndarray): detect_arが返す (dx, dy, id) のリスト
+            rotation (float | None, optional): 現在のロボットの向き (rad). デフォルトはNone.
+
+        Returns:
+            tuple[tuple[float, float], float] | None: ((x, y), rotation). 推定できなければNone
+        """
+        obs = np.asarray(observations, dtype=float).reshape(-1, 3)
+        ids = obs[:, 2].astype(np.intp)
+        in_range = (0 <= ids) & (ids < len(self.__index))
+        indices = np.where(in_range, self.__index[np.where(in_range, ids, 0)], -1)
+        known = indices >= 0
+        if not known.any():
+            return None
+
+        # カメラ座標 (dx: 右, dy: 前) → ロボット座標 (x: 前, y: 左)
+        local = np.stack([obs[known, 1] + self.camera_offset, -obs[known, 0]], axis=1)
+        world = self.__positions[indices[known]]
+
+        if len(local) >= 2:
+            local_mean, world_mean = local.mean(axis=0), world.mean(axis=0)
+            lc, wc = local - local_mean, world - world_mean
+            theta = np.arctan2(
+                np.sum(lc[:, 0] * wc[:, 1] - lc[:, 1] * wc[:, 0]),
+                np.sum(lc[:, 0] * wc[:, 0] + lc[:, 1] * wc[:, 1]),
+            )
+        elif rotation is not None:
+            local_mean, world_mean = local[0], world[0]
+            theta = rotation
+        else:
+            return None
+
+        cos, sin = np.cos(theta), np.sin(theta)
+        x = world_mean[0] - (cos * local_mean[0] - sin * local_mean[1])
+        y = world_mean[1] - (sin * local_mean[0] + cos * local_mean[1])
+        return (float(x), float(y)), float((theta + np.pi) % (2 * np.pi) - np.pi)
+
+    def correct(self, robot: Robot, observations: list[Observation] | None) -> bool:
+        """
+        観測からロボットの位置と向きを推定し、ロボットに反映する
+
+        Args:
+            robot (Robot): 補正するロボット
+            observations (list[Observation] | None): detect_arが返す観測
+
+        Returns:
+            bool: 補正できたかどうか
+        """
+        if not observations:
+            return False
+        pose = self.localize(observations, robot.rotation)
+        if pose is None:
+            return False
+        robot.position, robot.rotation = pose
+        return True
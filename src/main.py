@@ -1,25 +1,41 @@
 import asyncio
+import os
+from collections.abc import Awaitable, Callable
+from pathlib import Path
 
-import numpy as np
-
-from pathfinding import PathPlanner
+import instrumentation
+import stage_loader
+import tracing
 from robot import Robot
 from robot_parts.arm import Arm, Hand, Shoulder
 from robot_parts.driver import Driver, Wheel
-from stage import GoalArea, Stage, StartArea, Wall
-
-
-async def main():
-    start_area = StartArea(position=(4000, 0), size=1000)
-    goals = [
-        GoalArea(position=(1500, 0), size=1000, goal_id=1),
-        GoalArea(position=(2500, 2000), size=1000, goal_id=2),
-        GoalArea(position=(0, 2000), size=1000, goal_id=3),
-    ]
-    wall = Wall(
-        x=1000,
-        obstacled_y=[(0, 1000), (2000, 3000)],
-    )
+from scheduler import MATCH_DURATION, MatchScheduler
+from stage import Stage
+from stage_loader import CompiledStage, StageLayout, compile_stage, read_layout
+from telemetry import TelemetryLog
+
+# 環境変数ROBOCON_STAGEにステージファイルを指定すると、その配置で試合をする
+STAGE_PATH = Path(os.environ.get("ROBOCON_STAGE", stage_loader.STAGE_PATH))
+# 環境変数ROBOCON_TELEMETRYに記録先を指定すると、試合中の状態をTelemetryLogに記録する
+TELEMETRY_PATH = os.environ.get("ROBOCON_TELEMETRY")
+# 環境変数ROBOCON_INSTRUMENTに秒数を指定すると、ループの遅れとパルスの長さを計測してその間隔で表示する
+INSTRUMENT_INTERVAL = os.environ.get("ROBOCON_INSTRUMENT")
+# 環境変数ROBOCON_TRACEに書き出し先を指定すると、各動作の区間をChromeのtrace event形式で記録する
+TRACE_PATH = os.environ.get("ROBOCON_TRACE")
+# 環境変数ROBOCON_STRATEGYに戦略の関数名 (STRATEGIESのキー) を指定すると、その戦略で試合をする
+STRATEGY_NAME = os.environ.get("ROBOCON_STRATEGY", "scheduled_strategy")
+
+Strategy = Callable[[Stage, CompiledStage], Awaitable[None]]
+
+
+def create_stage(layout: StageLayout) -> Stage:
+    """
+    配置に合わせて試合のステージとロボットを作る
+    (Handの初期化でタスクを作るため、イベントループの中で呼ぶこと)
+
+    Args:
+        layout (StageLayout): ステージファイルから読み込んだ配置
+    """
     driver = Driver(
         r_wheel=Wheel(
             start_stop_pin=16,
@@ -51,23 +67,26 @@ async def main():
         l_hand=Hand(pin_num=17, release_angle=0, grip_angle=40),
     )
     robot = Robot(
-        position=((start_area.center[0] - 450, start_area.center[1])),
-        rotation=np.radians(0),
+        position=layout.robot_position,
+        rotation=layout.robot_rotation,
         radius=500 / 2,
         driver=driver,
         arm=arm,
     )
-    stage = Stage(
-        x_size=5000,
-        y_size=3000,
-        start_area=start_area,
-        wall=wall,
-        goals=goals,
-        ar_markers=[],
-        robot=robot,
-    )
+    return layout.create_stage(robot)
+
+
+async def strategy(stage: Stage, compiled: CompiledStage) -> None:
+    """
+    試合の戦略 (simulationからも同じものを動かせる)
 
-    path_planner = PathPlanner(stage)
+    Args:
+        stage (Stage): ステージ (ロボットを含む)
+        compiled (CompiledStage): 経路計画用のデータ
+    """
+    robot = stage.robot
+    goals = stage.goals
+    path_planner = compiled.planner
 
     # await robot.driver.turn(np.pi / 2)
     # await asyncio.sleep(1)
@@ -88,23 +107,78 @@ async def main():
 
     # await robot.driver.turn(np.pi / 2)
 
-    # async def strategy():
-    #     try:
-    #         pathes = [path_planner.plan_path(start_area.center, goal.center) for goal in goals]
-    #         for path in pathes:
-    #             await robot.pickup_parcel()
-    #             await robot.drive(path)
-    #             await robot.release_parcel()
-    #             await robot.drive(path[::-1])
-    #         while True:
-    #             await robot.pickup_parcel()
-    #             await robot.drive(pathes[2])
-    #             await robot.release_parcel()
-    #             await robot.drive(pathes[2][::-1])
-    #     except asyncio.CancelledError:
-    #         print("Strategy task cancelled")
-
-    # task = asyncio.Task(strategy())
+
+async def delivery_strategy(stage: Stage, compiled: CompiledStage) -> None:
+    """
+    スタートエリアから各ゴールへ1つずつ荷物を運び、その後は3番のゴールへ運び続ける戦略
+    (試合時間が終わってキャンセルされるまで続ける)
+    """
+    robot = stage.robot
+    pathes = [compiled.route("start", f"goal{goal.goal_id}") for goal in stage.goals]
+    await robot.drive(pathes[0][:1])
+    for path in pathes:
+        await robot.pickup_parcel()
+        await robot.drive(path)
+        await robot.release_parcel()
+        await robot.drive(path[::-1])
+    while True:
+        await robot.pickup_parcel()
+        await robot.drive(pathes[2])
+        await robot.release_parcel()
+        await robot.drive(pathes[2][::-1])
+
+
+async def scheduled_strategy(stage: Stage, compiled: CompiledStage) -> None:
+    """
+    試合の終了時刻までに届けきれる荷物だけを運ぶ戦略
+    各ゴールへ1つずつ運んだ後は往復の短いゴールへ運び続け、間に合わない動作は始めない
+    (試合の開始はこの関数を呼んだ時刻とする. 届けた数はタイムラインやトレースで確かめる)
+    """
+    scheduler = MatchScheduler(
+        stage, compiled, asyncio.get_running_loop().time() + MATCH_DURATION
+    )
+    await scheduler.deliver()
+
+
+STRATEGIES: dict[str, Strategy] = {
+    "strategy": strategy,
+    "delivery_strategy": delivery_strategy,
+    "scheduled_strategy": scheduled_strategy,
+}
+
+
+async def main():
+    if STRATEGY_NAME not in STRATEGIES:
+        raise ValueError(
+            f"未知の戦略です: {STRATEGY_NAME} (選べるのは {', '.join(STRATEGIES)})"
+        )
+    layout = read_layout(STAGE_PATH)
+    stage = create_stage(layout)
+    robot = stage.robot
+
+    # 同じ配置なら障害物の形状と経路表はキャッシュから読み込む
+    compiled = compile_stage(stage, layout.digest)
+
+    telemetry = TelemetryLog(Path(TELEMETRY_PATH), robot) if TELEMETRY_PATH else None
+    if telemetry is not None:
+        telemetry.start()
+    if INSTRUMENT_INTERVAL:
+        instrumentation.enable().start(log_interval=float(INSTRUMENT_INTERVAL))
+    tracer = tracing.enable() if TRACE_PATH else None
+
+    try:
+        await STRATEGIES[STRATEGY_NAME](stage, compiled)
+    finally:
+        if telemetry is not None:
+            telemetry.close()
+        if instrumentation.INSTRUMENTATION is not None:
+            print(instrumentation.INSTRUMENTATION.report())
+            instrumentation.disable()
+        if tracer is not None and TRACE_PATH:
+            tracer.export(Path(TRACE_PATH))
+            tracing.disable()
+
+    # task = asyncio.Task(delivery_strategy(stage, compiled))
 
     # # def additional_plot(ax: Axes):
     # #     def on_click(event: Event):
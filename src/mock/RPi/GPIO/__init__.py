@@ -51,11 +51,35 @@ BOTH: Final = 33
 _EventCallback: TypeAlias = Callable[[int], object]
 
 
+_Listener: TypeAlias = Callable[[Literal["output", "pwm"], int, float], object]
+_listeners: list[_Listener] = []
+
+
 def _debug(*values: object):
     if VERBOSE:
         print("mock.RPi.GPIO:", *values)
 
 
+def add_listener(callback: _Listener) -> None:
+    """
+    mock専用: 出力が変わるたびに (種類, チャンネル, 値) で呼ばれる関数を登録する
+    値はoutputなら0か1, pwmならデューティ比 (%)
+    """
+    _listeners.append(callback)
+
+
+def remove_listener(callback: _Listener) -> None:
+    """
+    mock専用: add_listenerで登録した関数を解除する
+    """
+    _listeners.remove(callback)
+
+
+def _notify(kind: Literal["output", "pwm"], channel: int, value: float) -> None:
+    for listener in _listeners:
+        listener(kind, channel, value)
+
+
 def setup(
     channel: int | list[int] | tuple[int, ...],
     direction: Literal[0, 1],
@@ -80,6 +104,10 @@ def output(
     /,
 ) -> None:
     _debug(f"GPIO.output called with channel: {channel}, value: {value}")
+    channels = channel if isinstance(channel, (list, tuple)) else [channel]
+    values = value if isinstance(value, (list, tuple)) else [value] * len(channels)
+    for c, v in zip(channels, values):
+        _notify("output", c, int(v))
 
 
 def input(channel: int, /) -> bool:
@@ -154,12 +182,14 @@ class PWM:
         _debug(
             f"GPIO.PWM.start called on channel: {self.channel} with dutycycle: {dutycycle}"
         )
+        _notify("pwm", self.channel, dutycycle)
 
     def ChangeDutyCycle(self, dutycycle: float, /) -> None:
         self.dutycycle = dutycycle
         _debug(
             f"GPIO.PWM.ChangeDutyCycle called on channel: {self.channel} with dutycycle: {dutycycle}"
         )
+        _notify("pwm", self.channel, dutycycle)
 
     def ChangeFrequency(self, frequency: float, /) -> None:
         self.frequency = frequency
@@ -169,3 +199,4 @@ class PWM:
 
     def stop(self) -> None:
         _debug(f"GPIO.PWM.stop called on channel: {self.channel}")
+        _notify("pwm", self.channel, 0)
@@ -0,0 +1,361 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+
+from main import STAGE_PATH
+from robot import SETTLE_TIME as ROBOT_SETTLE_TIME
+from robot_parts.arm import ArmState
+from robot_parts.driver import MM_PER_SEC, RAD_PER_SEC, SETTLE_TIME
+from simulation import (
+    MATCH_DURATION,
+    STRATEGIES,
+    Strategy,
+    TimelineEvent,
+    simulate,
+)
+from stage import Stage
+from stage_loader import StageLayout, read_layout
+
+# 報告するパーセンタイル
+PERCENTILES: tuple[float, ...] = (5, 25, 50, 75, 95)
+
+
+@dataclass
+class MatchParameters:
+    """
+    1試合分のロボットの性能
+    Attributes:
+        mm_per_sec (float): 並進の速さ (mm/s)
+        rad_per_sec (float): 旋回の速さ (rad/s)
+        settle_time (float): Driverの動作の後に待つ時間 (s)
+        robot_settle_time (float): Robotの走行やアームの動作の後に待つ時間 (s)
+        grip_success (float): 荷物をつかめる確率
+    """
+
+    mm_per_sec: float = MM_PER_SEC
+    rad_per_sec: float = RAD_PER_SEC
+    settle_time: float = SETTLE_TIME
+    robot_settle_time: float = ROBOT_SETTLE_TIME
+    grip_success: float = 1.0
+
+    def apply(self, stage: Stage) -> None:
+        """
+        ステージ上のロボットにこの性能を設定する (simulateのsetupに渡す)
+        """
+        driver = stage.robot.driver
+        driver.mm_per_sec = self.mm_per_sec
+        driver.rad_per_sec = self.rad_per_sec
+        driver.settle_time = self.settle_time
+        stage.robot.settle_time = self.robot_settle_time
+
+
+@dataclass
+class Perturbation:
+    """
+    性能のばらつきの大きさ
+    速さと待ち時間は公称値を中心にした正規分布 (標準偏差は公称値に対する割合),
+    つかめる確率は一様分布から試合ごとに選ぶ
+    Attributes:
+        nominal (MatchParameters): 公称の性能
+        speed (float): 速さの相対標準偏差. デフォルトは0.1.
+        settle_time (float): 待ち時間の相対標準偏差. デフォルトは0.3.
+        grip_success (tuple[float, float]): つかめる確率の範囲. デフォルトは(0.8, 1.0).
+    """
+
+    nominal: MatchParameters = field(default_factory=MatchParameters)
+    speed: float = 0.1
+    settle_time: float = 0.3
+    grip_success: tuple[float, float] = (0.8, 1.0)
+
+    def sample(self, rng: np.random.Generator, count: int) -> list[MatchParameters]:
+        """
+        性能をcount試合分選ぶ (速さと待ち時間は公称値の10%を下限にする)
+        """
+
+        def scaled(value: float, spread: float) -> np.ndarray:
+            return value * np.maximum(rng.normal(1, spread, count), 0.1)
+
+        mm_per_sec = scaled(self.nominal.mm_per_sec, self.speed)
+        rad_per_sec = scaled(self.nominal.rad_per_sec, self.speed)
+        settle_time = scaled(self.nominal.settle_time, self.settle_time)
+        robot_settle_time = scaled(self.nominal.robot_settle_time, self.settle_time)
+        grip_success = rng.uniform(*self.grip_success, count)
+        return [
+            MatchParameters(*map(float, values))
+            for values in zip(
+                mm_per_sec, rad_per_sec, settle_time, robot_settle_time, grip_success
+            )
+        ]
+
+
+@dataclass
+class MatchOutcome:
+    """
+    1試合分の結果
+    Attributes:
+        parameters (MatchParameters): 試合で使った性能
+        deliveries (list[tuple[float, int]]): 届けた荷物の (時刻 (s), ゴールの番号)
+        failed_grips (int): つかみ損ねた回数
+        finished (bool): 戦略が試合時間内に終わったかどうか
+        duration (float): 戦略が終わった (または打ち切った) 時刻 (s)
+    """
+
+    parameters: MatchParameters
+    deliveries: list[tuple[float, int]]
+    failed_grips: int
+    finished: bool
+    duration: float
+
+    @property
+    def score(self) -> int:
+        """
+        得点 (届けた荷物の数)
+        """
+        return len(self.deliveries)
+
+
+def score_timeline(
+    events: list[TimelineEvent],
+    layout: StageLayout,
+    grip_success: float,
+    rng: np.random.Generator,
+) -> tuple[list[tuple[float, int]], int]:
+    """
+    タイムラインから届けた荷物を数える
+    スタートエリアで手を閉じたら確率grip_successで荷物をつかみ、
+    荷物を持ったままゴールで手を開いたら届けたとみなす
+
+    Args:
+        events (list[TimelineEvent]): simulateのタイムライン
+        layout (StageLayout): ステージの配置 (スタートエリアとゴールを使う)
+        grip_success (float): 荷物をつかめる確率
+        rng (np.random.Generator): つかめたかどうかを決める乱数
+
+    Returns:
+        tuple[list[tuple[float, int]], int]: 届けた荷物の (時刻, ゴールの番号) と、つかみ損ねた回数
+    """
+    deliveries: list[tuple[float, int]] = []
+    failed_grips = 0
+    holding = False
+    gripped = False
+    for event in events:
+        now_gripped = ArmState.HANDS_GRIPPED in event.arm
+        if now_gripped and not gripped:
+            if layout.start_area.contains(event.position):
+                holding = bool(rng.random() < grip_success)
+                failed_grips += not holding
+        elif gripped and not now_gripped:
+            if holding:
+                goal = next(
+                    (g for g in layout.goals if g.contains(event.position)), None
+                )
+                if goal is not None:
+                    deliveries.append((event.time, goal.goal_id))
+            holding = False
+        gripped = now_gripped
+    return deliveries, failed_grips
+
+
+def _run_match(
+    strategy: Strategy,
+    parameters: MatchParameters,
+    seed: np.random.SeedSequence,
+    duration: float,
+    stage_path: Path,
+) -> MatchOutcome:
+    result = simulate(strategy, duration, stage_path, setup=parameters.apply)
+    deliveries, failed_grips = score_timeline(
+        result.events,
+        read_layout(stage_path),
+        parameters.grip_success,
+        np.random.default_rng(seed),
+    )
+    return MatchOutcome(
+        parameters=parameters,
+        deliveries=deliveries,
+        failed_grips=failed_grips,
+        finished=result.finished,
+        duration=result.duration,
+    )
+
+
+@dataclass
+class Evaluation:
+    """
+    1つの戦略のモンテカルロ評価の結果
+    Attributes:
+        name (str): 戦略の名前
+        nominal (MatchOutcome): 公称の性能で荷物を必ずつかめるときの結果
+        outcomes (list[MatchOutcome]): 性能をばらつかせた各試合の結果
+    """
+
+    name: str
+    nominal: MatchOutcome
+    outcomes: list[MatchOutcome]
+
+    @property
+    def scores(self) -> np.ndarray:
+        return np.array([outcome.score for outcome in self.outcomes])
+
+    def score_distribution(self) -> dict[int, float]:
+        """
+        得点ごとの割合
+        """
+        counts = np.bincount(self.scores)
+        return {
+            score: count / len(self.outcomes)
+            for score, count in enumerate(counts.tolist())
+            if count
+        }
+
+    def timing_percentiles(self) -> dict[str, np.ndarray]:
+        """
+        時間に関する値のパーセンタイル (PERCENTILESの順, 値の無い試合は除く)
+        first_delivery: 最初に荷物を届けた時刻 (s)
+        cycle: 続けて荷物を届けた間隔 (s)
+        finish: 戦略が試合時間内に終わった時刻 (s)
+        """
+        first = [o.deliveries[0][0] for o in self.outcomes if o.deliveries]
+        cycles = [
+            b - a
+            for o in self.outcomes
+            for (a, _), (b, _) in zip(o.deliveries, o.deliveries[1:])
+        ]
+        finish = [o.duration for o in self.outcomes if o.finished]
+        return {
+            name: np.percentile(values, PERCENTILES)
+            if values
+            else np.full(len(PERCENTILES), np.nan)
+            for name, values in [
+                ("first_delivery", first),
+                ("cycle", cycles),
+                ("finish", finish),
+            ]
+        }
+
+    def report(self) -> str:
+        """
+        結果を表にした文字列
+        """
+        scores = self.scores
+        lines = [
+            f"{self.name}: {len(scores)}試合, 得点 平均 {scores.mean():.2f} "
+            f"(標準偏差 {scores.std():.2f}, 最小 {scores.min()}, 最大 {scores.max()}), "
+            f"公称の性能なら {self.nominal.score}点",
+            "  得点の分布: "
+            + ", ".join(
+                f"{score}点 {ratio:.1%}"
+                for score, ratio in self.score_distribution().items()
+            ),
+            "  " + " " * 20 + "".join(f"{f'p{p:g}':>9}" for p in PERCENTILES),
+        ]
+        for name, values in self.timing_percentiles().items():
+            # 値の無い行 (時間内に終わらない戦略のfinishなど) は"-"にする
+            lines.append(
+                f"  {name + ' (s)':<20}"
+                + "".join(
+                    f"{v:9.2f}" if np.isfinite(v) else f"{'-':>9}" for v in values
+                )
+            )
+        return "\n".join(lines)
+
+
+def evaluate(
+    strategies: dict[str, Strategy],
+    matches: int = 1000,
+    perturbation: Perturbation | None = None,
+    duration: float = MATCH_DURATION,
+    stage_path: Path = STAGE_PATH,
+    workers: int | None = None,
+    seed: int = 0,
+) -> dict[str, Evaluation]:
+    """
+    性能をばらつかせた試合をシミュレーションし、戦略ごとの得点と時間の分布を求める
+    どの戦略も同じ性能の組 (共通乱数) で比べるので、少ない試合数でも差が分かりやすい
+    試合はProcessPoolExecutorで並列に実行する
+
+    Args:
+        strategies (dict[str, Strategy]): 名前ごとの戦略 (モジュールの関数など, pickleできるもの)
+        matches (int, optional): 戦略ごとの試合数. デフォルトは1000.
+        perturbation (Perturbation | None, optional): 性能のばらつき. デフォルトはNone (Perturbation()).
+        duration (float, optional): 試合時間 (s). デフォルトはMATCH_DURATION.
+        stage_path (Path, optional): ステージファイル. デフォルトはSTAGE_PATH.
+        workers (int | None, optional): プロセス数. デフォルトはNone (CPUの数).
+        seed (int, optional): 乱数の種. デフォルトは0.
+
+    Returns:
+        dict[str, Evaluation]: 戦略ごとの評価
+    """
+    perturbation = perturbation or Perturbation()
+    sequence = np.random.SeedSequence(seed)
+    parameters = perturbation.sample(np.random.default_rng(sequence), matches)
+    grip_seeds = sequence.spawn(matches)
+
+    # 公称の性能の試合をこのプロセスで先に動かし、経路表のキャッシュを作っておく
+    # (各プロセスが同時にキャッシュを書かないように)
+    nominal = {
+        name: _run_match(
+            strategy,
+            perturbation.nominal,
+            np.random.SeedSequence(seed),
+            duration,
+            stage_path,
+        )
+        for name, strategy in strategies.items()
+    }
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(workers) as executor:
+        results = {
+            name: executor.map(
+                _run_match,
+                [strategy] * matches,
+                parameters,
+                grip_seeds,
+                [duration] * matches,
+                [stage_path] * matches,
+                chunksize=max(matches // (4 * workers), 1),
+            )
+            for name, strategy in strategies.items()
+        }
+        return {
+            name: Evaluation(name, nominal[name], list(outcomes))
+            for name, outcomes in results.items()
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="性能をばらつかせた試合をシミュレーションして戦略を比べる"
+    )
+    parser.add_argument(
+        "--strategy",
+        action="append",
+        choices=list(STRATEGIES),
+        help="比べる戦略 (mainの関数名, 複数指定できる). デフォルトは全て",
+    )
+    parser.add_argument("--matches", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--duration", type=float, default=MATCH_DURATION)
+    parser.add_argument("--stage", type=Path, default=STAGE_PATH)
+    args = parser.parse_args()
+
+    evaluations = evaluate(
+        {name: STRATEGIES[name] for name in args.strategy or STRATEGIES},
+        matches=args.matches,
+        duration=args.duration,
+        stage_path=args.stage,
+        workers=args.workers,
+        seed=args.seed,
+    )
+    for evaluation in evaluations.values():
+        print(evaluation.report())
+
+
+if __name__ == "__main__":
+    main()
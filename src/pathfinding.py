@@ -1,52 +1,113 @@
-from itertools import pairwise
+import heapq
 
+import numpy as np
+import shapely
 from matplotlib import pyplot as plt
 from matplotlib.axes import Axes
-from shapely import LineString, Point, Polygon, unary_union
+from shapely import (
+    LineString,
+    MultiPolygon,
+    Point,
+    Polygon,
+    box,
+    unary_union,
+)
+from shapely.ops import nearest_points
 from shapely.plotting import patch_from_polygon
 
-from stage import Stage, Wall
-from visualize import Visualizable
+from stage import Stage
+from visualize import Layer, Visualizable
+
+# 経路の頂点を障害物の形状からさらに離す距離 (mm)
+NODE_CLEARANCE: float = 5
+# 頂点を間引くときの許容誤差 (mm)
+# 間引いた辺は元の境界からこの距離までしかずれないので、NODE_CLEARANCEより小さくして
+# 隣り合う頂点を結ぶ辺が障害物の形状に食い込まない (互いに見通せる) ようにする
+NODE_TOLERANCE: float = NODE_CLEARANCE / 2
+
+# 自由空間グラフ: 頂点の座標 (N, 2) と辺の両端の頂点番号 (E, 2)
+Graph = tuple[np.ndarray, np.ndarray]
 
 
 class PathPlanner(Visualizable):
     """
     経路計画を管理するクラス
+    障害物を膨張させた形状の周りに頂点を置き、互いに見通せる頂点を結んだ
+    自由空間グラフを初期化時に作っておき、経路はその上をA*で探索する
+    見通しの判定は、境界の線分に空間インデックスを持つPrepared Geometryでまとめて行う
     Attributes:
-        shape (Polygon): 障害物の形状
+        shape (Polygon | MultiPolygon): 障害物の形状 (ロボットの中心が入れない領域)
+        graph (Graph): 自由空間グラフ
     """
 
-    shape: Polygon = Polygon()
+    layer = Layer.PLANNER
+
+    shape: Polygon | MultiPolygon = Polygon()
+    graph: Graph
 
-    __wall: Wall
     __expansion_radius: float
+    __free: Polygon | MultiPolygon
+    __neighbors: list[list[tuple[int, float]]]
 
-    def __init__(self, stage: Stage, safe_margin: float = 10):
-        self.__wall = stage.wall
+    def __init__(
+        self,
+        stage: Stage,
+        safe_margin: float = 10,
+        shape: Polygon | MultiPolygon | None = None,
+        graph: Graph | None = None,
+    ):
+        """
+        Args:
+            stage (Stage): 経路を計画するステージ
+            safe_margin (float, optional): ロボットの半径に加えて障害物から離す距離 (mm). デフォルトは10.
+            shape (Polygon | MultiPolygon | None, optional): 計算済みの障害物の形状 (stage_loaderのキャッシュなど). Noneならステージから計算する.
+            graph (Graph | None, optional): 計算済みの自由空間グラフ. Noneなら形状から計算する.
+        """
         self.__expansion_radius = stage.robot.radius + safe_margin
 
-        outer_frame = LineString(
-            [
-                (0, 0),
-                (stage.x_size, 0),
-                (stage.x_size, stage.y_size),
-                (0, stage.y_size),
-                (0, 0),
+        if shape is None:
+            outer_frame = LineString(
+                [
+                    (0, 0),
+                    (stage.x_size, 0),
+                    (stage.x_size, stage.y_size),
+                    (0, stage.y_size),
+                    (0, 0),
+                ]
+            )
+            wall_shapes = [
+                LineString(segment)
+                for wall in stage.walls
+                for segment in wall.segments()
+            ]
+            obstacle_shapes = [
+                Polygon(obstacle.vertices) for obstacle in stage.obstacles
             ]
-        )
-        wall_shapes = [
-            LineString([(stage.wall.x, ys), (stage.wall.x, ye)])
-            for ys, ye in stage.wall.obstacled_y
-        ]
 
-        buffered_obstacles = [
-            obstacle.buffer(self.__expansion_radius)
-            for obstacle in wall_shapes + [outer_frame]
-        ]
-        merged_obstacles = unary_union(buffered_obstacles)
+            buffered_obstacles = [
+                obstacle.buffer(self.__expansion_radius)
+                for obstacle in wall_shapes + obstacle_shapes + [outer_frame]
+            ]
+            merged_obstacles = unary_union(buffered_obstacles)
+            if isinstance(merged_obstacles, (Polygon, MultiPolygon)):
+                shape = merged_obstacles
+            else:
+                shape = Polygon()
+        self.shape = shape
+        shapely.prepare(self.shape)
 
-        if isinstance(merged_obstacles, Polygon):
-            self.shape = merged_obstacles
+        self.__free = box(0, 0, stage.x_size, stage.y_size).difference(shape)
+        shapely.prepare(self.__free)
+
+        self.graph = self.__build_graph() if graph is None else graph
+        nodes, edge_indices = self.graph
+        lengths = np.linalg.norm(
+            nodes[edge_indices[:, 0]] - nodes[edge_indices[:, 1]], axis=1
+        )
+        self.__neighbors = [[] for _ in range(len(nodes))]
+        for (a, b), length in zip(edge_indices.tolist(), lengths.tolist()):
+            self.__neighbors[a].append((b, length))
+            self.__neighbors[b].append((a, length))
 
     def plan_path(
         self, start: tuple[float, float], end: tuple[float, float]
@@ -60,30 +121,112 @@ class PathPlanner(Visualizable):
 
         Returns:
             list[tuple[float, float]]: 計画された経路の点のリスト
+
+        Raises:
+            ValueError: 開始点から終了点へ行けない場合
         """
-        sx, sy = self.__nearest_free_point(start)
-        ex, ey = self.__nearest_free_point(end)
+        start = self.__nearest_free_point(start)
+        end = self.__nearest_free_point(end)
+        if start == end or self.__visible(np.array([start]), np.array([end]))[0]:
+            return [start, end]
 
-        path = [(sx, sy)]
+        nodes, _ = self.graph
+        count = len(nodes)
+        from_start = np.flatnonzero(self.__visible(np.array([start]), nodes))
+        to_end = np.flatnonzero(self.__visible(nodes, np.array([end])))
+        goal = np.array(end)
+        # 開始点は頂点番号count, 終了点はcount + 1として探索する
+        end_distance = {
+            int(i): float(np.hypot(*(nodes[i] - goal))) for i in to_end.tolist()
+        }
+        heuristic = np.linalg.norm(nodes - goal, axis=1)
 
-        if min(sx, ex) < self.__wall.x < max(sx, ex):
-            free_y_area: list[tuple[float, float]] = []
-            for w1, w2 in pairwise(self.__wall.obstacled_y):
-                if w1[1] + self.__expansion_radius < w2[0] - self.__expansion_radius:
-                    free_y_area.append(
-                        (w1[1] + self.__expansion_radius, w2[0] - self.__expansion_radius)
-                    )
+        costs = {count: 0.0}
+        previous: dict[int, int] = {}
+        queue = [(float(np.hypot(start[0] - end[0], start[1] - end[1])), count)]
+        visited: set[int] = set()
+        while queue:
+            _, node = heapq.heappop(queue)
+            if node == count + 1:
+                break
+            if node in visited:
+                continue
+            visited.add(node)
 
-            free_y_mids = [(fs + fe) / 2 for fs, fe in free_y_area]
-            y_mid = min(free_y_mids, key=lambda y: abs((sy + ey) / 2 - y))
+            if node == count:
+                neighbors = [
+                    (int(i), float(np.hypot(*(nodes[i] - start))))
+                    for i in from_start.tolist()
+                ]
+            else:
+                neighbors = list(self.__neighbors[node])
+                if node in end_distance:
+                    neighbors.append((count + 1, end_distance[node]))
 
-            path.append((sx, y_mid))
-            path.append((ex, y_mid))
-        elif sx != ex and sy != ey:
-            path.append((ex, sy))
+            for neighbor, length in neighbors:
+                cost = costs[node] + length
+                if cost < costs.get(neighbor, np.inf):
+                    costs[neighbor] = cost
+                    previous[neighbor] = node
+                    estimate = 0.0 if neighbor == count + 1 else heuristic[neighbor]
+                    heapq.heappush(queue, (cost + float(estimate), neighbor))
+        else:
+            raise ValueError(f"{start}から{end}への経路が見つかりません")
 
-        path.append((ex, ey))
-        return path
+        path = [end]
+        node = previous[count + 1]
+        while node != count:
+            x, y = nodes[node]
+            path.append((float(x), float(y)))
+            node = previous[node]
+        path.append(start)
+        return path[::-1]
+
+    def __build_graph(self) -> Graph:
+        """
+        障害物の形状の少し外側に頂点を置き、見通せる頂点同士を結んだグラフを作る
+
+        Returns:
+            Graph: 自由空間グラフ
+        """
+        if self.shape.is_empty:
+            return np.empty((0, 2)), np.empty((0, 2), dtype=np.intp)
+        # 間引いた後の頂点は形状からNODE_CLEARANCE以上、辺もNODE_CLEARANCE - NODE_TOLERANCE以上離れている
+        offset = self.shape.buffer(NODE_CLEARANCE, quad_segs=4).simplify(NODE_TOLERANCE)
+        candidates = []
+        for ring in _rings(shapely.orient_polygons(offset)):
+            # 外周は反時計回り、穴は時計回りにそろえたので、障害物は常に左側にある
+            # 最短経路が曲がるのは障害物が凸になっている (左に曲がる) 頂点だけ
+            points = np.array(ring.coords[:-1])
+            before = points - np.roll(points, 1, axis=0)
+            after = np.roll(points, -1, axis=0) - points
+            convex = before[:, 0] * after[:, 1] - before[:, 1] * after[:, 0] > 0
+            candidates.append(points[convex])
+        candidates = np.concatenate(candidates).reshape(-1, 2)
+        nodes = candidates[
+            shapely.contains_xy(self.__free, candidates[:, 0], candidates[:, 1])
+        ]
+
+        a, b = np.triu_indices(len(nodes), k=1)
+        visible = self.__visible(nodes[a], nodes[b])
+        return nodes, np.stack([a[visible], b[visible]], axis=1)
+
+    def __visible(self, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+        """
+        各線分が障害物の形状と交わらないかをまとめて判定する
+
+        Args:
+            starts (np.ndarray): 線分の始点 (N, 2) (1点なら全ての線分で共有する)
+            ends (np.ndarray): 線分の終点 (N, 2) (1点なら全ての線分で共有する)
+
+        Returns:
+            np.ndarray: 見通せるかどうか (N,)
+        """
+        starts, ends = np.broadcast_arrays(starts, ends)
+        if not len(starts):
+            return np.zeros(0, dtype=bool)
+        lines = shapely.linestrings(np.stack([starts, ends], axis=1))
+        return ~shapely.intersects(lines, self.shape)
 
     def __nearest_free_point(self, point: tuple[float, float]) -> tuple[float, float]:
         """
@@ -95,14 +238,11 @@ class PathPlanner(Visualizable):
         Returns:
             tuple[float, float]: 最も近い障害物のない点 (x, y)
         """
-        if self.shape.is_empty:
+        if self.shape.is_empty or shapely.contains_xy(self.__free, *point):
             return point
-        p = Point(point)
-        if not self.shape.contains(p) or not self.shape.interiors:
-            return point
-        nearest = self.shape.interiors[0].interpolate(
-            self.shape.interiors[0].project(p)
-        )
+        # 境界ちょうどの点は形状と交わってしまうので、少し内側の点を探す
+        inner = self.__free.buffer(-NODE_CLEARANCE)
+        nearest, _ = nearest_points(inner, Point(point))
         return (nearest.x, nearest.y)
 
     def visualize(self, ax: Axes) -> None:
@@ -112,3 +252,16 @@ class PathPlanner(Visualizable):
                 self.shape, hatch="//", facecolor="gray", edgecolor="yellow", alpha=0.3
             )
         )
+
+
+def _rings(shape: Polygon | MultiPolygon) -> list[LineString]:
+    """
+    形状の外周と穴の境界線のリスト
+    """
+    polygons = shape.geoms if isinstance(shape, MultiPolygon) else [shape]
+    return [
+        ring
+        for polygon in polygons
+        if not polygon.is_empty
+        for ring in [polygon.exterior, *polygon.interiors]
+    ]
@@ -0,0 +1,216 @@
+import asyncio
+import multiprocessing as mp
+import warnings
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from robot import Robot
+from visualize import visualize
+
+# 共有する経路の最大点数のデフォルト
+MAX_PATH: int = 64
+
+# 状態ブロックのレイアウト (float64)
+_SEQ, _X, _Y, _ROTATION, _PATH_VERSION, _PATH_LENGTH = range(6)
+_HEADER = 6
+
+
+class SharedRobotState:
+    """
+    ロボットの姿勢と経路を共有メモリに置くための小さな状態ブロック
+    書き込み側はロックを取らず、シーケンス番号 (書き込み中は奇数) で
+    読み込み側が書き込み途中の値を読まないようにする
+    経路は最大点数までしか共有できないので、PathPlannerの経路を描くなら
+    max_pathを頂点の数 + 2 (len(planner.graph[0]) + 2) 以上にしておく
+    """
+
+    __memory: SharedMemory
+    __owner: bool
+    __data: np.ndarray
+    __max_path: int
+
+    __written_path: list[tuple[float, float]] | None
+    __read_version: float
+    __read_path: list[tuple[float, float]]
+
+    def __init__(self, name: str | None = None, max_path: int = MAX_PATH):
+        """
+        Args:
+            name (str | None, optional): 既存の共有メモリの名前. Noneなら新しく作る.
+            max_path (int, optional): 共有する経路の最大点数 (読み書きの両側で同じにする). デフォルトはMAX_PATH.
+        """
+        size = (_HEADER + max_path * 2) * 8
+        self.__owner = name is None
+        self.__memory = SharedMemory(name=name, create=self.__owner, size=size)
+        self.__data = np.ndarray(
+            (_HEADER + max_path * 2,), np.float64, self.__memory.buf
+        )
+        if self.__owner:
+            self.__data[:] = 0
+        self.__max_path = max_path
+        self.__written_path = None
+        self.__read_version = -1
+        self.__read_path = []
+
+    @property
+    def name(self) -> str:
+        return self.__memory.name
+
+    def write(self, robot: Robot) -> None:
+        """
+        ロボットの現在の姿勢と経路を書き込む (待つことはない)
+        経路が最大点数より長ければ、先頭から最大点数までを書き込んで警告する
+
+        Args:
+            robot (Robot): 書き込むロボット
+        """
+        data = self.__data
+        data[_SEQ] += 1
+        data[_X], data[_Y] = robot.position
+        data[_ROTATION] = robot.rotation
+        if robot.path is not self.__written_path:
+            path = robot.path[: self.__max_path]
+            if len(robot.path) > self.__max_path:
+                warnings.warn(
+                    f"経路の{len(robot.path)}点のうち先頭の{self.__max_path}点だけを描画します "
+                    "(max_pathを大きくしてください)",
+                    RuntimeWarning,
+                    stacklevel=2,
+                )
+            data[_HEADER : _HEADER + len(path) * 2] = np.ravel(path)
+            data[_PATH_LENGTH] = len(path)
+            data[_PATH_VERSION] += 1
+            self.__written_path = robot.path
+        data[_SEQ] += 1
+
+    def read_into(self, robot: Robot, retries: int = 10) -> bool:
+        """
+        共有メモリの状態をロボットに反映する
+        経路は更新されたときだけ新しいリストにする
+
+        Args:
+            robot (Robot): 反映先のロボット (描画プロセス側のコピー)
+            retries (int, optional): 書き込み中だった場合に読み直す回数. デフォルトは10.
+
+        Returns:
+            bool: 一貫した状態を読めたかどうか
+        """
+        data = self.__data
+        for _ in range(retries):
+            seq = data[_SEQ]
+            if seq % 2:
+                continue
+            x, y, rotation = data[_X], data[_Y], data[_ROTATION]
+            version, length = data[_PATH_VERSION], int(data[_PATH_LENGTH])
+            path = self.__read_path
+            if version != self.__read_version:
+                points = data[_HEADER : _HEADER + length * 2].reshape(-1, 2)
+                path = [(float(px), float(py)) for px, py in points]
+            if data[_SEQ] != seq:
+                continue
+
+            robot.position = (float(x), float(y))
+            robot.rotation = float(rotation)
+            if version != self.__read_version:
+                robot.path = path
+                self.__read_path = path
+                self.__read_version = version
+            return True
+        return False
+
+    def close(self) -> None:
+        del self.__data
+        self.__memory.close()
+        if self.__owner:
+            self.__memory.unlink()
+
+
+class RemoteVisualizer:
+    """
+    VISUALIZABLESのシーンを別プロセスで描画するクラス
+    制御側はrunで共有メモリにロボットの状態を書き込むだけで、描画を待つことはない
+    描画プロセスはforkで起動し、ステージなどの静的なオブジェクトは複製をそのまま使う
+    """
+
+    __robot: Robot
+    __frame_rate: int
+    __publish_rate: float
+    __max_path: int
+    __state: SharedRobotState | None
+    __process: mp.process.BaseProcess | None
+
+    def __init__(
+        self,
+        robot: Robot,
+        frame_rate: int = 30,
+        publish_rate: float = 60,
+        max_path: int = MAX_PATH,
+    ):
+        """
+        Args:
+            robot (Robot): 描画するロボット
+            frame_rate (int, optional): 描画のフレームレート (FPS). デフォルトは30.
+            publish_rate (float, optional): 状態を書き込む頻度 (Hz). デフォルトは60.
+            max_path (int, optional): 共有する経路の最大点数 (SharedRobotStateを参照). デフォルトはMAX_PATH.
+        """
+        self.__robot = robot
+        self.__frame_rate = frame_rate
+        self.__publish_rate = publish_rate
+        self.__max_path = max_path
+        self.__state = None
+        self.__process = None
+
+    def start(self) -> None:
+        """
+        描画プロセスを起動する
+        """
+        self.__state = SharedRobotState(max_path=self.__max_path)
+        self.__state.write(self.__robot)
+        self.__process = mp.get_context("fork").Process(
+            target=_render,
+            args=(
+                self.__robot,
+                self.__state.name,
+                self.__max_path,
+                self.__frame_rate,
+            ),
+            daemon=True,
+        )
+        self.__process.start()
+
+    async def run(self) -> None:
+        """
+        一定周期でロボットの状態を共有メモリに書き込み続ける非同期メソッド
+        """
+        if self.__process is None:
+            self.start()
+        try:
+            while self.__state is not None:
+                self.__state.write(self.__robot)
+                await asyncio.sleep(1 / self.__publish_rate)
+        finally:
+            self.stop()
+
+    def stop(self) -> None:
+        """
+        描画プロセスを終了し、共有メモリを解放する
+        """
+        if self.__process is not None:
+            self.__process.terminate()
+            self.__process.join()
+            self.__process = None
+        if self.__state is not None:
+            self.__state.close()
+            self.__state = None
+
+
+def _render(robot: Robot, state_name: str, max_path: int, frame_rate: int) -> None:
+    """
+    描画プロセス: 共有メモリの状態をロボットの複製に反映しながらシーンを描画する
+    """
+    state = SharedRobotState(state_name, max_path)
+    try:
+        visualize(frame_rate, before_update=lambda: state.read_into(robot))
+    finally:
+        state.close()
@@ -0,0 +1,219 @@
+import argparse
+import asyncio
+import multiprocessing as mp
+from pathlib import Path
+
+import cv2
+import numpy as np
+from matplotlib.axes import Axes
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.text import Text
+
+from main import STAGE_PATH, create_stage
+from robot import Robot
+from robot_parts.arm import ArmState
+from stage_loader import compile_stage, read_layout
+from telemetry import Telemetry, load_telemetry
+from visualize import VISUALIZABLES, Visualizable, render_background
+
+
+class _FrameRenderer:
+    """
+    1プロセス分の描画先: 背景を一度だけ描き、フレームごとにロボットだけを更新する
+    """
+
+    __telemetry: Telemetry
+    __robot: Robot
+    __dynamic: list[Visualizable]
+    __canvas: FigureCanvasAgg
+    __ax: Axes
+    __label: Text
+    __paths: dict[int, list[tuple[float, float]]]
+
+    def __init__(
+        self,
+        telemetry: Telemetry,
+        robot: Robot,
+        scene: list[Visualizable],
+        size: tuple[float, float],
+        dpi: float,
+    ):
+        self.__telemetry = telemetry
+        self.__robot = robot
+        self.__dynamic = [
+            visualizable for visualizable in scene if visualizable.dynamic
+        ]
+        figure = Figure(figsize=size, dpi=dpi)
+        self.__canvas = FigureCanvasAgg(figure)
+        self.__ax = figure.add_subplot()
+        render_background(
+            self.__ax,
+            [visualizable for visualizable in scene if not visualizable.dynamic],
+        )
+        for visualizable in self.__dynamic:
+            visualizable.visualize(self.__ax)
+            visualizable.init_animation(self.__ax)
+        self.__label = self.__ax.text(
+            0.01, 0.01, "", transform=self.__ax.transAxes, family="monospace"
+        )
+        self.__paths = {}
+
+    def render(self, time: float) -> np.ndarray:
+        """
+        指定した時刻のシーンを描画する
+
+        Args:
+            time (float): 記録開始からの時刻 (s)
+
+        Returns:
+            np.ndarray: 描画した画像 (height, width, 3) (BGR)
+        """
+        telemetry, robot = self.__telemetry, self.__robot
+        times = np.array([time])
+        sample = telemetry.samples[telemetry.sample_indices(times)[0]]
+        x, y, rotation = telemetry.poses(times)[0]
+        robot.position = (float(x), float(y))
+        robot.rotation = float(rotation)
+
+        path_id = int(sample["path_id"])
+        if path_id not in self.__paths:
+            points = telemetry.paths.get(path_id, np.empty((0, 2)))
+            self.__paths[path_id] = [(float(px), float(py)) for px, py in points]
+        robot.path = self.__paths[path_id]
+
+        arm = ArmState(int(sample["arm"]))
+        self.__label.set_text(
+            f"{time:7.2f}s  "
+            f"shoulders {'open ' if ArmState.SHOULDERS_OPEN in arm else 'close'}  "
+            f"hands {'grip' if ArmState.HANDS_GRIPPED in arm else 'release'}"
+        )
+        for visualizable in self.__dynamic:
+            visualizable.animate(self.__ax)
+
+        self.__canvas.draw()
+        return cv2.cvtColor(np.asarray(self.__canvas.buffer_rgba()), cv2.COLOR_RGBA2BGR)
+
+
+_renderer: _FrameRenderer | None = None
+
+
+def _init_worker(
+    telemetry: Telemetry,
+    robot: Robot,
+    scene: list[Visualizable],
+    size: tuple[float, float],
+    dpi: float,
+) -> None:
+    global _renderer
+    _renderer = _FrameRenderer(telemetry, robot, scene, size, dpi)
+
+
+def _render_frame(time: float) -> np.ndarray:
+    if _renderer is None:
+        raise RuntimeError("描画プロセスが初期化されていません")
+    return _renderer.render(time)
+
+
+def render_video(
+    telemetry: Telemetry,
+    robot: Robot,
+    output: Path,
+    frame_rate: int = 30,
+    workers: int | None = None,
+    size: tuple[float, float] = (12.8, 7.2),
+    dpi: float = 100,
+    scene: list[Visualizable] | None = None,
+) -> int:
+    """
+    テレメトリの記録を、Stage.visualizeやRobot.animateと同じ描画でMP4に書き出す
+    フレームはforkした複数のプロセスで並列に描画し、このプロセスで順に書き込む
+    描画するシーンは記録したときと同じステージ (とPathPlanner) をsceneで渡す
+
+    Args:
+        telemetry (Telemetry): 読み込んだ記録
+        robot (Robot): 記録の姿勢と経路を反映するロボット (VISUALIZABLESに登録済みのもの)
+        output (Path): 書き出し先 (.mp4)
+        frame_rate (int, optional): フレームレート (FPS). デフォルトは30.
+        workers (int | None, optional): 描画プロセスの数. デフォルトはNone (CPUの数).
+        size (tuple[float, float], optional): 画像サイズ (inch). デフォルトは(12.8, 7.2).
+        dpi (float, optional): 解像度. デフォルトは100.
+        scene (list[Visualizable] | None, optional): 描画するもの (レイヤー順, robotを含む). デフォルトはNone (VISUALIZABLESに登録済みの全て).
+
+    Returns:
+        int: 書き出したフレーム数
+    """
+    if scene is None:
+        scene = VISUALIZABLES.items()
+    times = np.arange(0, telemetry.duration + 1 / frame_rate, 1 / frame_rate)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    writer = None
+    try:
+        with mp.get_context("fork").Pool(
+            workers,
+            initializer=_init_worker,
+            initargs=(telemetry, robot, scene, size, dpi),
+        ) as pool:
+            for frame in pool.imap(_render_frame, times, chunksize=8):
+                if writer is None:
+                    height, width = frame.shape[:2]
+                    writer = cv2.VideoWriter(
+                        str(output),
+                        cv2.VideoWriter.fourcc(*"mp4v"),
+                        frame_rate,
+                        (width, height),
+                    )
+                writer.write(frame)
+    finally:
+        if writer is not None:
+            writer.release()
+    return len(times)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="TelemetryLogの記録から試合の動画を書き出す"
+    )
+    parser.add_argument("log", type=Path, help="TelemetryLogの記録")
+    parser.add_argument("output", type=Path, help="書き出し先 (.mp4)")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--dpi", type=float, default=100)
+    parser.add_argument(
+        "--stage", type=Path, default=STAGE_PATH, help="記録したときのステージファイル"
+    )
+    args = parser.parse_args()
+
+    async def render() -> int:
+        # Handの初期化にイベントループが要るため、ループの中でステージを作る
+        layout = read_layout(args.stage)
+        stage = create_stage(layout)
+        compiled = compile_stage(stage, layout.digest)
+        # Stage.visualizeと同じものに経路計画のグラフを重ねて描く
+        scene: list[Visualizable] = sorted(
+            [
+                stage,
+                *stage.walls,
+                *stage.obstacles,
+                *stage.ar_markers,
+                compiled.planner,
+                stage.robot,
+            ],
+            key=lambda visualizable: visualizable.layer,
+        )
+        return render_video(
+            load_telemetry(args.log),
+            stage.robot,
+            args.output,
+            frame_rate=args.fps,
+            workers=args.workers,
+            dpi=args.dpi,
+            scene=scene,
+        )
+
+    frames = asyncio.run(render())
+    print(f"{frames}フレームを書き出しました: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
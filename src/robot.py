@@ -1,14 +1,25 @@
 import asyncio
 from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Awaitable, Callable
 
 import numpy as np
 from matplotlib.artist import Artist
 from matplotlib.axes import Axes
-from matplotlib.patches import Circle
+from matplotlib.lines import Line2D
+from matplotlib.patches import Circle, FancyArrow
 
 from robot_parts.arm import Arm
 from robot_parts.driver import Driver
-from visualize import Visualizable
+from tracing import traced
+from visualize import Layer, Visualizable
+
+if TYPE_CHECKING:
+    from estimator import StateEstimator
+    from telemetry import TelemetrySink
+
+HEADING_TOLERANCE: float = np.radians(2)
+# 走行やアームの動作の後に待つ時間 (s)
+SETTLE_TIME: float = 0.1
 
 
 @dataclass
@@ -21,8 +32,14 @@ class Robot(Visualizable):
         radius (float): ロボットの半径
         driver (Driver): ロボットの運転を担当するDriverオブジェクト
         arm (Arm): ロボットのアームを担当するArmオブジェクト
+        settle_time (float): 走行やアームの動作の後に待つ時間 (s). デフォルトはSETTLE_TIME.
+        estimator (StateEstimator | None): 実行中の状態推定器 (無ければ推測航法)
+        telemetry (TelemetrySink | None): 状態を記録する先 (TelemetryLogなど)
     """
 
+    layer = Layer.ROBOT
+    dynamic = True
+
     position: tuple[float, float]
     rotation: float
 
@@ -31,16 +48,46 @@ class Robot(Visualizable):
     driver: Driver
     arm: Arm
 
+    settle_time: float = SETTLE_TIME
+
+    estimator: "StateEstimator | None" = field(init=False, default=None, repr=False)
+    telemetry: "TelemetrySink | None" = field(init=False, default=None, repr=False)
+
     __path: list[tuple[float, float]] = field(init=False, default_factory=list)
+    __drive_task: "asyncio.Task[None] | None" = field(
+        init=False, default=None, repr=False
+    )
+
+    __path_line: Line2D | None = field(init=False, default=None, repr=False)
+    __drawn_path: list[tuple[float, float]] | None = field(
+        init=False, default=None, repr=False
+    )
+    __body: Circle | None = field(init=False, default=None, repr=False)
+    __arrow: FancyArrow | None = field(init=False, default=None, repr=False)
+    __center_dot: Circle | None = field(init=False, default=None, repr=False)
+
+    @property
+    def path(self) -> list[tuple[float, float]]:
+        """
+        現在たどっている (最後に指定された) 経路
+        """
+        return self.__path
+
+    @path.setter
+    def path(self, path: list[tuple[float, float]]) -> None:
+        self.__path = path
 
+    @traced()
     async def drive(self, path: list[tuple[float, float]]) -> None:
         """
         指定された経路に沿ってロボットを運転する非同期メソッド
+        途中でキャンセルされても、推定器が無ければ止まった時点の姿勢に更新してから終わる
 
         Args:
             path (list[tuple[float, float]]): ロボットが辿る経路の座標リスト
         """
         self.__path = path
+        self.__record()
 
         for tx, ty in self.__path:
             cx, cy = self.position
@@ -50,75 +97,186 @@ class Robot(Visualizable):
             angle_diff = (np.arctan2(ty - cy, tx - cx) - self.rotation + np.pi) % (
                 2 * np.pi
             ) - np.pi
-            await self.driver.turn(angle_diff)
-            self.rotation = (self.rotation + angle_diff + np.pi) % (2 * np.pi) - np.pi
+            await self.__turn(angle_diff)
+            if self.estimator is not None:
+                # 推定した姿勢から向きのずれを直してから直進する
+                cx, cy = self.position
+                angle_diff = (np.arctan2(ty - cy, tx - cx) - self.rotation + np.pi) % (
+                    2 * np.pi
+                ) - np.pi
+                if abs(angle_diff) > HEADING_TOLERANCE:
+                    await self.__turn(angle_diff)
+
+            await self.__straight((cx, cy), (tx, ty))
+        await asyncio.sleep(self.settle_time)
+
+    async def __turn(self, angle: float) -> None:
+        """
+        その場で旋回し、推定器が無ければ旋回できた分だけ向きを更新する
+        (途中でキャンセルされても、止まった時点の向きになる)
+        """
+        try:
+            await self.driver.turn(angle)
+        finally:
+            if self.estimator is None:
+                turned = angle * self.driver.progress
+                self.rotation = float(
+                    (self.rotation + turned + np.pi) % (2 * np.pi) - np.pi
+                )
+                if self.driver.progress < 1:
+                    self.__record()
+
+    async def __straight(
+        self, start: tuple[float, float], end: tuple[float, float]
+    ) -> None:
+        """
+        startからendへ直進し、推定器が無ければ進めた分だけ位置を更新する
+        (途中でキャンセルされても、止まった時点の位置になる)
+        """
+        (sx, sy), (ex, ey) = start, end
+        try:
+            await self.driver.straight(np.hypot(ex - sx, ey - sy))
+        finally:
+            if self.estimator is None:
+                progress = self.driver.progress
+                if progress >= 1:
+                    self.position = end
+                else:
+                    self.position = (
+                        float(sx + (ex - sx) * progress),
+                        float(sy + (ey - sy) * progress),
+                    )
+            self.__record()
+
+    async def stop(self) -> None:
+        """
+        retargetで始めた走行を中断し、止まった位置と向きが姿勢に反映されるまで待つ
+        """
+        task = self.__drive_task
+        self.__drive_task = None
+        if task is None or task.done():
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            # 中断した走行ではなく、呼び出し側がキャンセルされた場合は伝える
+            current = asyncio.current_task()
+            if current is not None and current.cancelling():
+                raise
+
+    async def retarget(
+        self, plan: Callable[[tuple[float, float]], list[tuple[float, float]]]
+    ) -> "asyncio.Task[None]":
+        """
+        走行中なら今の区間の途中で止め、止まった位置から計画し直した経路で走行を始める
+        古い経路を最後までたどらずに、すぐに目標を切り替えられる
+
+        Args:
+            plan (Callable[[tuple[float, float]], list[tuple[float, float]]]): 現在位置から経路を計画する関数 (例: lambda start: planner.plan_path(start, goal))
 
-            position_diff = np.hypot(tx - cx, ty - cy)
-            await self.driver.straight(position_diff)
-            self.position = (tx, ty)
-        await asyncio.sleep(0.1)
+        Returns:
+            asyncio.Task[None]: 新しい走行のタスク (awaitすれば到着まで待てる)
+        """
+        await self.stop()
+        task = asyncio.get_running_loop().create_task(self.drive(plan(self.position)))
+        self.__drive_task = task
+        return task
 
+    @traced()
     async def pickup_parcel(self):
         """
         荷物をピックアップする非同期メソッド
+        (既にその状態にあるアームの部品は動かさず、待ちもしない)
         """
-        await self.arm.open_shoulders()
-        await asyncio.sleep(0.1)
-        await self.arm.grip_hands()
-        await asyncio.sleep(0.1)
-        await self.arm.close_shoulders()
-        await asyncio.sleep(0.1)
+        await self.__arm_step(self.arm.open_shoulders)
+        await self.__arm_step(self.arm.grip_hands)
+        await self.__arm_step(self.arm.close_shoulders)
 
+    @traced()
     async def release_parcel(self):
-        await self.arm.open_shoulders()
-        await asyncio.sleep(0.1)
-        await self.arm.release_hands()
-        await asyncio.sleep(0.1)
-        await self.arm.close_shoulders()
-        await asyncio.sleep(0.1)
+        await self.__arm_step(self.arm.open_shoulders)
+        await self.__arm_step(self.arm.release_hands)
+        await self.__arm_step(self.arm.close_shoulders)
 
-    def animate(self, ax: Axes) -> list[Artist]:
-        animated: list[Artist] = []
-
-        if self.__path:
-            path_xs, path_ys = zip(*self.__path)
-            path_line = ax.plot(
-                path_xs,
-                path_ys,
-                linestyle="--",
-                color="magenta",
-                linewidth=1,
-            )
-            animated.extend(path_line)
+    async def __arm_step(self, step: Callable[[], Awaitable[bool]]) -> None:
+        """
+        アームを1段階動かし、動いた場合だけ記録して揺れが収まるのを待つ
+        """
+        if await step():
+            self.__record()
+            await asyncio.sleep(self.settle_time)
 
-        x, y = self.position
-        rotation = self.rotation
+    def __record(self) -> None:
+        if self.telemetry is not None:
+            self.telemetry.record()
+
+    def init_animation(self, ax: Axes) -> list[Artist]:
+        if (
+            self.__path_line is not None
+            and self.__body is not None
+            and self.__arrow is not None
+            and self.__center_dot is not None
+        ):
+            return [self.__path_line, self.__body, self.__arrow, self.__center_dot]
+
+        # 経路
+        (self.__path_line,) = ax.plot(
+            [],
+            [],
+            linestyle="--",
+            color="magenta",
+            linewidth=1,
+        )
+        self.__drawn_path = None
         # ロボットの円
-        circle = Circle(
-            (x, y),
-            self.radius,
-            fill=True,
-            color="blue",
+        self.__body = ax.add_patch(
+            Circle(
+                self.position,
+                self.radius,
+                fill=True,
+                color="blue",
+            )
         )
-        animated.append(ax.add_patch(circle))
         # ロボットの向きを示す矢印
-        arrow_length = self.radius
-        arrow_dx = arrow_length * np.cos(rotation)
-        arrow_dy = arrow_length * np.sin(rotation)
-        arrow = ax.arrow(
-            x,
-            y,
-            arrow_dx,
-            arrow_dy,
+        self.__arrow = ax.arrow(
+            *self.position,
+            self.radius,
+            0,
             width=5,
             color="white",
         )
-        animated.append(ax.add_patch(arrow))
         # ロボットの中心点
-        center_dot = Circle(
-            (x, y),
-            self.radius * 0.1,
-            color="red",
+        self.__center_dot = ax.add_patch(
+            Circle(
+                self.position,
+                self.radius * 0.1,
+                color="red",
+            )
+        )
+        return self.animate(ax)
+
+    def animate(self, ax: Axes) -> list[Artist]:
+        if (
+            self.__path_line is None
+            or self.__body is None
+            or self.__arrow is None
+            or self.__center_dot is None
+        ):
+            return self.init_animation(ax)
+
+        if self.__path is not self.__drawn_path:
+            path_xs, path_ys = zip(*self.__path) if self.__path else ((), ())
+            self.__path_line.set_data(path_xs, path_ys)
+            self.__drawn_path = self.__path
+
+        x, y = self.position
+        self.__body.set_center((x, y))
+        self.__center_dot.set_center((x, y))
+        self.__arrow.set_data(
+            x=x,
+            y=y,
+            dx=self.radius * np.cos(self.rotation),
+            dy=self.radius * np.sin(self.rotation),
         )
-        animated.append(ax.add_patch(center_dot))
-        return animated
+        return [self.__path_line, self.__body, self.__arrow, self.__center_dot]
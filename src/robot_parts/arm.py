@@ -1,9 +1,16 @@
 import asyncio
-from dataclasses import dataclass
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from enum import IntFlag
 
 from gpio import PwmPin
+from instrumentation import pulse
+from tracing import traced
 
 FREQUENCY: int = 416
+# 肩と手を動かすパルスの長さ (s)
+SHOULDER_PULSE: float = (1 / FREQUENCY) * 400
+HAND_PULSE: float = 0.5
 
 
 class Shoulder:
@@ -13,13 +20,17 @@ class Shoulder:
 
     async def open(self):
         self.__open_pwm.set_dc(50)
-        await asyncio.sleep((1 / FREQUENCY) * 400)
-        self.__open_pwm.set_dc(0)
+        try:
+            await pulse("shoulder", SHOULDER_PULSE)
+        finally:
+            self.__open_pwm.set_dc(0)
 
     async def close(self):
         self.__close_pwm.set_dc(50)
-        await asyncio.sleep((1 / FREQUENCY) * 400)
-        self.__close_pwm.set_dc(0)
+        try:
+            await pulse("shoulder", SHOULDER_PULSE)
+        finally:
+            self.__close_pwm.set_dc(0)
 
 
 class Hand:
@@ -29,9 +40,7 @@ class Hand:
 
     __init_task: asyncio.Task
 
-    def __init__(
-        self, pin_num: int, release_angle: float, grip_angle: float
-    ) -> None:
+    def __init__(self, pin_num: int, release_angle: float, grip_angle: float) -> None:
         self.__pwm = PwmPin(pin_num, frequency=50)
         self.__release_angle = release_angle
         self.__grip_angle = grip_angle
@@ -39,8 +48,10 @@ class Hand:
 
     async def __set_angle(self, angle: float):
         self.__pwm.set_dc(2 + (angle / 18))
-        await asyncio.sleep(0.5)
-        self.__pwm.set_dc(0)
+        try:
+            await pulse("hand", HAND_PULSE)
+        finally:
+            self.__pwm.set_dc(0)
 
     async def release(self):
         await self.__init_task
@@ -51,21 +62,127 @@ class Hand:
         await self.__set_angle(self.__grip_angle)
 
 
+class ArmState(IntFlag):
+    """
+    アームの状態 (肩が閉じていて手を離している状態が0)
+    """
+
+    SHOULDERS_OPEN = 1
+    HANDS_GRIPPED = 2
+
+
 @dataclass
 class Arm:
+    """
+    左右の肩と手で荷物の持ち運びを担当するクラス
+    肩と手の状態を覚えておき、既にその状態にある部品は動かさない
+    起動直後や動作の途中でキャンセルされた部品は位置が分からないので、次の指令では必ず動かす
+    Attributes:
+        r_shoulder (Shoulder): 右肩
+        l_shoulder (Shoulder): 左肩
+        r_hand (Hand): 右手
+        l_hand (Hand): 左手
+        state (ArmState): 最後に完了した動作の後の状態
+    """
+
     r_shoulder: Shoulder
     l_shoulder: Shoulder
     r_hand: Hand
     l_hand: Hand
 
-    async def open_shoulders(self):
-        await asyncio.gather(self.r_shoulder.open(), self.l_shoulder.open())
-
-    async def close_shoulders(self):
-        await asyncio.gather(self.r_shoulder.close(), self.l_shoulder.close())
-
-    async def release_hands(self):
-        await asyncio.gather(self.r_hand.release(), self.l_hand.release())
-
-    async def grip_hands(self):
-        await asyncio.gather(self.r_hand.grip(), self.l_hand.grip())
+    state: ArmState = field(init=False, default=ArmState(0))
+    # 起動時の肩と手の位置は確かめていないので、どの部品も最初の指令では必ず動かす
+    __uncertain: ArmState = field(
+        init=False, default=ArmState.SHOULDERS_OPEN | ArmState.HANDS_GRIPPED
+    )
+
+    def needs(self, part: ArmState, target: ArmState) -> bool:
+        """
+        部品をtargetの状態にするために動かす必要があるかどうか
+
+        Args:
+            part (ArmState): 部品 (ArmState.SHOULDERS_OPEN または ArmState.HANDS_GRIPPED)
+            target (ArmState): 目標の状態
+        """
+        return part in self.__uncertain or (self.state ^ target) & part != 0
+
+    async def __move(
+        self,
+        part: ArmState,
+        target: ArmState,
+        motions: tuple[Callable[[], Awaitable[None]], ...],
+    ) -> bool:
+        """
+        部品を動かす必要があれば左右同時に動かす
+
+        Returns:
+            bool: 動かしたかどうか
+        """
+        if not self.needs(part, target):
+            return False
+        self.__uncertain |= part
+        await asyncio.gather(*(motion() for motion in motions))
+        self.__uncertain &= ~part
+        self.state = (self.state & ~part) | (target & part)
+        return True
+
+    @traced()
+    async def open_shoulders(self) -> bool:
+        return await self.__move(
+            ArmState.SHOULDERS_OPEN,
+            ArmState.SHOULDERS_OPEN,
+            (self.r_shoulder.open, self.l_shoulder.open),
+        )
+
+    @traced()
+    async def close_shoulders(self) -> bool:
+        return await self.__move(
+            ArmState.SHOULDERS_OPEN,
+            ArmState(0),
+            (self.r_shoulder.close, self.l_shoulder.close),
+        )
+
+    @traced()
+    async def release_hands(self) -> bool:
+        return await self.__move(
+            ArmState.HANDS_GRIPPED,
+            ArmState(0),
+            (self.r_hand.release, self.l_hand.release),
+        )
+
+    @traced()
+    async def grip_hands(self) -> bool:
+        return await self.__move(
+            ArmState.HANDS_GRIPPED,
+            ArmState.HANDS_GRIPPED,
+            (self.r_hand.grip, self.l_hand.grip),
+        )
+
+    @traced()
+    async def goto(self, state: ArmState) -> ArmState:
+        """
+        アームをstateの状態にする
+        動かす必要のある部品 (肩と手は別のアクチュエータ) だけを同時に動かすので、
+        肩と手の順番が関係ない場合 (初期状態に戻すときなど) に使う
+
+        Args:
+            state (ArmState): 目標の状態
+
+        Returns:
+            ArmState: 動かした部品
+        """
+        moves: dict[ArmState, Callable[[], Awaitable[bool]]] = {}
+        if self.needs(ArmState.SHOULDERS_OPEN, state):
+            moves[ArmState.SHOULDERS_OPEN] = (
+                self.open_shoulders
+                if ArmState.SHOULDERS_OPEN in state
+                else self.close_shoulders
+            )
+        if self.needs(ArmState.HANDS_GRIPPED, state):
+            moves[ArmState.HANDS_GRIPPED] = (
+                self.grip_hands
+                if ArmState.HANDS_GRIPPED in state
+                else self.release_hands
+            )
+        moved = await asyncio.gather(*(move() for move in moves.values()))
+        return ArmState(sum(part for part, done in zip(moves, moved) if done))
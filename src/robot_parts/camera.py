@@ -1,11 +1,34 @@
+import os
+from pathlib import Path
+from typing import Callable, Literal
+
 import cv2
 import cv2.aruco as aruco
 import numpy as np
-from picamera2 import Picamera2
+
+from vision.calibration import CALIBRATION_PATH, Calibration
+from vision.pose import MarkerPoses, estimate_poses
+from vision.pyramid import PyramidDetector
+from vision.recording import FrameRecorder, Pose, ReplaySource
+from vision.source import CaptureFormat, FrameSource, open_picamera, to_gray
+from vision.tracking import ARTracker
+from vision.tuner import detector_parameters, load_detector_parameters
 
 CAMERA_MATRIX = np.array([[600, 0, 320], [0, 600, 240], [0, 0, 1]], dtype=float)
 DIST_COEFFS = np.zeros((5, 1))
 
+FRAME_SIZE = (640, 480)
+
+# 校正ファイルがあれば概算値の代わりに使い、歪み補正テーブルを事前に作っておく
+UNDISTORT_MAPS: tuple[np.ndarray, np.ndarray] | None = None
+if CALIBRATION_PATH.exists():
+    _calibration = Calibration.load(CALIBRATION_PATH, FRAME_SIZE)
+    CAMERA_MATRIX, DIST_COEFFS = _calibration.camera_matrix, _calibration.dist_coeffs
+    _map1, _map2, RECTIFIED_CAMERA_MATRIX = _calibration.undistort_maps()
+    UNDISTORT_MAPS = (_map1, _map2)
+else:
+    RECTIFIED_CAMERA_MATRIX = CAMERA_MATRIX
+
 MARKER_SIZE = 0.125
 MARKER_POINTS = np.array(
     [
@@ -17,28 +40,151 @@ MARKER_POINTS = np.array(
     dtype=np.float32,
 )
 
+# チューナーが書き出した設定があればそれを、無ければ既定値を使う
 DETECTOR = aruco.ArucoDetector(
-    aruco.getPredefinedDictionary(aruco.DICT_4X4_50), aruco.DetectorParameters()
+    aruco.getPredefinedDictionary(aruco.DICT_4X4_50),
+    detector_parameters(load_detector_parameters()),
 )
+TRACKER = ARTracker(DETECTOR, CAMERA_MATRIX, MARKER_SIZE)
+PYRAMID = PyramidDetector(DETECTOR)
 
-CAMERA = Picamera2()
-CAMERA.configure(
-    CAMERA.create_preview_configuration(main={"size": (640, 480), "format": "RGB888"})
-)
+# "YUV420"では輝度(Y)平面をそのままグレースケール画像として使う
+CAPTURE_FORMAT: CaptureFormat = "YUV420"
+
+# 環境変数ROBOCON_REPLAYに記録ファイルを指定すると、カメラの代わりにそれを再生する
+REPLAY_PATH = os.environ.get("ROBOCON_REPLAY")
+
+CAMERA: FrameSource
+if REPLAY_PATH:
+    CAMERA = ReplaySource(Path(REPLAY_PATH))
+else:
+    CAMERA = open_picamera(FRAME_SIZE, CAPTURE_FORMAT)
 CAMERA.start()
 
-def detect_ar() -> list[tuple[float, float, int]] | None:
+# グレースケール変換が必要な場合に使い回す変換先
+_gray_buffer = np.empty((FRAME_SIZE[1], FRAME_SIZE[0]), dtype=np.uint8)
+
+
+def _no_pose() -> Pose | None:
+    return None
+
+
+_recorder: FrameRecorder | None = None
+_recording_pose: Callable[[], Pose | None] = _no_pose
+
+
+def start_recording(
+    path: Path,
+    pose: Callable[[], Pose | None] = _no_pose,
+    capacity: int = 1000,
+) -> None:
+    """
+    以降に撮影したフレームをファイルに記録する
+
+    Args:
+        path (Path): 記録先
+        pose (Callable[[], Pose | None], optional): 撮影時のロボットの姿勢を返す関数. デフォルトは不明.
+        capacity (int, optional): 記録できる最大フレーム数. デフォルトは1000.
+    """
+    global _recorder, _recording_pose
+    stop_recording()
+    _recorder = FrameRecorder(path, capacity)
+    _recording_pose = pose
+
+
+def stop_recording() -> None:
+    """
+    フレームの記録を終了する
+    """
+    global _recorder
+    if _recorder is not None:
+        _recorder.close()
+        _recorder = None
+
+
+def capture() -> np.ndarray:
+    """
+    カメラから1フレームを取得する (記録中ならファイルにも書き出す)
+
+    Returns:
+        np.ndarray: CAPTURE_FORMATの形式のフレーム
+    """
     frame = CAMERA.capture_array()
-    gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
-    corners, marker_ids, _ = DETECTOR.detectMarkers(gray)
+    if _recorder is not None:
+        _recorder.record(frame, _recording_pose())
+    return frame
+
+
+def capture_gray() -> np.ndarray:
+    """
+    カメラから1フレームをグレースケールで取得する
+    YUV420ではY平面のビューを返すため変換もコピーも発生しない
+    RGBの場合は使い回しのバッファに変換するので、次の呼び出しで上書きされる
+
+    Returns:
+        np.ndarray: グレースケール画像
+    """
+    return to_gray(capture(), FRAME_SIZE, _gray_buffer)
+
+
+DetectMode = Literal["full", "tracking", "pyramid"]
 
-    if marker_ids is None:
-        return
 
-    result: list[tuple[float, float, int]] = []
-    for corner, marker_id in zip(corners, marker_ids):
-        success, _, tvec = cv2.solvePnP(MARKER_POINTS, corner, CAMERA_MATRIX, DIST_COEFFS)
-        if success:
-            result.append((tvec[0][0] * 1000, tvec[2][0] * 1000, marker_id[0]))
+def detect_poses(
+    mode: DetectMode = "full",
+    forward: float = 0,
+    yaw: float = 0,
+    undistort: Literal["corners", "frame"] = "corners",
+) -> MarkerPoses:
+    """
+    カメラ画像からARマーカーを検出し、全マーカーの姿勢を一括で推定する
+
+    Args:
+        mode (DetectMode, optional): 検出方法. "tracking"では前フレームの結果の周辺だけを、"pyramid"では縮小画像を検出する. デフォルトは"full".
+        forward (float, optional): 前回の呼び出しからの前進量 (mm, trackingのみ). デフォルトは0.
+        yaw (float, optional): 前回の呼び出しからの回転量 (rad, trackingのみ). デフォルトは0.
+        undistort (Literal["corners", "frame"], optional): 歪み補正の対象. "corners"では検出した四隅だけを、"frame"では画像全体をremapで補正する. デフォルトは"corners".
+
+    Returns:
+        MarkerPoses: 検出したマーカーの姿勢
+    """
+    gray = capture_gray()
+    camera_matrix, dist_coeffs = CAMERA_MATRIX, DIST_COEFFS
+    if undistort == "frame" and UNDISTORT_MAPS is not None:
+        gray = cv2.remap(gray, *UNDISTORT_MAPS, cv2.INTER_LINEAR)
+        camera_matrix, dist_coeffs = RECTIFIED_CAMERA_MATRIX, None
+    if mode == "tracking":
+        corners, marker_ids = TRACKER.detect(gray, forward, yaw)
+    elif mode == "pyramid":
+        corners, marker_ids = PYRAMID.detect(gray)
+    else:
+        corners, marker_ids, _ = DETECTOR.detectMarkers(gray)
+
+    return estimate_poses(corners, marker_ids, camera_matrix, dist_coeffs, MARKER_SIZE)
+
+
+def detect_ar(
+    mode: DetectMode = "full", forward: float = 0, yaw: float = 0
+) -> list[tuple[float, float, int]] | None:
+    """
+    カメラ画像からARマーカーを検出し、カメラから見た相対位置を返す
+
+    Args:
+        mode (DetectMode, optional): 検出方法 (detect_posesを参照). デフォルトは"full".
+        forward (float, optional): 前回の呼び出しからの前進量 (mm, trackingのみ). デフォルトは0.
+        yaw (float, optional): 前回の呼び出しからの回転量 (rad, trackingのみ). デフォルトは0.
+
+    Returns:
+        list[tuple[float, float, int]] | None: (dx, dy, id) のリスト (mm). 検出できなければNone
+    """
+    poses = detect_poses(mode, forward, yaw)
+    if not len(poses):
+        return
 
-    return result
+    return list(
+        zip(
+            poses.positions[:, 0].tolist(),
+            poses.positions[:, 2].tolist(),
+            poses.ids.tolist(),
+        )
+    )
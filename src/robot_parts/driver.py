@@ -1,13 +1,21 @@
 import asyncio
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
 
 import numpy as np
 
 from gpio import GPIO, DigitalPin, PwmPin
+from instrumentation import pulse
+from tracing import traced
+
+if TYPE_CHECKING:
+    from telemetry import TelemetrySink
 
 DC: float = 50
 MM_PER_SEC: float = (170 / 3) * 10
 RAD_PER_SEC: float = np.radians(680 / 5)
+# 動作の後に車体が落ち着くまで待つ時間 (s)
+SETTLE_TIME: float = 0.3
 
 
 class Wheel:
@@ -32,30 +40,86 @@ class Wheel:
         self.__direction.set_state(GPIO.HIGH if direction else GPIO.LOW)
         self.__start_stop.set_state(GPIO.LOW)
         try:
-            await asyncio.sleep(duration)
+            await pulse("wheel", duration)
         finally:
             self.__start_stop.set_state(GPIO.HIGH)
 
 
 @dataclass
 class Driver:
+    """
+    左右の車輪で走行を担当するクラス
+    Attributes:
+        r_wheel (Wheel): 右車輪
+        l_wheel (Wheel): 左車輪
+        mm_per_sec (float): 並進の速さ (mm/s). デフォルトはMM_PER_SEC.
+        rad_per_sec (float): 旋回の速さ (rad/s). デフォルトはRAD_PER_SEC.
+        settle_time (float): 動作の後に待つ時間 (s). デフォルトはSETTLE_TIME.
+        linear_velocity (float): 指令中の並進速度 (mm/s, 前進が正)
+        angular_velocity (float): 指令中の角速度 (rad/s, 反時計回りが正)
+        progress (float): 直近の指令で車輪を動かせた割合 (0 to 1, 中断されたら途中までの割合)
+        telemetry (TelemetrySink | None): 指令を記録する先 (TelemetryLogなど)
+    """
+
     r_wheel: Wheel
     l_wheel: Wheel
 
+    mm_per_sec: float = MM_PER_SEC
+    rad_per_sec: float = RAD_PER_SEC
+    settle_time: float = SETTLE_TIME
+
+    linear_velocity: float = field(init=False, default=0)
+    angular_velocity: float = field(init=False, default=0)
+    progress: float = field(init=False, default=1)
+
+    telemetry: "TelemetrySink | None" = field(init=False, default=None, repr=False)
+
+    @traced()
     async def straight(self, distance: float):
-        duration = abs(distance) / MM_PER_SEC
+        duration = abs(distance) / self.mm_per_sec
         is_back = distance < 0
-        await asyncio.gather(
-            self.r_wheel.run(not is_back, duration),
-            self.l_wheel.run(is_back, duration),
-        )
-        await asyncio.sleep(0.3)
+        self.linear_velocity = -self.mm_per_sec if is_back else self.mm_per_sec
+        if self.telemetry is not None:
+            self.telemetry.record(
+                linear_velocity=self.linear_velocity, duration=duration
+            )
+        try:
+            await self.__move(not is_back, is_back, duration)
+        finally:
+            self.linear_velocity = 0
+        await asyncio.sleep(self.settle_time)
 
+    @traced()
     async def turn(self, angle: float):
-        duration = abs(angle) / RAD_PER_SEC
+        duration = abs(angle) / self.rad_per_sec
         is_right = angle < 0
-        await asyncio.gather(
-            self.r_wheel.run(is_right, duration),
-            self.l_wheel.run(is_right, duration),
-        )
-        await asyncio.sleep(0.3)
+        self.angular_velocity = -self.rad_per_sec if is_right else self.rad_per_sec
+        if self.telemetry is not None:
+            self.telemetry.record(
+                angular_velocity=self.angular_velocity, duration=duration
+            )
+        try:
+            await self.__move(is_right, is_right, duration)
+        finally:
+            self.angular_velocity = 0
+        await asyncio.sleep(self.settle_time)
+
+    async def __move(self, r_direction: bool, l_direction: bool, duration: float):
+        """
+        両輪をduration秒動かす
+        キャンセルなどで中断されたら、車輪は各Wheel.runのfinallyで止まり、
+        それまでに動けた時間の割合をprogressに残す
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        self.progress = 0
+        try:
+            await asyncio.gather(
+                self.r_wheel.run(r_direction, duration),
+                self.l_wheel.run(l_direction, duration),
+            )
+        except BaseException:
+            elapsed = loop.time() - start
+            self.progress = min(elapsed / duration, 1) if duration > 0 else 1
+            raise
+        self.progress = 1
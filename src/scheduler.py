@@ -0,0 +1,338 @@
+import asyncio
+from collections import deque
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import Literal
+
+import numpy as np
+
+import tracing
+from robot import Robot
+from robot_parts.arm import HAND_PULSE, SHOULDER_PULSE, ArmState
+from stage import Stage
+from stage_loader import CompiledStage, Route
+
+# 試合時間 (s)
+MATCH_DURATION: float = 180
+# 予測に加えて残しておく時間 (s)
+SAFETY_MARGIN: float = 1.0
+# 予測の補正に使う、実際の時間と予測の比のパーセンタイル
+STATS_PERCENTILE: float = 90
+# 補正に使う直近の記録の数と、補正を始める記録の数
+STATS_WINDOW: int = 20
+STATS_MIN_SAMPLES: int = 3
+
+ActionKind = Literal["drive", "pickup", "release"]
+
+
+def predict_drive(robot: Robot, path: Route, rotation: float) -> tuple[float, float]:
+    """
+    Robot.driveで経路をたどるのにかかる時間を、Driverの速さと待ち時間から予測する
+
+    Args:
+        robot (Robot): 走行するロボット
+        path (Route): 経路 (先頭が走行を始める位置)
+        rotation (float): 走行を始めるときの向き (rad)
+
+    Returns:
+        tuple[float, float]: 予測した時間 (s) と、走行を終えたときの向き (rad)
+    """
+    driver = robot.driver
+    duration = robot.settle_time
+    for (cx, cy), (tx, ty) in zip(path, path[1:]):
+        if tx == cx and ty == cy:
+            continue
+        heading = float(np.arctan2(ty - cy, tx - cx))
+        angle = (heading - rotation + np.pi) % (2 * np.pi) - np.pi
+        duration += abs(angle) / driver.rad_per_sec + driver.settle_time
+        duration += np.hypot(tx - cx, ty - cy) / driver.mm_per_sec + driver.settle_time
+        rotation = heading
+    return float(duration), rotation
+
+
+def predict_arm(
+    robot: Robot, hands: ArmState, state: ArmState | None = None
+) -> tuple[float, ArmState]:
+    """
+    pickup_parcelまたはrelease_parcel (肩を開く, 手を動かす, 肩を閉じる) にかかる時間を、
+    アームの状態から予測する (既にその状態にある部品は動かさず、待ちもしない)
+
+    Args:
+        robot (Robot): 動かすロボット
+        hands (ArmState): 手の目標の状態 (pickup_parcelならHANDS_GRIPPED, release_parcelなら0)
+        state (ArmState | None, optional): 動作を始めるときのアームの状態. デフォルトはNone (今のArmの状態. 位置が不確かな部品は動かすとみなす).
+
+    Returns:
+        tuple[float, ArmState]: 予測した時間 (s) と、動作を終えたときのアームの状態
+    """
+    arm = robot.arm
+    pulses = {
+        ArmState.SHOULDERS_OPEN: SHOULDER_PULSE,
+        ArmState.HANDS_GRIPPED: HAND_PULSE,
+    }
+    current = arm.state if state is None else state
+    commanded = ArmState(0)
+    duration = 0.0
+    for part, target in (
+        (ArmState.SHOULDERS_OPEN, ArmState.SHOULDERS_OPEN),
+        (ArmState.HANDS_GRIPPED, hands),
+        (ArmState.SHOULDERS_OPEN, ArmState(0)),
+    ):
+        # 一度指令した部品の位置は分かっているので、予測した状態だけで決まる
+        if state is None and part not in commanded:
+            moves = arm.needs(part, target)
+        else:
+            moves = (current ^ target) & part != 0
+        if moves:
+            duration += pulses[part] + robot.settle_time
+        commanded |= part
+        current = (current & ~part) | (target & part)
+    return duration, current
+
+
+@dataclass
+class ActionStats:
+    """
+    動作の種類ごとの、実際にかかった時間と予測の比の記録
+    Attributes:
+        ratios (dict[ActionKind, deque[float]]): 直近の比 (実際 / 予測)
+    """
+
+    ratios: dict[ActionKind, deque[float]] = field(default_factory=dict)
+
+    def record(self, kind: ActionKind, predicted: float, actual: float) -> None:
+        if predicted <= 0:
+            return
+        ratios = self.ratios.setdefault(kind, deque(maxlen=STATS_WINDOW))
+        ratios.append(actual / predicted)
+
+    def factor(self, kind: ActionKind) -> float:
+        """
+        予測に掛ける補正 (記録が少ないうちは1, 予測より速い場合も1)
+        """
+        ratios = self.ratios.get(kind)
+        if ratios is None or len(ratios) < STATS_MIN_SAMPLES:
+            return 1.0
+        return max(float(np.percentile(ratios, STATS_PERCENTILE)), 1.0)
+
+
+@dataclass
+class ScheduledAction:
+    """
+    予測した時間付きの動作
+    Attributes:
+        kind (ActionKind): 動作の種類
+        label (str): 表示用の名前
+        predicted (float): 予測した時間 (s)
+        run (Callable[[], Awaitable[None]]): 動作を実行する関数
+    """
+
+    kind: ActionKind
+    label: str
+    predicted: float
+    run: Callable[[], Awaitable[None]]
+
+
+class MatchScheduler:
+    """
+    試合の終了時刻と各動作の予測時間から、時間内に終わる動作だけを実行する戦略層
+    荷物をつかむのは、つかんでからゴールで離すまでが時間内に収まる場合だけなので、
+    荷物を持っている間は常に最後に得点する動作の時間が残っている
+    予測はDriverとArmの設定から計算し、実際にかかった時間の記録で補正する
+    Attributes:
+        deadline (float): 試合の終了時刻 (イベントループの時刻)
+        stats (ActionStats): 動作ごとの時間の記録
+        history (list[tuple[float, str, float, float]]): 実行した動作の (開始時刻, 名前, 予測, 実際)
+    """
+
+    deadline: float
+    stats: ActionStats
+    history: list[tuple[float, str, float, float]]
+
+    __stage: Stage
+    __compiled: CompiledStage
+    __margin: float
+
+    def __init__(
+        self,
+        stage: Stage,
+        compiled: CompiledStage,
+        deadline: float,
+        margin: float = SAFETY_MARGIN,
+        stats: ActionStats | None = None,
+    ):
+        """
+        Args:
+            stage (Stage): ステージ (ロボットを含む)
+            compiled (CompiledStage): 経路計画用のデータ
+            deadline (float): 試合の終了時刻 (イベントループの時刻)
+            margin (float, optional): 予測に加えて残しておく時間 (s). デフォルトはSAFETY_MARGIN.
+            stats (ActionStats | None, optional): 以前の試合から引き継ぐ時間の記録. デフォルトはNone (空).
+        """
+        self.deadline = deadline
+        self.stats = stats or ActionStats()
+        self.history = []
+        self.__stage = stage
+        self.__compiled = compiled
+        self.__margin = margin
+
+    @property
+    def remaining(self) -> float:
+        """
+        試合の残り時間 (s)
+        """
+        return self.deadline - asyncio.get_running_loop().time()
+
+    def budget(self, actions: list[ScheduledAction]) -> float:
+        """
+        動作を全て終えるのに見込む時間 (補正した予測の和と余裕) (s)
+        """
+        return (
+            sum(a.predicted * self.stats.factor(a.kind) for a in actions)
+            + self.__margin
+        )
+
+    def fits(self, actions: list[ScheduledAction]) -> bool:
+        """
+        動作を全て試合時間内に終えられる見込みがあるかどうか
+        """
+        return self.budget(actions) <= self.remaining
+
+    async def execute(self, actions: list[ScheduledAction]) -> bool:
+        """
+        動作を順に実行する
+        各動作の前に残りの動作が時間内に終わる見込みを確かめ、見込みが無ければそこでやめる
+        ただし荷物をつかんだ後は、得点するために最後まで実行する
+
+        Returns:
+            bool: 全て実行したかどうか
+        """
+        loop = asyncio.get_running_loop()
+        committed = False
+        for i, action in enumerate(actions):
+            if not committed and not self.fits(actions[i:]):
+                return False
+            committed |= action.kind == "pickup"
+            start = loop.time()
+            with tracing.span(action.label, predicted=action.predicted):
+                await action.run()
+            actual = loop.time() - start
+            self.stats.record(action.kind, action.predicted, actual)
+            self.history.append((start, action.label, action.predicted, actual))
+        return True
+
+    def drive(
+        self, path: Route, rotation: float, label: str
+    ) -> tuple[ScheduledAction, float]:
+        """
+        経路をたどる動作と、走行を終えたときの向き
+        """
+        robot = self.__stage.robot
+        predicted, rotation = predict_drive(robot, path, rotation)
+        action = ScheduledAction("drive", label, predicted, lambda: robot.drive(path))
+        return action, rotation
+
+    def pickup(self, state: ArmState | None = None) -> tuple[ScheduledAction, ArmState]:
+        """
+        荷物をつかむ動作と、動作を終えたときのアームの状態
+        (stateは動作を始めるときのアームの状態. Noneなら今の状態)
+        """
+        robot = self.__stage.robot
+        predicted, state = predict_arm(robot, ArmState.HANDS_GRIPPED, state)
+        action = ScheduledAction("pickup", "pickup", predicted, robot.pickup_parcel)
+        return action, state
+
+    def release(
+        self, state: ArmState | None = None
+    ) -> tuple[ScheduledAction, ArmState]:
+        """
+        荷物を離す動作と、動作を終えたときのアームの状態
+        (stateは動作を始めるときのアームの状態. Noneなら今の状態)
+        """
+        robot = self.__stage.robot
+        predicted, state = predict_arm(robot, ArmState(0), state)
+        action = ScheduledAction("release", "release", predicted, robot.release_parcel)
+        return action, state
+
+    def delivery(self, goal: str, rotation: float) -> list[ScheduledAction]:
+        """
+        スタートエリアで荷物をつかんでゴールで離すまでの動作 (最後に得点する動作)
+
+        Args:
+            goal (str): ゴールの名前 ("goal1", ...)
+            rotation (float): 荷物をつかむときの向き (rad)
+        """
+        pickup, state = self.pickup()
+        drive, _ = self.drive(
+            self.__compiled.route("start", goal), rotation, f"start->{goal}"
+        )
+        release, _ = self.release(state)
+        return [pickup, drive, release]
+
+    def cycle(self, goal: str, rotation: float) -> list[ScheduledAction]:
+        """
+        今いるゴールからスタートエリアに戻り、次のゴールへ荷物を届けるまでの動作
+        """
+        current = self.__current_goal()
+        back, rotation = self.drive(
+            self.__compiled.route(current, "start"), rotation, f"{current}->start"
+        )
+        return [back, *self.delivery(goal, rotation)]
+
+    def __current_goal(self) -> str:
+        robot = self.__stage.robot
+        for goal in self.__stage.goals:
+            if goal.contains(robot.position):
+                return f"goal{goal.goal_id}"
+        raise RuntimeError("ロボットがゴールにいません")
+
+    async def deliver(self, goals: list[int] | None = None) -> int:
+        """
+        スタートエリアから荷物を運べるだけ運ぶ
+        goalsの順にゴールを目指すが、時間内に終わらないゴールは後回しにして間に合う近いゴールを選び、
+        goalsを回りきった後は往復の最も短いゴールへ運び続ける
+        どのゴールも間に合わなければ、それ以上は動かない
+
+        Args:
+            goals (list[int] | None, optional): 目指すゴールの番号の順番. デフォルトはNone (ステージのゴールの順).
+
+        Returns:
+            int: 届けた荷物の数
+        """
+        robot = self.__stage.robot
+        names = [f"goal{goal.goal_id}" for goal in self.__stage.goals]
+        queue = [f"goal{i}" for i in goals] if goals is not None else list(names)
+
+        start_area = self.__stage.start_area.center
+        if robot.position != start_area:
+            path = self.__compiled.planner.plan_path(robot.position, start_area)
+            move, _ = self.drive(path, robot.rotation, "->start")
+            if not await self.execute([move]):
+                return 0
+
+        delivered = 0
+        at_start = True
+        while True:
+            candidates = queue + [goal for goal in names if goal not in queue]
+            sequences = {
+                goal: (
+                    self.delivery(goal, robot.rotation)
+                    if at_start
+                    else self.cycle(goal, robot.rotation)
+                )
+                for goal in candidates
+            }
+            if not queue:
+                # 一巡した後は、往復の最も短いゴールを選ぶ
+                candidates.sort(key=lambda goal: self.budget(sequences[goal]))
+            chosen = next(
+                (goal for goal in candidates if self.fits(sequences[goal])), None
+            )
+            if chosen is None:
+                return delivered
+            if not await self.execute(sequences[chosen]):
+                return delivered
+            if chosen in queue:
+                queue.remove(chosen)
+            delivered += 1
+            at_start = False
@@ -0,0 +1,374 @@
+import argparse
+import asyncio
+import gc
+import selectors
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Literal
+
+import numpy as np
+
+import tracing
+from gpio import GPIO
+from main import (
+    STAGE_PATH,
+    STRATEGIES,
+    STRATEGY_NAME,
+    Strategy,
+    create_stage,
+    strategy,
+)
+from robot import Robot
+from robot_parts.arm import ArmState
+from scheduler import MATCH_DURATION
+from stage import Stage
+from stage_loader import CACHE_DIR, compile_stage, read_layout
+
+Action = Literal["start", "plan", "straight", "turn", "arm", "pose", "end"]
+
+
+class _VirtualSelector(selectors.DefaultSelector):
+    """
+    待つ代わりに仮想時計を進めるセレクタ
+    準備できたファイルが無ければ、次のタイマーまでの時間だけ時計を進めてすぐに戻る
+    """
+
+    def __init__(self, loop: "VirtualClockLoop"):
+        super().__init__()
+        self.__loop = loop
+
+    def select(
+        self, timeout: float | None = None
+    ) -> list[tuple[selectors.SelectorKey, int]]:
+        ready = super().select(0)
+        if ready:
+            return ready
+        if timeout is None:
+            # タイマーが無ければ、外からの通知 (call_soon_threadsafeなど) を本当に待つ
+            return super().select(None)
+        if timeout > 0:
+            self.__loop.advance(timeout)
+        return []
+
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    """
+    仮想時計で動くイベントループ
+    asyncio.sleepやタイムアウトは実時間を待たずに即座に時計を進めるので、
+    Driver, Arm, Robotの動作をそのまま速く動かせる
+    """
+
+    __now: float
+
+    def __init__(self) -> None:
+        self.__now = 0.0
+        super().__init__(_VirtualSelector(self))
+
+    def time(self) -> float:
+        return self.__now
+
+    def advance(self, seconds: float) -> None:
+        """
+        仮想時計を進める
+
+        Args:
+            seconds (float): 進める時間 (s)
+        """
+        self.__now += seconds
+
+
+@dataclass
+class TimelineEvent:
+    """
+    シミュレーション中の1つの出来事
+    Attributes:
+        time (float): 試合開始からの仮想時刻 (s)
+        action (Action): 出来事の種類
+        position (tuple[float, float]): その時点のロボットの位置 (x, y)
+        rotation (float): その時点のロボットの向き (rad)
+        arm (ArmState): その時点のアームの状態
+        path (list[tuple[float, float]]): その時点でたどっている経路
+        linear_velocity (float): 指令した並進速度 (mm/s)
+        angular_velocity (float): 指令した角速度 (rad/s)
+        duration (float): 指令を続ける時間 (s)
+    """
+
+    time: float
+    action: Action
+    position: tuple[float, float]
+    rotation: float
+    arm: ArmState
+    path: list[tuple[float, float]]
+    linear_velocity: float = 0
+    angular_velocity: float = 0
+    duration: float = 0
+
+
+@dataclass
+class GpioEvent:
+    """
+    mockのGPIOへの出力
+    Attributes:
+        time (float): 試合開始からの仮想時刻 (s)
+        kind (Literal["output", "pwm"]): 出力の種類
+        channel (int): チャンネル
+        value (float): outputなら0か1, pwmならデューティ比 (%)
+    """
+
+    time: float
+    kind: Literal["output", "pwm"]
+    channel: int
+    value: float
+
+
+class Timeline:
+    """
+    ロボットとDriverの記録先 (TelemetrySink) として出来事を仮想時刻付きで集めるクラス
+    """
+
+    events: list[TimelineEvent]
+    gpio: list[GpioEvent]
+
+    __loop: asyncio.AbstractEventLoop
+    __robot: Robot
+    __start: float
+    __last_path: list[tuple[float, float]] | None
+    __last_arm: ArmState
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, robot: Robot):
+        """
+        Args:
+            loop (asyncio.AbstractEventLoop): 時刻を取るイベントループ
+            robot (Robot): 記録するロボット
+        """
+        self.events = []
+        self.gpio = []
+        self.__loop = loop
+        self.__robot = robot
+        self.__start = loop.time()
+        self.__last_path = robot.path
+        self.__last_arm = robot.arm.state
+
+    @property
+    def now(self) -> float:
+        """
+        試合開始からの仮想時刻 (s)
+        """
+        return self.__loop.time() - self.__start
+
+    def record(
+        self,
+        linear_velocity: float = 0,
+        angular_velocity: float = 0,
+        duration: float = 0,
+    ) -> None:
+        robot = self.__robot
+        if linear_velocity:
+            action: Action = "straight"
+        elif angular_velocity:
+            action = "turn"
+        elif robot.path is not self.__last_path:
+            action = "plan"
+        elif robot.arm.state != self.__last_arm:
+            action = "arm"
+        else:
+            action = "pose"
+        self.__last_path = robot.path
+        self.__last_arm = robot.arm.state
+        self.mark(action, linear_velocity, angular_velocity, duration)
+
+    def mark(
+        self,
+        action: Action,
+        linear_velocity: float = 0,
+        angular_velocity: float = 0,
+        duration: float = 0,
+    ) -> None:
+        """
+        現在のロボットの状態を、指定した種類の出来事として記録する
+        """
+        robot = self.__robot
+        self.events.append(
+            TimelineEvent(
+                time=self.now,
+                action=action,
+                position=robot.position,
+                rotation=robot.rotation,
+                arm=robot.arm.state,
+                path=robot.path,
+                linear_velocity=linear_velocity,
+                angular_velocity=angular_velocity,
+                duration=duration,
+            )
+        )
+
+    def on_gpio(
+        self, kind: Literal["output", "pwm"], channel: int, value: float
+    ) -> None:
+        self.gpio.append(GpioEvent(self.now, kind, channel, value))
+
+
+@dataclass
+class SimulationResult:
+    """
+    シミュレーションの結果
+    Attributes:
+        events (list[TimelineEvent]): 出来事のタイムライン (時刻順)
+        gpio (list[GpioEvent]): GPIOへの出力 (時刻順)
+        duration (float): 戦略が終わった (または打ち切った) 仮想時刻 (s)
+        finished (bool): 戦略が試合時間内に終わったかどうか
+        wall_time (float): シミュレーションにかかった実時間 (s)
+    """
+
+    events: list[TimelineEvent]
+    gpio: list[GpioEvent] = field(repr=False)
+    duration: float
+    finished: bool
+    wall_time: float
+
+    def actions(self, action: Action) -> list[TimelineEvent]:
+        """
+        指定した種類の出来事だけを返す
+        """
+        return [event for event in self.events if event.action == action]
+
+    def pose_at(self, time: float) -> tuple[float, float, float]:
+        """
+        指定した時刻のロボットの姿勢を、直前の出来事から推測航法で求める
+
+        Args:
+            time (float): 試合開始からの仮想時刻 (s)
+
+        Returns:
+            tuple[float, float, float]: 姿勢 (x, y, rotation)
+        """
+        times = [event.time for event in self.events]
+        index = max(int(np.searchsorted(times, time, side="right")) - 1, 0)
+        event = self.events[index]
+        elapsed = min(max(time - event.time, 0), event.duration)
+        turned = event.angular_velocity * elapsed
+        heading = event.rotation + turned / 2
+        travelled = event.linear_velocity * elapsed
+        x, y = event.position
+        return (
+            float(x + travelled * np.cos(heading)),
+            float(y + travelled * np.sin(heading)),
+            float((event.rotation + turned + np.pi) % (2 * np.pi) - np.pi),
+        )
+
+
+def simulate(
+    strategy: Strategy = strategy,
+    duration: float = MATCH_DURATION,
+    stage_path: Path = STAGE_PATH,
+    cache_dir: Path | None = CACHE_DIR,
+    setup: Callable[[Stage], None] | None = None,
+) -> SimulationResult:
+    """
+    mockのGPIOと仮想時計のイベントループで戦略を動かし、出来事のタイムラインを返す
+    asyncio.sleepは実時間を待たないので、試合1回分でも一瞬で終わる
+
+    Args:
+        strategy (Strategy, optional): 動かす戦略 (main.strategyと同じ引数). デフォルトはmain.strategy.
+        duration (float, optional): 試合時間 (s). 過ぎたら戦略をキャンセルする. デフォルトはMATCH_DURATION.
+        stage_path (Path, optional): ステージファイル. デフォルトはmain.STAGE_PATH.
+        cache_dir (Path | None, optional): compile_stageのキャッシュの保存先. デフォルトはCACHE_DIR.
+        setup (Callable[[Stage], None] | None, optional): ステージを作った直後に呼ぶ関数 (ロボットの性能を変えるなど). デフォルトはNone.
+
+    Returns:
+        SimulationResult: シミュレーションの結果
+
+    Raises:
+        RuntimeError: 実機のGPIOが読み込まれている場合
+    """
+    if not hasattr(GPIO, "add_listener"):
+        raise RuntimeError("シミュレーションはmockのGPIOでのみ実行できます")
+
+    async def run() -> tuple[list[TimelineEvent], list[GpioEvent], float, bool]:
+        layout = read_layout(stage_path)
+        stage = create_stage(layout)
+        compiled = compile_stage(stage, layout.digest, cache_dir=cache_dir)
+        robot = stage.robot
+        if setup is not None:
+            setup(stage)
+
+        timeline = Timeline(asyncio.get_running_loop(), robot)
+        robot.telemetry = timeline
+        robot.driver.telemetry = timeline
+        GPIO.add_listener(timeline.on_gpio)
+        timeline.mark("start")
+        try:
+            await asyncio.wait_for(strategy(stage, compiled), duration)
+            finished = True
+        except TimeoutError:
+            finished = False
+        finally:
+            GPIO.remove_listener(timeline.on_gpio)
+        timeline.mark("end")
+        return timeline.events, timeline.gpio, timeline.now, finished
+
+    verbose = GPIO.VERBOSE
+    GPIO.VERBOSE = False
+    wall_start = time.perf_counter()
+    try:
+        with asyncio.Runner(loop_factory=VirtualClockLoop) as runner:
+            events, gpio, end, finished = runner.run(run())
+    finally:
+        # ピンの後始末 (PwmPin.__del__) もログを出さずに済ませる
+        gc.collect()
+        GPIO.VERBOSE = verbose
+    return SimulationResult(
+        events=events,
+        gpio=gpio,
+        duration=end,
+        finished=finished,
+        wall_time=time.perf_counter() - wall_start,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="mainの戦略を仮想時計で動かし、出来事のタイムラインを表示する"
+    )
+    parser.add_argument(
+        "--strategy",
+        choices=list(STRATEGIES),
+        default=STRATEGY_NAME,
+        help="mainの戦略の関数名 (デフォルトはmainと同じくROBOCON_STRATEGYの値)",
+    )
+    parser.add_argument("--duration", type=float, default=MATCH_DURATION)
+    parser.add_argument("--stage", type=Path, default=STAGE_PATH)
+    parser.add_argument(
+        "--trace", type=Path, default=None, help="仮想時刻のトレースの書き出し先"
+    )
+    args = parser.parse_args()
+
+    # 仮想時計で記録するので、トレースには試合の時間がそのまま並ぶ
+    tracer = (
+        tracing.enable(clock=lambda: asyncio.get_running_loop().time())
+        if args.trace
+        else None
+    )
+    result = simulate(STRATEGIES[args.strategy], args.duration, args.stage)
+    if tracer is not None:
+        tracer.export(args.trace)
+        tracing.disable()
+    for event in result.events:
+        x, y = event.position
+        print(
+            f"{event.time:8.3f}s  {event.action:<8}  "
+            f"({x:7.1f}, {y:7.1f}) {np.degrees(event.rotation):7.1f}°  "
+            f"arm={event.arm.value}  v={event.linear_velocity:.0f}  "
+            f"w={event.angular_velocity:.2f}  t={event.duration:.3f}"
+        )
+    print(
+        f"{'完了' if result.finished else '時間切れ'}: "
+        f"仮想時間 {result.duration:.2f}s, 実時間 {result.wall_time * 1000:.1f}ms, "
+        f"GPIO出力 {len(result.gpio)}回"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,18 @@
 from abc import ABCMeta, abstractmethod
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from itertools import pairwise
 
 import numpy as np
 from matplotlib.axes import Axes
+from matplotlib.patches import Polygon as PolygonPatch
 from matplotlib.patches import Rectangle
 from matplotlib.transforms import Affine2D
 
 from robot import Robot
-from visualize import Visualizable
+from visualize import Layer, Visualizable
+
+# 線分 ((x1, y1), (x2, y2))
+Segment = tuple[tuple[float, float], tuple[float, float]]
 
 
 @dataclass
@@ -19,9 +24,19 @@ class Wall(Visualizable):
         obstacled_y (list[tuple[float, float]]): 障害物があるy座標の範囲のリスト [(start_y, end_y), ...]
     """
 
+    layer = Layer.OBSTACLE
+
     x: float
     obstacled_y: list[tuple[float, float]]
 
+    def segments(self) -> list[Segment]:
+        """
+        壁を表す線分のリスト
+        """
+        return [
+            ((self.x, start_y), (self.x, end_y)) for start_y, end_y in self.obstacled_y
+        ]
+
     def visualize(self, ax: Axes):
         width = 50  # 壁の幅
         for start_y, end_y in self.obstacled_y:
@@ -35,6 +50,28 @@ class Wall(Visualizable):
             )
 
 
+@dataclass
+class Obstacle(Visualizable):
+    """
+    多角形の障害物の情報を管理するクラス
+    Attributes:
+        vertices (list[tuple[float, float]]): 頂点の座標のリスト (順に結び、最後の点は最初の点とつなぐ)
+    """
+
+    layer = Layer.OBSTACLE
+
+    vertices: list[tuple[float, float]]
+
+    def segments(self) -> list[Segment]:
+        """
+        障害物の辺のリスト
+        """
+        return list(pairwise([*self.vertices, self.vertices[0]]))
+
+    def visualize(self, ax: Axes):
+        ax.add_patch(PolygonPatch(self.vertices, closed=True, color="brown"))
+
+
 @dataclass
 class Area(Visualizable, metaclass=ABCMeta):
     """
@@ -44,6 +81,8 @@ class Area(Visualizable, metaclass=ABCMeta):
         size (int): エリアの一辺の長さ (mm)
     """
 
+    layer = Layer.AREA
+
     position: tuple[int, int]
     size: int
 
@@ -54,6 +93,16 @@ class Area(Visualizable, metaclass=ABCMeta):
             self.position[1] + self.size / 2,
         )
 
+    def contains(self, point: tuple[float, float]) -> bool:
+        """
+        点がエリアの中 (境界を含む) にあるかどうか
+        """
+        x, y = point
+        return (
+            self.position[0] <= x <= self.position[0] + self.size
+            and self.position[1] <= y <= self.position[1] + self.size
+        )
+
     @abstractmethod
     def color(self) -> str:
         pass
@@ -143,6 +192,8 @@ class ARMarker(Visualizable):
         marker_id (int): ARマーカーの識別子
     """
 
+    layer = Layer.MARKER
+
     position: tuple[int, int]
     normal: tuple[int, int]
     marker_id: int
@@ -194,15 +245,36 @@ class Stage(Visualizable):
         goals (list[Goal]): ゴールのリスト
         ar_markers (list[ARMarker]): ARマーカーのリスト
         robot (Robot): ステージ上のロボット
+        obstacles (list[Obstacle]): 多角形の障害物のリスト
     """
 
+    layer = Layer.STAGE
+
     x_size: int
     y_size: int
     start_area: StartArea
-    wall: Wall
+    walls: list[Wall]
     goals: list[GoalArea]
     ar_markers: list[ARMarker]
     robot: Robot
+    obstacles: list[Obstacle] = field(default_factory=list)
+
+    def segments(self) -> list[Segment]:
+        """
+        ロボットが通れない線分 (ステージの枠, 壁, 障害物の辺) のリスト
+        """
+        corners: list[tuple[float, float]] = [
+            (0, 0),
+            (self.x_size, 0),
+            (self.x_size, self.y_size),
+            (0, self.y_size),
+        ]
+        segments = list(pairwise([*corners, corners[0]]))
+        for wall in self.walls:
+            segments += wall.segments()
+        for obstacle in self.obstacles:
+            segments += obstacle.segments()
+        return segments
 
     def visualize(self, ax: Axes):
         ax.set_title("Stage Visualization")
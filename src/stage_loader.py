@@ -0,0 +1,241 @@
+import hashlib
+import itertools
+import json
+import math
+import tomllib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import shapely
+from shapely import MultiPolygon, Polygon
+
+from pathfinding import PathPlanner
+from robot import Robot
+from stage import ARMarker, GoalArea, Obstacle, Stage, StartArea, Wall
+
+ROOT = Path(__file__).resolve().parents[1]
+STAGE_PATH = ROOT / "config" / "stage.toml"
+CACHE_DIR = ROOT / ".cache" / "stage"
+# キャッシュの中身の形式を変えたら上げる
+CACHE_VERSION = 3
+
+Route = list[tuple[float, float]]
+
+
+@dataclass
+class StageLayout:
+    """
+    ステージファイルから読み込んだ配置
+    Attributes:
+        x_size (int): ステージのx方向サイズ (mm)
+        y_size (int): ステージのy方向サイズ (mm)
+        start_area (StartArea): スタートエリア
+        walls (list[Wall]): 壁のリスト
+        goals (list[GoalArea]): ゴールのリスト
+        ar_markers (list[ARMarker]): ARマーカーのリスト
+        obstacles (list[Obstacle]): 多角形の障害物のリスト
+        robot_position (tuple[float, float]): ロボットの初期位置 (x, y)
+        robot_rotation (float): ロボットの初期の向き (rad)
+        digest (str): ステージファイルの内容のハッシュ
+    """
+
+    x_size: int
+    y_size: int
+    start_area: StartArea
+    walls: list[Wall]
+    goals: list[GoalArea]
+    ar_markers: list[ARMarker]
+    obstacles: list[Obstacle]
+    robot_position: tuple[float, float]
+    robot_rotation: float
+    digest: str
+
+    def create_stage(self, robot: Robot) -> Stage:
+        """
+        この配置のステージを作る
+
+        Args:
+            robot (Robot): ステージ上のロボット
+
+        Returns:
+            Stage: ステージ
+        """
+        return Stage(
+            x_size=self.x_size,
+            y_size=self.y_size,
+            start_area=self.start_area,
+            walls=self.walls,
+            goals=self.goals,
+            ar_markers=self.ar_markers,
+            robot=robot,
+            obstacles=self.obstacles,
+        )
+
+
+def _pair(value: list[float]) -> tuple[Any, Any]:
+    x, y = value
+    return (x, y)
+
+
+def read_layout(path: Path = STAGE_PATH) -> StageLayout:
+    """
+    ステージファイル (.toml または .json) を読み込む
+
+    Args:
+        path (Path, optional): ステージファイル. デフォルトはSTAGE_PATH.
+
+    Returns:
+        StageLayout: 読み込んだ配置
+    """
+    content = path.read_bytes()
+    if path.suffix == ".json":
+        data = json.loads(content)
+    else:
+        data = tomllib.loads(content.decode())
+
+    start_area = StartArea(
+        position=_pair(data["start_area"]["position"]),
+        size=data["start_area"]["size"],
+    )
+    if "parcel_size" in data["start_area"]:
+        start_area.parcel_size = _pair(data["start_area"]["parcel_size"])
+    robot = data["robot"]
+    return StageLayout(
+        x_size=data["x_size"],
+        y_size=data["y_size"],
+        start_area=start_area,
+        walls=[
+            Wall(x=wall["x"], obstacled_y=[_pair(ys) for ys in wall["obstacled_y"]])
+            for wall in data.get("walls", [])
+        ],
+        goals=[
+            GoalArea(
+                position=_pair(goal["position"]),
+                size=goal["size"],
+                goal_id=goal["goal_id"],
+            )
+            for goal in data["goals"]
+        ],
+        ar_markers=[
+            ARMarker(
+                position=_pair(marker["position"]),
+                normal=_pair(marker["normal"]),
+                marker_id=marker["marker_id"],
+            )
+            for marker in data.get("ar_markers", [])
+        ],
+        obstacles=[
+            Obstacle(vertices=[_pair(v) for v in obstacle["vertices"]])
+            for obstacle in data.get("obstacles", [])
+        ],
+        robot_position=_pair(robot["position"]),
+        robot_rotation=math.radians(robot.get("rotation", 0)),
+        digest=hashlib.sha256(content).hexdigest(),
+    )
+
+
+@dataclass
+class CompiledStage:
+    """
+    ステージから計算した経路計画用のデータ
+    Attributes:
+        planner (PathPlanner): 障害物の形状と自由空間グラフを設定済みのPathPlanner
+        routes (dict[tuple[str, str], Route]): 名前付きの地点の間の経路 ("start", "goal1", ...)
+    """
+
+    planner: PathPlanner
+    routes: dict[tuple[str, str], Route]
+
+    def route(self, start: str, end: str) -> Route:
+        """
+        計算済みの経路を返す
+
+        Args:
+            start (str): 出発地点の名前 ("start", "goal1", ...)
+            end (str): 到着地点の名前
+
+        Returns:
+            Route: 経路 (呼び出し側で変更してもよいコピー)
+        """
+        return list(self.routes[(start, end)])
+
+
+def waypoints(stage: Stage) -> dict[str, tuple[float, float]]:
+    """
+    経路表を作る名前付きの地点 (スタートエリアと各ゴールの中心)
+    """
+    points = {"start": stage.start_area.center}
+    for goal in stage.goals:
+        points[f"goal{goal.goal_id}"] = goal.center
+    return points
+
+
+def compile_stage(
+    stage: Stage,
+    digest: str,
+    safe_margin: float = 10,
+    cache_dir: Path | None = CACHE_DIR,
+) -> CompiledStage:
+    """
+    障害物の形状、自由空間グラフと経路表を計算する
+    結果はステージファイルのハッシュとロボットの大きさをキーにしてWKBとJSONでキャッシュし、
+    同じ配置なら次回以降は計算せずに読み込む
+
+    Args:
+        stage (Stage): ステージ
+        digest (str): ステージファイルの内容のハッシュ (StageLayout.digest)
+        safe_margin (float, optional): PathPlannerの安全距離 (mm). デフォルトは10.
+        cache_dir (Path | None, optional): キャッシュの保存先. Noneならキャッシュしない.
+
+    Returns:
+        CompiledStage: 計算結果
+    """
+    key = hashlib.sha256(
+        f"{CACHE_VERSION}:{digest}:{stage.robot.radius}:{safe_margin}".encode()
+    ).hexdigest()
+    cache_path = None if cache_dir is None else cache_dir / f"{key}.json"
+
+    if cache_path is not None and cache_path.exists():
+        with cache_path.open() as f:
+            cached = json.load(f)
+        shape = shapely.from_wkb(bytes.fromhex(cached["shape"]))
+        if isinstance(shape, (Polygon, MultiPolygon)):
+            graph = (
+                np.array(cached["nodes"], dtype=float).reshape(-1, 2),
+                np.array(cached["edges"], dtype=np.intp).reshape(-1, 2),
+            )
+            return CompiledStage(
+                planner=PathPlanner(stage, safe_margin, shape=shape, graph=graph),
+                routes={
+                    (route["from"], route["to"]): [_pair(p) for p in route["path"]]
+                    for route in cached["routes"]
+                },
+            )
+
+    planner = PathPlanner(stage, safe_margin)
+    points = waypoints(stage)
+    routes = {
+        (start, end): planner.plan_path(points[start], points[end])
+        for start, end in itertools.permutations(points, 2)
+    }
+
+    if cache_path is not None:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = cache_path.with_suffix(".tmp")
+        with temporary.open("w") as f:
+            json.dump(
+                {
+                    "shape": shapely.to_wkb(planner.shape, hex=True),
+                    "nodes": planner.graph[0].tolist(),
+                    "edges": planner.graph[1].tolist(),
+                    "routes": [
+                        {"from": start, "to": end, "path": path}
+                        for (start, end), path in routes.items()
+                    ],
+                },
+                f,
+            )
+        temporary.replace(cache_path)
+    return CompiledStage(planner=planner, routes=routes)
@@ -0,0 +1,249 @@
+import struct
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, BinaryIO, Protocol
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from robot import Robot
+
+MAGIC = b"RBTL\x01"
+
+# 記録の種類 (1バイト) に続けて固定長の本体を書く
+_SAMPLE_KIND = b"S"
+_PATH_KIND = b"P"
+# timestamp, x, y, rotation, path_id, arm, linear_velocity, angular_velocity, duration
+_SAMPLE = struct.Struct("<dfffIBfff")
+# path_id, 点の数 (この後に (x, y) がfloat32で続く)
+_PATH = struct.Struct("<II")
+
+SAMPLE_DTYPE = np.dtype(
+    [
+        ("timestamp", "<f8"),
+        ("x", "<f4"),
+        ("y", "<f4"),
+        ("rotation", "<f4"),
+        ("path_id", "<u4"),
+        ("arm", "u1"),
+        ("linear_velocity", "<f4"),
+        ("angular_velocity", "<f4"),
+        ("duration", "<f4"),
+    ]
+)
+
+
+class TelemetrySink(Protocol):
+    """
+    RobotとDriverが状態の変化を知らせる先 (TelemetryLogやシミュレータのタイムライン)
+    """
+
+    def record(
+        self,
+        linear_velocity: float = 0,
+        angular_velocity: float = 0,
+        duration: float = 0,
+    ) -> None: ...
+
+
+class TelemetryLog:
+    """
+    ロボットの状態を小さなバイナリ形式でファイルに追記するクラス
+    RobotとDriverは状態が変わったときにrecordを呼ぶだけで、
+    1回の記録はstructで詰めてバッファ付きのファイルに書くだけなので、制御をほとんど遅らせない
+    経路は変わったときだけ番号を振って書き出し、以降の記録は番号で参照する
+    """
+
+    __path: Path
+    __robot: "Robot"
+    __buffer_size: int
+    __file: BinaryIO | None
+    __start: float
+    __logged_path: list[tuple[float, float]] | None
+    __path_id: int
+
+    def __init__(self, path: Path, robot: "Robot", buffer_size: int = 1 << 16):
+        """
+        Args:
+            path (Path): 書き出し先
+            robot (Robot): 記録するロボット
+            buffer_size (int, optional): 書き込みバッファのサイズ (bytes). デフォルトは64KiB.
+        """
+        self.__path = path
+        self.__robot = robot
+        self.__buffer_size = buffer_size
+        self.__file = None
+        self.__start = 0
+        self.__logged_path = None
+        self.__path_id = -1
+
+    def start(self) -> None:
+        """
+        ファイルを開き、ロボットとDriverから記録されるようにする
+        """
+        self.__path.parent.mkdir(parents=True, exist_ok=True)
+        self.__file = self.__path.open("wb", buffering=self.__buffer_size)
+        self.__file.write(MAGIC)
+        self.__start = time.monotonic()
+        self.__logged_path = None
+        self.__robot.telemetry = self
+        self.__robot.driver.telemetry = self
+        self.record()
+
+    def record(
+        self,
+        linear_velocity: float = 0,
+        angular_velocity: float = 0,
+        duration: float = 0,
+    ) -> None:
+        """
+        現在のロボットの状態を1件記録する
+
+        Args:
+            linear_velocity (float, optional): これから指令する並進速度 (mm/s). デフォルトは0.
+            angular_velocity (float, optional): これから指令する角速度 (rad/s). デフォルトは0.
+            duration (float, optional): 指令を続ける時間 (s). デフォルトは0.
+        """
+        if self.__file is None:
+            return
+        robot = self.__robot
+        if robot.path is not self.__logged_path:
+            self.__path_id += 1
+            self.__file.write(_PATH_KIND)
+            self.__file.write(_PATH.pack(self.__path_id, len(robot.path)))
+            self.__file.write(np.asarray(robot.path, dtype="<f4").tobytes())
+            self.__logged_path = robot.path
+        x, y = robot.position
+        self.__file.write(_SAMPLE_KIND)
+        self.__file.write(
+            _SAMPLE.pack(
+                time.monotonic() - self.__start,
+                x,
+                y,
+                robot.rotation,
+                self.__path_id,
+                robot.arm.state,
+                linear_velocity,
+                angular_velocity,
+                duration,
+            )
+        )
+
+    def close(self) -> None:
+        """
+        最後の状態を記録してファイルを閉じる
+        """
+        if self.__file is None:
+            return
+        self.record()
+        self.__file.close()
+        self.__file = None
+        if self.__robot.telemetry is self:
+            self.__robot.telemetry = None
+        if self.__robot.driver.telemetry is self:
+            self.__robot.driver.telemetry = None
+
+    def __enter__(self) -> "TelemetryLog":
+        self.start()
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.close()
+
+
+@dataclass
+class Telemetry:
+    """
+    TelemetryLogで記録したファイルの内容
+    Attributes:
+        samples (np.ndarray): 記録 (SAMPLE_DTYPEの構造化配列, 時刻順)
+        paths (dict[int, np.ndarray]): 経路番号ごとの経路 (M, 2)
+    """
+
+    samples: np.ndarray
+    paths: dict[int, np.ndarray]
+
+    @property
+    def duration(self) -> float:
+        """
+        記録の長さ (s)
+        """
+        return float(self.samples["timestamp"][-1]) if len(self.samples) else 0.0
+
+    def sample_indices(self, times: np.ndarray) -> np.ndarray:
+        """
+        各時刻の直前の記録の番号を返す
+        """
+        indices = np.searchsorted(self.samples["timestamp"], times, side="right") - 1
+        return np.clip(indices, 0, len(self.samples) - 1)
+
+    def poses(self, times: np.ndarray) -> np.ndarray:
+        """
+        直前の記録の姿勢から、その時点の指令で推測航法した各時刻の姿勢を求める
+
+        Args:
+            times (np.ndarray): 時刻 (N,) (s, 記録開始から)
+
+        Returns:
+            np.ndarray: 姿勢 (N, 3) (x, y, rotation)
+        """
+        samples = self.samples[self.sample_indices(times)]
+        elapsed = np.clip(times - samples["timestamp"], 0, samples["duration"])
+        turned = samples["angular_velocity"] * elapsed
+        heading = samples["rotation"] + turned / 2
+        travelled = samples["linear_velocity"] * elapsed
+        return np.stack(
+            [
+                samples["x"] + travelled * np.cos(heading),
+                samples["y"] + travelled * np.sin(heading),
+                (samples["rotation"] + turned + np.pi) % (2 * np.pi) - np.pi,
+            ],
+            axis=1,
+        )
+
+
+def load_telemetry(path: Path) -> Telemetry:
+    """
+    TelemetryLogで記録したファイルを読み込む
+    (書き込み途中で止まったファイルは、最後の完全な記録までを読む)
+
+    Args:
+        path (Path): 記録ファイル
+
+    Returns:
+        Telemetry: 読み込んだ内容
+    """
+    data = path.read_bytes()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"テレメトリの記録ではありません: {path}")
+
+    samples: list[bytes] = []
+    paths: dict[int, np.ndarray] = {}
+    offset = len(MAGIC)
+    while offset < len(data):
+        kind = data[offset : offset + 1]
+        offset += 1
+        if kind == _SAMPLE_KIND:
+            if offset + _SAMPLE.size > len(data):
+                break
+            samples.append(data[offset : offset + _SAMPLE.size])
+            offset += _SAMPLE.size
+        elif kind == _PATH_KIND:
+            if offset + _PATH.size > len(data):
+                break
+            path_id, length = _PATH.unpack_from(data, offset)
+            offset += _PATH.size
+            if offset + length * 8 > len(data):
+                break
+            paths[path_id] = np.frombuffer(
+                data, dtype="<f4", count=length * 2, offset=offset
+            ).reshape(-1, 2)
+            offset += length * 8
+        else:
+            raise ValueError(f"不明な記録です: {kind!r} (offset {offset - 1})")
+
+    return Telemetry(
+        samples=np.frombuffer(b"".join(samples), dtype=SAMPLE_DTYPE),
+        paths=paths,
+    )
@@ -0,0 +1,244 @@
+import asyncio
+import functools
+import json
+import os
+import time
+import weakref
+from collections.abc import Callable, Coroutine, Iterator
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Any, ContextManager, ParamSpec, TypeVar
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+
+class Tracer:
+    """
+    コルーチンの区間 (span) の開始時刻と長さを集め、Chromeのtrace event形式で書き出すクラス
+    区間はasyncioのタスクごとに別のスレッドとして並べるので、
+    gatherで同時に動く車輪や手の動作も入れ子を崩さずに表示できる
+    (chrome://tracing や Perfetto で開ける)
+    タスクは弱参照で覚えるので、終わったタスクを記録のために生かし続けることはない
+    """
+
+    __clock: Callable[[], float]
+    __start: float | None
+    __events: list[dict[str, Any]]
+    __threads: "weakref.WeakKeyDictionary[asyncio.Task, int]"
+    __main_thread: int | None
+    __thread_names: list[str]
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            clock (Callable[[], float], optional): 時刻 (s) を返す関数. デフォルトはtime.monotonic (シミュレーションではループの時計を渡す).
+        """
+        self.__clock = clock
+        self.__start = None
+        self.__events = []
+        self.__threads = weakref.WeakKeyDictionary()
+        self.__main_thread = None
+        self.__thread_names = []
+
+    def __now(self) -> float:
+        """
+        最初に記録した時刻からの経過時間 (µs)
+        """
+        now = self.__clock()
+        if self.__start is None:
+            self.__start = now
+        return (now - self.__start) * 1e6
+
+    def __thread(self) -> int:
+        """
+        実行中のタスクのスレッド番号 (初めてのタスクなら番号と名前を割り当てる)
+        """
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        if task is None:
+            if self.__main_thread is None:
+                self.__main_thread = self.__new_thread("main")
+            return self.__main_thread
+        thread = self.__threads.get(task)
+        if thread is None:
+            thread = self.__threads[task] = self.__new_thread(task.get_name())
+        return thread
+
+    def __new_thread(self, name: str) -> int:
+        self.__thread_names.append(name)
+        return len(self.__thread_names) - 1
+
+    @contextmanager
+    def span(self, name: str, **args: Any) -> Iterator[None]:
+        """
+        withの中を1つの区間として記録する
+
+        Args:
+            name (str): 区間の名前
+            **args (Any): 区間に付ける情報 (トレースの表示で見られる)
+        """
+        thread = self.__thread()
+        start = self.__now()
+        try:
+            yield
+        except BaseException as e:
+            args["error"] = type(e).__name__
+            raise
+        finally:
+            self.__events.append(
+                {
+                    "name": name,
+                    "ph": "X",
+                    "ts": start,
+                    "dur": self.__now() - start,
+                    "pid": os.getpid(),
+                    "tid": thread,
+                    "args": args,
+                }
+            )
+
+    def instant(self, name: str, **args: Any) -> None:
+        """
+        その時点の出来事を記録する
+        """
+        self.__events.append(
+            {
+                "name": name,
+                "ph": "i",
+                "s": "t",
+                "ts": self.__now(),
+                "pid": os.getpid(),
+                "tid": self.__thread(),
+                "args": args,
+            }
+        )
+
+    def trace_events(self) -> list[dict[str, Any]]:
+        """
+        記録した区間と、スレッド (タスク) の名前のtrace event
+        """
+        names = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": os.getpid(),
+                "tid": thread,
+                "args": {"name": name},
+            }
+            for thread, name in enumerate(self.__thread_names)
+        ]
+        return names + sorted(
+            self.__events, key=lambda event: (event["ts"], -event.get("dur", 0))
+        )
+
+    def export(self, path: Path) -> None:
+        """
+        Chromeのtrace event形式 (JSON) で書き出す
+
+        Args:
+            path (Path): 書き出し先 (.json)
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("w") as f:
+            json.dump(
+                {"traceEvents": self.trace_events(), "displayTimeUnit": "ms"},
+                f,
+                ensure_ascii=False,
+            )
+
+
+TRACER: Tracer | None = None
+
+_DISABLED = nullcontext()
+
+
+def enable(clock: Callable[[], float] = time.monotonic) -> Tracer:
+    """
+    トレースを有効にする (以降のtracedとspanが記録される)
+
+    Args:
+        clock (Callable[[], float], optional): 時刻 (s) を返す関数. デフォルトはtime.monotonic.
+
+    Returns:
+        Tracer: 記録先
+    """
+    global TRACER
+    TRACER = Tracer(clock)
+    return TRACER
+
+
+def disable() -> None:
+    """
+    トレースを無効にする
+    """
+    global TRACER
+    TRACER = None
+
+
+def span(name: str, **args: Any) -> ContextManager[None]:
+    """
+    トレースが有効なら、withの中を1つの区間として記録する
+    無効なら何もしない共有のコンテキストマネージャを返すだけ
+
+    Args:
+        name (str): 区間の名前
+        **args (Any): 区間に付ける情報
+    """
+    tracer = TRACER
+    if tracer is None:
+        return _DISABLED
+    return tracer.span(name, **args)
+
+
+async def _traced_call(
+    tracer: Tracer, name: str, args: dict[str, Any], coroutine: Coroutine[Any, Any, T]
+) -> T:
+    with tracer.span(name, **args):
+        return await coroutine
+
+
+def traced(
+    name: str | None = None,
+) -> Callable[
+    [Callable[P, Coroutine[Any, Any, T]]], Callable[P, Coroutine[Any, Any, T]]
+]:
+    """
+    コルーチン関数の呼び出しを区間として記録するデコレータ
+    トレースが無効なら元のコルーチンをそのまま返すので、余計なフレームも作らない
+    区間には、selfを除いた引数の表現を付ける
+
+    Args:
+        name (str | None, optional): 区間の名前. デフォルトはNone (関数の__qualname__).
+    """
+
+    def decorator(
+        function: Callable[P, Coroutine[Any, Any, T]],
+    ) -> Callable[P, Coroutine[Any, Any, T]]:
+        label = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> Coroutine[Any, Any, T]:
+            tracer = TRACER
+            if tracer is None:
+                return function(*args, **kwargs)
+            details = {f"arg{i}": _describe(a) for i, a in enumerate(args[1:], 1)}
+            details |= {key: _describe(value) for key, value in kwargs.items()}
+            return _traced_call(tracer, label, details, function(*args, **kwargs))
+
+        return wrapper
+
+    return decorator
+
+
+def _describe(value: object) -> Any:
+    """
+    引数をtrace eventに書ける値にする (長いリストは長さだけにする)
+    """
+    if isinstance(value, (int, float, str, bool)) or value is None:
+        return value
+    if isinstance(value, (list, tuple)) and len(value) > 8:
+        return f"{type(value).__name__}[{len(value)}]"
+    return repr(value)
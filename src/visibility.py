@@ -0,0 +1,385 @@
+import argparse
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from stage import Stage
+from stage_loader import ROOT, STAGE_PATH, compile_stage, read_layout
+from vision.calibration import CALIBRATION_PATH, Calibration
+
+CACHE_DIR = ROOT / ".cache" / "visibility"
+# キャッシュの中身の形式を変えたら上げる
+CACHE_VERSION = 1
+# ARマーカーの一辺の長さ (m, robot_parts.camera.MARKER_SIZEと同じ)
+MARKER_LENGTH = 0.125
+
+
+@dataclass
+class VisibilityMap:
+    """
+    姿勢の格子 (x, y, 向き) ごとに、カメラに映るARマーカーを事前に計算した表
+    実行時は格子の番号を引くだけで、光線の計算は要らない
+    Attributes:
+        cell_size (float): 格子の一辺の長さ (mm)
+        marker_ids (np.ndarray): ARマーカーの識別子 (M,) (以下の配列のマーカーの並び)
+        visible (np.ndarray): 映るかどうかのビットを詰めた配列 (nx, ny, heading_bins, ceil(M / 8))
+        pixel_sizes (np.ndarray): 画像上のマーカーの一辺の長さの見込み (nx, ny, heading_bins, M) (px, uint8, 映らなければ0)
+    """
+
+    cell_size: float
+    marker_ids: np.ndarray
+    visible: np.ndarray
+    pixel_sizes: np.ndarray
+
+    @property
+    def heading_bins(self) -> int:
+        return self.visible.shape[2]
+
+    def index(
+        self, position: tuple[float, float], rotation: float
+    ) -> tuple[int, int, int]:
+        """
+        姿勢が入る格子の番号を返す (範囲外の位置は端の格子にする)
+        """
+        nx, ny, bins = self.visible.shape[:3]
+        i = min(max(int(position[0] // self.cell_size), 0), nx - 1)
+        j = min(max(int(position[1] // self.cell_size), 0), ny - 1)
+        k = int(np.round(rotation / (2 * np.pi) * bins)) % bins
+        return i, j, k
+
+    def visible_mask(
+        self, position: tuple[float, float], rotation: float
+    ) -> np.ndarray:
+        """
+        各マーカーが映るかどうか (M,)
+        """
+        bits = self.visible[self.index(position, rotation)]
+        return np.unpackbits(bits, count=len(self.marker_ids)).astype(bool)
+
+    def visible_markers(
+        self, position: tuple[float, float], rotation: float
+    ) -> np.ndarray:
+        """
+        指定した姿勢で映るマーカーの識別子
+
+        Args:
+            position (tuple[float, float]): ロボットの位置 (x, y)
+            rotation (float): ロボットの向き (rad)
+
+        Returns:
+            np.ndarray: 映るマーカーの識別子
+        """
+        return self.marker_ids[self.visible_mask(position, rotation)]
+
+    def pixel_size(
+        self, position: tuple[float, float], rotation: float, marker_id: int
+    ) -> int:
+        """
+        指定した姿勢でのマーカーの一辺の見込みの長さ (px, 映らなければ0)
+        """
+        (index,) = np.flatnonzero(self.marker_ids == marker_id)
+        return int(self.pixel_sizes[(*self.index(position, rotation), index)])
+
+    def best_heading(self, position: tuple[float, float]) -> float | None:
+        """
+        指定した位置で最も多くのマーカーが映る向きを返す
+        (同じ数なら、マーカーが大きく映る向きを選ぶ)
+
+        Args:
+            position (tuple[float, float]): ロボットの位置 (x, y)
+
+        Returns:
+            float | None: 向き (rad, -pi to pi). どの向きでも映らなければNone
+        """
+        i, j, _ = self.index(position, 0)
+        sizes = self.pixel_sizes[i, j].astype(np.int32)
+        counts = (sizes > 0).sum(axis=1)
+        if not counts.any():
+            return None
+        k = int(np.lexsort((sizes.max(axis=1), counts))[-1])
+        return (k * 2 * np.pi / self.heading_bins + np.pi) % (2 * np.pi) - np.pi
+
+    def coverage(self, path: list[tuple[float, float]], step: float = 100) -> float:
+        """
+        経路を進行方向を向いて進んだとき、マーカーが1つ以上映っている区間の割合
+        経路や進む向きの候補を比べるのに使う
+
+        Args:
+            path (list[tuple[float, float]]): 経路
+            step (float, optional): 経路上の点を調べる間隔 (mm). デフォルトは100.
+
+        Returns:
+            float: 割合 (0 to 1, 経路が点だけなら0)
+        """
+        seen = total = 0
+        for (sx, sy), (ex, ey) in zip(path, path[1:]):
+            length = np.hypot(ex - sx, ey - sy)
+            if not length:
+                continue
+            rotation = np.arctan2(ey - sy, ex - sx)
+            for s in np.arange(0, length, step):
+                point = (sx + (ex - sx) * s / length, sy + (ey - sy) * s / length)
+                seen += bool(self.visible[self.index(point, rotation)].any())
+                total += 1
+        return seen / total if total else 0.0
+
+    def save(self, path: Path) -> None:
+        """
+        表をファイルに保存する
+
+        Args:
+            path (Path): 保存先 (.npz)
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(
+            path,
+            cell_size=np.array(self.cell_size),
+            marker_ids=self.marker_ids,
+            visible=self.visible,
+            pixel_sizes=self.pixel_sizes,
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> "VisibilityMap":
+        """
+        保存した表を読み込む
+
+        Args:
+            path (Path): saveで保存したファイル
+
+        Returns:
+            VisibilityMap: 読み込んだ表
+        """
+        with np.load(path) as data:
+            return cls(
+                cell_size=float(data["cell_size"]),
+                marker_ids=data["marker_ids"],
+                visible=data["visible"],
+                pixel_sizes=data["pixel_sizes"],
+            )
+
+
+def compute_visibility(
+    stage: Stage,
+    camera_matrix: np.ndarray,
+    image_width: int,
+    marker_length: float,
+    cell_size: float = 100,
+    heading_bins: int = 36,
+    camera_offset: float = 0,
+    min_pixels: float = 12,
+    max_incidence: float = np.radians(70),
+) -> VisibilityMap:
+    """
+    ステージの各姿勢の格子で、どのマーカーがどの大きさで映るかを計算する
+    格子の中心から見て、画角に入り、正面から見て十分浅い角度で、
+    十分大きく映り、壁や障害物に遮られないマーカーを映るとみなす
+
+    Args:
+        stage (Stage): ステージ (ar_markersとsegmentsを使う)
+        camera_matrix (np.ndarray): カメラ行列
+        image_width (int): 画像の幅 (px)
+        marker_length (float): ARマーカーの一辺の長さ (m)
+        cell_size (float, optional): 格子の一辺の長さ (mm). デフォルトは100.
+        heading_bins (int, optional): 向きの分割数. デフォルトは36 (10°ごと).
+        camera_offset (float, optional): ロボット中心からカメラまでの前向きの距離 (mm). デフォルトは0.
+        min_pixels (float, optional): 検出できるマーカーの一辺の最小の長さ (px). デフォルトは12.
+        max_incidence (float, optional): マーカーの法線と視線のなす角の上限 (rad). デフォルトは70°.
+
+    Returns:
+        VisibilityMap: 計算した表
+    """
+    fx, cx = camera_matrix[0, 0], camera_matrix[0, 2]
+    # 画像の左右端の方向 (光軸からの角度)
+    fov_left, fov_right = np.arctan(cx / fx), np.arctan((image_width - cx) / fx)
+
+    nx = int(np.ceil(stage.x_size / cell_size))
+    ny = int(np.ceil(stage.y_size / cell_size))
+    xs = (np.arange(nx) + 0.5) * cell_size
+    ys = (np.arange(ny) + 0.5) * cell_size
+    centers = np.stack(np.meshgrid(xs, ys, indexing="ij"), axis=-1).reshape(-1, 1, 2)
+
+    markers = stage.ar_markers
+    marker_ids = np.array([m.marker_id for m in markers], dtype=np.int32)
+    marker_positions = np.array([m.position for m in markers], dtype=float).reshape(
+        1, -1, 2
+    )
+    normals = np.array([m.normal for m in markers], dtype=float).reshape(1, -1, 2)
+    normals /= np.linalg.norm(normals, axis=-1, keepdims=True)
+    segments = np.array([(*p, *q) for p, q in stage.segments()], dtype=float)
+
+    pixel_sizes = np.zeros((nx * ny, heading_bins, len(markers)), dtype=np.uint8)
+    for k in range(heading_bins):
+        heading = k * 2 * np.pi / heading_bins
+        direction = np.array([np.cos(heading), np.sin(heading)])
+        cameras = centers + camera_offset * direction
+        rays = marker_positions - cameras
+        distance = np.linalg.norm(rays, axis=-1)
+
+        # 光軸からの角度 (左が正) と奥行き
+        bearing = np.arctan2(rays[..., 1], rays[..., 0]) - heading
+        bearing = (bearing + np.pi) % (2 * np.pi) - np.pi
+        depth = distance * np.cos(bearing)
+        # マーカーの法線と、マーカーからカメラへの向きのなす角
+        incidence = np.arccos(
+            np.clip(-(rays * normals).sum(axis=-1) / np.maximum(distance, 1e-9), -1, 1)
+        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # 縦の辺と、法線の傾きで縮む横の辺の相乗平均
+            size = fx * marker_length * 1000 / depth * np.sqrt(np.cos(incidence))
+
+        visible = (
+            (depth > 0)
+            & (-fov_right <= bearing)
+            & (bearing <= fov_left)
+            & (incidence <= max_incidence)
+            & (size >= min_pixels)
+        )
+        visible &= ~_occluded(cameras, marker_positions, segments)
+        pixel_sizes[:, k] = np.where(visible, np.clip(np.round(size), 1, 255), 0)
+
+    pixel_sizes = pixel_sizes.reshape(nx, ny, heading_bins, len(markers))
+    return VisibilityMap(
+        cell_size=cell_size,
+        marker_ids=marker_ids,
+        visible=np.packbits(pixel_sizes > 0, axis=-1),
+        pixel_sizes=pixel_sizes,
+    )
+
+
+def cached_visibility(
+    stage: Stage,
+    digest: str,
+    camera_matrix: np.ndarray,
+    image_width: int,
+    marker_length: float = MARKER_LENGTH,
+    cache_dir: Path | None = CACHE_DIR,
+    **options: float,
+) -> VisibilityMap:
+    """
+    compute_visibilityの結果を、ステージファイルのハッシュとカメラの設定をキーにしてキャッシュする
+    (stage_loader.compile_stageと同じく、同じ配置なら次回以降は計算せずに読み込む)
+
+    Args:
+        stage (Stage): ステージ
+        digest (str): ステージファイルの内容のハッシュ (StageLayout.digest)
+        camera_matrix (np.ndarray): カメラ行列
+        image_width (int): 画像の幅 (px)
+        marker_length (float, optional): ARマーカーの一辺の長さ (m). デフォルトはMARKER_LENGTH.
+        cache_dir (Path | None, optional): キャッシュの保存先. Noneならキャッシュしない.
+        **options (float): compute_visibilityのその他の引数 (cell_size, heading_binsなど)
+
+    Returns:
+        VisibilityMap: 計算した (または読み込んだ) 表
+    """
+    settings = ":".join(
+        [
+            str(CACHE_VERSION),
+            digest,
+            np.asarray(camera_matrix, dtype=float).tobytes().hex(),
+            str(image_width),
+            str(marker_length),
+            *(f"{key}={value}" for key, value in sorted(options.items())),
+        ]
+    )
+    key = hashlib.sha256(settings.encode()).hexdigest()
+    cache_path = None if cache_dir is None else cache_dir / f"{key}.npz"
+    if cache_path is not None and cache_path.exists():
+        return VisibilityMap.load(cache_path)
+
+    visibility = compute_visibility(
+        stage, camera_matrix, image_width, marker_length, **options
+    )
+    if cache_path is not None:
+        visibility.save(cache_path)
+    return visibility
+
+
+def _occluded(
+    cameras: np.ndarray, targets: np.ndarray, segments: np.ndarray
+) -> np.ndarray:
+    """
+    カメラから各マーカーへの視線が線分に遮られるかどうか
+
+    Args:
+        cameras (np.ndarray): カメラの位置 (N, 1, 2)
+        targets (np.ndarray): マーカーの位置 (1, M, 2)
+        segments (np.ndarray): 遮る線分 (S, 4) (x1, y1, x2, y2)
+
+    Returns:
+        np.ndarray: 遮られるかどうか (N, M)
+    """
+    origin = cameras[..., None, :]
+    d = (targets - cameras)[..., None, :]
+    p = segments[:, :2] - origin
+    e = segments[:, 2:] - segments[:, :2]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        den = d[..., 0] * e[:, 1] - d[..., 1] * e[:, 0]
+        t = (p[..., 0] * e[:, 1] - p[..., 1] * e[:, 0]) / den
+        u = (p[..., 0] * d[..., 1] - p[..., 1] * d[..., 0]) / den
+    # マーカー自身が貼られている線分 (t = 1) で遮られたとはみなさない
+    hit = (np.abs(den) > 1e-9) & (t > 1e-6) & (t < 1 - 1e-6) & (u >= 0) & (u <= 1)
+    return hit.any(axis=-1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="ステージのARマーカーの見え方の表を計算してキャッシュし、経路ごとの見え方を表示する"
+    )
+    parser.add_argument("--stage", type=Path, default=STAGE_PATH)
+    parser.add_argument(
+        "--calibration",
+        type=Path,
+        default=CALIBRATION_PATH,
+        help="カメラの校正ファイル (無ければrobot_parts.cameraと同じ概算値を使う)",
+    )
+    parser.add_argument("--marker-length", type=float, default=MARKER_LENGTH)
+    parser.add_argument("--cell-size", type=float, default=100)
+    parser.add_argument("--heading-bins", type=int, default=36)
+    parser.add_argument("--camera-offset", type=float, default=0)
+    args = parser.parse_args()
+
+    if args.calibration.exists():
+        calibration = Calibration.load(args.calibration)
+        camera_matrix, image_width = (
+            calibration.camera_matrix,
+            calibration.image_size[0],
+        )
+    else:
+        print(f"校正ファイルが無いので概算のカメラ行列を使います: {args.calibration}")
+        camera_matrix = np.array([[600, 0, 320], [0, 600, 240], [0, 0, 1]], dtype=float)
+        image_width = 640
+
+    from main import create_stage
+
+    async def build() -> Stage:
+        # Handの初期化でタスクを作るため、ステージはイベントループの中で作る
+        return create_stage(layout)
+
+    layout = read_layout(args.stage)
+    stage = asyncio.run(build())
+    visibility = cached_visibility(
+        stage,
+        layout.digest,
+        camera_matrix,
+        image_width,
+        args.marker_length,
+        cell_size=args.cell_size,
+        heading_bins=args.heading_bins,
+        camera_offset=args.camera_offset,
+    )
+    seen = visibility.visible.any(axis=-1)
+    print(
+        f"マーカー{len(visibility.marker_ids)}個, 格子{seen.shape}, "
+        f"1つ以上映る姿勢 {seen.mean():.1%}"
+    )
+    compiled = compile_stage(stage, layout.digest)
+    for (start, end), route in compiled.routes.items():
+        print(f"  {start}->{end}: 映る区間 {visibility.coverage(route):.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+import argparse
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import cv2
+import cv2.aruco as aruco
+import numpy as np
+from cv2.typing import MatLike
+
+CALIBRATION_PATH = Path(__file__).resolve().parents[2] / "config" / "camera.npz"
+
+SUBPIX_CRITERIA = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
+
+
+@dataclass
+class Calibration:
+    """
+    カメラの内部パラメータ
+    Attributes:
+        camera_matrix (np.ndarray): カメラ行列 (3, 3)
+        dist_coeffs (np.ndarray): 歪み係数
+        image_size (tuple[int, int]): 校正に使った画像サイズ (width, height)
+        rms (float): 再投影誤差 (px)
+    """
+
+    camera_matrix: np.ndarray
+    dist_coeffs: np.ndarray
+    image_size: tuple[int, int]
+    rms: float = 0
+
+    def save(self, path: Path = CALIBRATION_PATH) -> None:
+        """
+        校正結果をファイルに保存する
+
+        Args:
+            path (Path, optional): 保存先. デフォルトはCALIBRATION_PATH.
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(
+            path,
+            camera_matrix=self.camera_matrix,
+            dist_coeffs=self.dist_coeffs,
+            image_size=np.array(self.image_size),
+            rms=np.array(self.rms),
+        )
+
+    @classmethod
+    def load(
+        cls,
+        path: Path = CALIBRATION_PATH,
+        image_size: tuple[int, int] | None = None,
+    ) -> "Calibration":
+        """
+        保存した校正結果を読み込む
+
+        Args:
+            path (Path, optional): 読み込むファイル. デフォルトはCALIBRATION_PATH.
+            image_size (tuple[int, int] | None, optional): 使う画像サイズ (width, height). デフォルトはNone (確かめない).
+
+        Returns:
+            Calibration: 校正結果
+
+        Raises:
+            ValueError: 校正に使った画像サイズがimage_sizeと違う場合 (カメラ行列がそのサイズでは合わない)
+        """
+        with np.load(path) as data:
+            width, height = data["image_size"].tolist()
+            calibration = cls(
+                camera_matrix=data["camera_matrix"],
+                dist_coeffs=data["dist_coeffs"],
+                image_size=(width, height),
+                rms=float(data["rms"]),
+            )
+        if image_size is not None and calibration.image_size != tuple(image_size):
+            raise ValueError(
+                f"校正した画像サイズ {calibration.image_size} が"
+                f"撮影する画像サイズ {tuple(image_size)} と違います: {path}"
+            )
+        return calibration
+
+    def undistort_maps(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        remap用の歪み補正テーブルを作る
+        補正後の画像は返り値のカメラ行列を持ち、歪みは0になる
+
+        Returns:
+            tuple[np.ndarray, np.ndarray, np.ndarray]: (map1, map2, 補正後のカメラ行列)
+        """
+        new_matrix, _ = cv2.getOptimalNewCameraMatrix(
+            self.camera_matrix, self.dist_coeffs, self.image_size, 0
+        )
+        map1, map2 = cv2.initUndistortRectifyMap(
+            self.camera_matrix,
+            self.dist_coeffs,
+            None,
+            new_matrix,
+            self.image_size,
+            cv2.CV_16SC2,
+        )
+        return map1, map2, new_matrix
+
+
+def calibrate_checkerboard(
+    images: Iterable[MatLike], pattern_size: tuple[int, int], square_size: float
+) -> Calibration:
+    """
+    チェッカーボードを写した画像からカメラを校正する
+
+    Args:
+        images (Iterable[MatLike]): グレースケール画像
+        pattern_size (tuple[int, int]): 内側の交点の数 (列, 行)
+        square_size (float): マス目の一辺の長さ (m)
+
+    Returns:
+        Calibration: 校正結果
+    """
+    cols, rows = pattern_size
+    board = np.zeros((cols * rows, 3), dtype=np.float32)
+    board[:, :2] = np.mgrid[0:cols, 0:rows].T.reshape(-1, 2) * square_size
+
+    object_points: list[np.ndarray] = []
+    image_points: list[MatLike] = []
+    image_size: tuple[int, int] | None = None
+    for gray in images:
+        image_size = (gray.shape[1], gray.shape[0])
+        found, corners = cv2.findChessboardCorners(gray, pattern_size)
+        if not found:
+            continue
+        cv2.cornerSubPix(gray, corners, (11, 11), (-1, -1), SUBPIX_CRITERIA)
+        object_points.append(board)
+        image_points.append(corners)
+
+    return _calibrate(object_points, image_points, image_size)
+
+
+def calibrate_charuco(
+    images: Iterable[MatLike],
+    board_size: tuple[int, int],
+    square_length: float,
+    marker_length: float,
+    dictionary: int = aruco.DICT_4X4_50,
+) -> Calibration:
+    """
+    ChArUcoボードを写した画像からカメラを校正する
+    ボードの一部しか写っていない画像も使える
+
+    Args:
+        images (Iterable[MatLike]): グレースケール画像
+        board_size (tuple[int, int]): マス目の数 (列, 行)
+        square_length (float): マス目の一辺の長さ (m)
+        marker_length (float): マーカーの一辺の長さ (m)
+        dictionary (int, optional): ArUco辞書. デフォルトはDICT_4X4_50.
+
+    Returns:
+        Calibration: 校正結果
+    """
+    board = aruco.CharucoBoard(
+        board_size,
+        square_length,
+        marker_length,
+        aruco.getPredefinedDictionary(dictionary),
+    )
+    detector = aruco.CharucoDetector(board)
+
+    object_points: list[np.ndarray] = []
+    image_points: list[MatLike] = []
+    image_size: tuple[int, int] | None = None
+    for gray in images:
+        image_size = (gray.shape[1], gray.shape[0])
+        corners, ids, _, _ = detector.detectBoard(gray)
+        if ids is None or len(ids) < 6:
+            continue
+        obj, img = board.matchImagePoints(corners, ids)
+        object_points.append(obj)
+        image_points.append(img)
+
+    return _calibrate(object_points, image_points, image_size)
+
+
+def _calibrate(
+    object_points: list[np.ndarray],
+    image_points: list[MatLike],
+    image_size: tuple[int, int] | None,
+) -> Calibration:
+    if image_size is None or len(object_points) < 3:
+        raise ValueError("校正に使える画像が足りません (3枚以上必要です)")
+
+    rms, camera_matrix, dist_coeffs, _, _ = cv2.calibrateCamera(
+        object_points, image_points, image_size, None, None
+    )
+    return Calibration(camera_matrix, dist_coeffs, image_size, rms)
+
+
+def read_images(paths: Iterable[Path]) -> Iterator[np.ndarray]:
+    """
+    校正用の画像をグレースケールで読み込む (読み込めないファイルは警告を表示して飛ばす)
+
+    Args:
+        paths (Iterable[Path]): 画像ファイル
+
+    Returns:
+        Iterator[np.ndarray]: グレースケール画像
+    """
+    for path in paths:
+        image = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            print(f"画像を読み込めないので飛ばします: {path}")
+            continue
+        yield image
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="録画した画像からカメラを校正する")
+    parser.add_argument("board", choices=["checkerboard", "charuco"])
+    parser.add_argument("images", nargs="+", type=Path, help="校正用の画像")
+    parser.add_argument(
+        "--size", default="9x6", help="交点の数 (checkerboard) / マス目の数 (charuco)"
+    )
+    parser.add_argument("--square", type=float, default=0.025, help="マスの一辺 (m)")
+    parser.add_argument(
+        "--marker", type=float, default=0.018, help="マーカーの一辺 (m, charuco)"
+    )
+    parser.add_argument("-o", "--output", type=Path, default=CALIBRATION_PATH)
+    args = parser.parse_args()
+
+    cols, rows = (int(n) for n in args.size.split("x"))
+    size = (cols, rows)
+    images = read_images(args.images)
+    if args.board == "checkerboard":
+        calibration = calibrate_checkerboard(images, size, args.square)
+    else:
+        calibration = calibrate_charuco(images, size, args.square, args.marker)
+
+    calibration.save(args.output)
+    print(f"再投影誤差: {calibration.rms:.3f}px")
+    print(f"カメラ行列:\n{calibration.camera_matrix}")
+    print(f"歪み係数: {calibration.dist_coeffs.ravel()}")
+    print(f"保存先: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+import asyncio
+import multiprocessing as mp
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from multiprocessing.shared_memory import SharedMemory
+from multiprocessing.synchronize import Event
+from typing import Callable, Literal
+
+import cv2.aruco as aruco
+import numpy as np
+
+from vision.pose import MarkerPoses, estimate_poses
+from vision.source import FrameSource, to_gray
+from vision.tuner import detector_parameters
+
+_Message = tuple[int, Literal["result", "drop", "end"], object]
+
+
+@dataclass
+class DetectorConfig:
+    """
+    検出プロセスで使う検出器と姿勢推定の設定
+    Attributes:
+        camera_matrix (np.ndarray): カメラ行列
+        dist_coeffs (np.ndarray | None): 歪み係数
+        marker_length (float): ARマーカーの一辺の長さ (m)
+        dictionary (int): ArUco辞書
+        parameters (dict[str, float]): DetectorParametersに設定する値 (load_detector_parametersの返り値など)
+    """
+
+    camera_matrix: np.ndarray
+    dist_coeffs: np.ndarray | None
+    marker_length: float
+    dictionary: int = aruco.DICT_4X4_50
+    parameters: dict[str, float] = field(default_factory=dict)
+
+    def create_detector(self) -> aruco.ArucoDetector:
+        return aruco.ArucoDetector(
+            aruco.getPredefinedDictionary(self.dictionary),
+            detector_parameters(self.parameters),
+        )
+
+
+@dataclass
+class VisionResult:
+    """
+    1フレーム分の検出結果
+    Attributes:
+        seq (int): フレームの通し番号
+        timestamp (float): 撮影時刻 (time.monotonic())
+        poses (MarkerPoses): 検出したマーカーの姿勢
+    """
+
+    seq: int
+    timestamp: float
+    poses: MarkerPoses
+
+
+class VisionPipeline:
+    """
+    撮影プロセスと複数の検出プロセスでARマーカーを並列に検出するクラス
+    フレームは共有メモリのスロットで受け渡し、検出が追いつかない場合は
+    待たせずに最も古い未処理フレームを捨てる
+    結果は撮影順に並べ替えて返す
+
+    例: VisionPipeline(functools.partial(open_picamera, (640, 480), "YUV420"), config)
+    """
+
+    __source_factory: Callable[[], FrameSource]
+    __config: DetectorConfig
+    __size: tuple[int, int]
+    __workers: int
+    __slots: int
+
+    __memory: SharedMemory | None
+    __stop: Event | None
+    __processes: list[mp.process.BaseProcess]
+    __results: "mp.Queue[_Message]"
+    __lock: threading.Lock
+    __pending: dict[int, VisionResult | None]
+    __next_seq: int
+    __finished_at: int | None
+
+    def __init__(
+        self,
+        source_factory: Callable[[], FrameSource],
+        config: DetectorConfig,
+        size: tuple[int, int] = (640, 480),
+        workers: int = 3,
+        max_pending: int = 1,
+    ):
+        """
+        Args:
+            source_factory (Callable[[], FrameSource]): 撮影プロセス内でフレームの取得元を作る関数 (pickle可能なもの)
+            config (DetectorConfig): 検出の設定
+            size (tuple[int, int], optional): 画像サイズ (width, height). デフォルトは(640, 480).
+            workers (int, optional): 検出プロセスの数. デフォルトは3.
+            max_pending (int, optional): 検出待ちで保持するフレーム数. デフォルトは1.
+        """
+        self.__source_factory = source_factory
+        self.__config = config
+        self.__size = size
+        self.__workers = workers
+        self.__slots = workers + max_pending
+        self.__memory = None
+        self.__stop = None
+        self.__processes = []
+        self.__lock = threading.Lock()
+        self.__pending = {}
+        self.__next_seq = 0
+        self.__finished_at = None
+
+    def start(self) -> None:
+        """
+        撮影プロセスと検出プロセスを起動する
+        """
+        width, height = self.__size
+        self.__memory = SharedMemory(create=True, size=self.__slots * width * height)
+        self.__stop = mp.Event()
+        free: "mp.Queue[int]" = mp.Queue()
+        for slot in range(self.__slots):
+            free.put(slot)
+        frames: "mp.Queue[tuple[int, int, float]]" = mp.Queue()
+        self.__results = mp.Queue()
+
+        self.__processes = [
+            mp.Process(
+                target=_capture,
+                args=(
+                    self.__source_factory,
+                    self.__memory.name,
+                    self.__slots,
+                    self.__size,
+                    free,
+                    frames,
+                    self.__results,
+                    self.__stop,
+                ),
+                daemon=True,
+            )
+        ]
+        self.__processes += [
+            mp.Process(
+                target=_detect,
+                args=(
+                    self.__config,
+                    self.__memory.name,
+                    self.__slots,
+                    self.__size,
+                    free,
+                    frames,
+                    self.__results,
+                    self.__stop,
+                ),
+                daemon=True,
+            )
+            for _ in range(self.__workers)
+        ]
+        for process in self.__processes:
+            process.start()
+
+    def stop(self) -> None:
+        """
+        全てのプロセスを止めて共有メモリを解放する
+        """
+        if self.__stop is not None:
+            self.__stop.set()
+        for process in self.__processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+        self.__processes = []
+        if self.__memory is not None:
+            self.__memory.close()
+            self.__memory.unlink()
+            self.__memory = None
+
+    def get(self, timeout: float | None = None) -> VisionResult | None:
+        """
+        次の検出結果を撮影順に取り出す (捨てたフレームは飛ばす)
+        nextがスレッドから呼ぶので、並べ替えの状態はロックで守る
+
+        Args:
+            timeout (float | None, optional): 待つ最大時間 (s). デフォルトはNone (無制限).
+
+        Returns:
+            VisionResult | None: 検出結果. タイムアウトまたは撮影が終わったらNone
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.__lock:
+            return self.__get(deadline)
+
+    def __get(self, deadline: float | None) -> VisionResult | None:
+        """
+        getの本体 (ロックを取ってから呼ぶ)
+        """
+        while True:
+            while self.__next_seq in self.__pending:
+                result = self.__pending.pop(self.__next_seq)
+                self.__next_seq += 1
+                if result is not None:
+                    return result
+            if self.__finished_at is not None and self.__next_seq >= self.__finished_at:
+                return None
+
+            remaining = None if deadline is None else deadline - time.monotonic()
+            try:
+                if remaining is not None and remaining <= 0:
+                    seq, kind, payload = self.__results.get_nowait()
+                else:
+                    seq, kind, payload = self.__results.get(timeout=remaining)
+            except queue.Empty:
+                return None
+            if kind == "end":
+                self.__finished_at = seq
+            else:
+                self.__pending[seq] = payload if kind == "result" else None
+
+    def latest(self, timeout: float | None = None) -> VisionResult | None:
+        """
+        溜まっている検出結果を読み捨て、最新のものだけを返す
+
+        Args:
+            timeout (float | None, optional): 結果が1つも無い場合に待つ最大時間 (s). デフォルトはNone (無制限).
+
+        Returns:
+            VisionResult | None: 最新の検出結果. タイムアウトまたは撮影が終わったらNone
+        """
+        result = self.get(timeout)
+        while result is not None:
+            newer = self.get(timeout=0)
+            if newer is None:
+                break
+            result = newer
+        return result
+
+    async def next(self) -> VisionResult | None:
+        """
+        イベントループを止めずに次の検出結果を待つ非同期メソッド
+
+        Returns:
+            VisionResult | None: 検出結果. 撮影が終わったらNone
+        """
+        return await asyncio.to_thread(self.get)
+
+    def __enter__(self) -> "VisionPipeline":
+        self.start()
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.stop()
+
+
+def _slots(memory: SharedMemory, slots: int, size: tuple[int, int]) -> np.ndarray:
+    width, height = size
+    return np.ndarray((slots, height, width), dtype=np.uint8, buffer=memory.buf)
+
+
+def _capture(
+    source_factory: Callable[[], FrameSource],
+    memory_name: str,
+    slots: int,
+    size: tuple[int, int],
+    free: "mp.Queue[int]",
+    frames: "mp.Queue[tuple[int, int, float]]",
+    results: "mp.Queue[_Message]",
+    stop: Event,
+) -> None:
+    """
+    撮影プロセス: フレームを空きスロットに書き込み、検出プロセスへ渡す
+    空きが無ければ最も古い未処理フレームのスロットを奪って使う
+    """
+    memory = SharedMemory(name=memory_name)
+    buffers = _slots(memory, slots, size)
+    source = source_factory()
+    source.start()
+    seq = 0
+    try:
+        while not stop.is_set():
+            try:
+                frame = source.capture_array()
+            except EOFError:
+                break
+            timestamp = time.monotonic()
+
+            try:
+                slot = free.get_nowait()
+            except queue.Empty:
+                try:
+                    stale_seq, slot, _ = frames.get_nowait()
+                    results.put((stale_seq, "drop", None))
+                except queue.Empty:
+                    slot = free.get()
+
+            gray = to_gray(frame, size, buffers[slot])
+            if not np.shares_memory(gray, buffers[slot]):
+                buffers[slot] = gray
+            frames.put((seq, slot, timestamp))
+            seq += 1
+    finally:
+        results.put((seq, "end", None))
+        source.stop()
+        del buffers
+        memory.close()
+
+
+def _detect(
+    config: DetectorConfig,
+    memory_name: str,
+    slots: int,
+    size: tuple[int, int],
+    free: "mp.Queue[int]",
+    frames: "mp.Queue[tuple[int, int, float]]",
+    results: "mp.Queue[_Message]",
+    stop: Event,
+) -> None:
+    """
+    検出プロセス: スロットのフレームからマーカーを検出して結果を返す
+    """
+    memory = SharedMemory(name=memory_name)
+    buffers = _slots(memory, slots, size)
+    detector = config.create_detector()
+    try:
+        while not stop.is_set():
+            try:
+                seq, slot, timestamp = frames.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            corners, ids, _ = detector.detectMarkers(buffers[slot])
+            free.put(slot)
+            poses = estimate_poses(
+                corners,
+                ids,
+                config.camera_matrix,
+                config.dist_coeffs,
+                config.marker_length,
+            )
+            results.put((seq, "result", VisionResult(seq, timestamp, poses)))
+    finally:
+        del buffers
+        memory.close()
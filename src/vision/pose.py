@@ -0,0 +1,215 @@
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+from cv2.typing import MatLike
+
+
+@dataclass
+class MarkerPoses:
+    """
+    1フレーム分のARマーカーの姿勢推定結果
+    Attributes:
+        ids (np.ndarray): ARマーカーの識別子 (N,)
+        positions (np.ndarray): カメラ座標系でのマーカー中心の位置 (N, 3) (mm, x: 右, y: 下, z: 前)
+        rotations (np.ndarray): マーカー座標系からカメラ座標系への回転行列 (N, 3, 3)
+        yaw (np.ndarray): カメラの水平面内でのマーカーの向き (N,) (rad, 正対で0)
+    """
+
+    ids: np.ndarray
+    positions: np.ndarray
+    rotations: np.ndarray
+    yaw: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+def estimate_poses(
+    corners: list[MatLike] | tuple[MatLike, ...],
+    ids: MatLike | None,
+    camera_matrix: np.ndarray,
+    dist_coeffs: np.ndarray | None,
+    marker_length: float,
+) -> MarkerPoses:
+    """
+    検出した全てのARマーカーの姿勢を一括で推定する
+    IPPEで各マーカーの2つの姿勢候補を求め、再投影誤差の小さい方を採用する
+    マーカーごとのsolvePnP呼び出しが不要になる
+
+    Args:
+        corners (list[MatLike] | tuple[MatLike, ...]): detectMarkersが返す四隅
+        ids (MatLike | None): detectMarkersが返す識別子
+        camera_matrix (np.ndarray): カメラ行列
+        dist_coeffs (np.ndarray | None): 歪み係数
+        marker_length (float): ARマーカーの一辺の長さ (m)
+
+    Returns:
+        MarkerPoses: 推定結果 (推定できなかったマーカーは含まない)
+    """
+    if ids is None or len(corners) == 0:
+        return MarkerPoses(
+            ids=np.empty(0, dtype=np.int32),
+            positions=np.empty((0, 3)),
+            rotations=np.empty((0, 3, 3)),
+            yaw=np.empty(0),
+        )
+
+    points = np.concatenate(corners).reshape(-1, 1, 2).astype(np.float64)
+    normalized = cv2.undistortPoints(points, camera_matrix, dist_coeffs)
+    rotations, translations, _ = solve_ippe(normalized.reshape(-1, 4, 2), marker_length)
+    rotations, t = rotations[:, 0], translations[:, 0]
+
+    valid = np.isfinite(t).all(axis=1) & np.isfinite(rotations).all(axis=(1, 2))
+    rotations = rotations[valid]
+    return MarkerPoses(
+        ids=np.asarray(ids).reshape(-1)[valid],
+        positions=t[valid] * 1000,
+        rotations=rotations,
+        yaw=np.arctan2(rotations[:, 0, 2], -rotations[:, 2, 2]),
+    )
+
+
+def solve_ippe(
+    quads: np.ndarray, marker_length: float
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    正規化画像座標の四隅から、IPPE (Collins & Bartoli, 2014) で各マーカーの姿勢を一括で求める
+    平面の姿勢は鏡像の2通りの解を持つので、両方を再投影誤差の小さい順に返す
+
+    Args:
+        quads (np.ndarray): 正規化画像座標でのマーカーの四隅 (N, 4, 2) (左上から時計回り)
+        marker_length (float): ARマーカーの一辺の長さ (m)
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: 回転行列 (N, 2, 3, 3), 並進 (N, 2, 3) (m), 再投影誤差の二乗和 (N, 2)
+    """
+    homographies = _square_to_quad(quads) @ _model_to_square(marker_length)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        homographies /= homographies[:, 2:, 2:]
+    # 潰れた四角形は計算が破綻しないよう単位行列に置き換え、最後に無効 (NaN) にする
+    valid = np.isfinite(homographies).all(axis=(1, 2))
+    homographies[~valid] = np.eye(3)
+    quads = np.where(valid[:, None, None], quads, _model_points(1)[:, :2])
+
+    # マーカー中心 (原点) の像と、そこでのホモグラフィのヤコビアン
+    h = homographies
+    h00, h01, p = h[:, 0, 0], h[:, 0, 1], h[:, 0, 2]
+    h10, h11, q = h[:, 1, 0], h[:, 1, 1], h[:, 1, 2]
+    h20, h21 = h[:, 2, 0], h[:, 2, 1]
+    j00, j01 = h00 - h20 * p, h01 - h21 * p
+    j10, j11 = h10 - h20 * q, h11 - h21 * q
+
+    # 視線 (p, q, 1) をz軸に重ねる回転 Rv
+    n = len(quads)
+    norm = np.hypot(p, q)
+    cos = 1 / np.sqrt(norm * norm + 1)
+    sin = norm * cos
+    with np.errstate(divide="ignore", invalid="ignore"):
+        kx = np.where(norm > 1e-12, p / norm, 0.0)
+        ky = np.where(norm > 1e-12, q / norm, 0.0)
+    rv = np.empty((n, 3, 3))
+    rv[:, 0] = np.stack([(cos - 1) * kx * kx + 1, (cos - 1) * kx * ky, kx * sin], 1)
+    rv[:, 1] = np.stack([(cos - 1) * kx * ky, (cos - 1) * ky * ky + 1, ky * sin], 1)
+    rv[:, 2] = np.stack([-kx * sin, -ky * sin, cos], 1)
+
+    # A = B^-1 J の最大特異値で割ると、回転の左上2x2になる
+    b = rv[:, :2, :2] - np.stack([p, q], 1)[:, :, None] * rv[:, 2:, :2]
+    j = np.stack([np.stack([j00, j01], 1), np.stack([j10, j11], 1)], 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        a = np.linalg.solve(b, j)
+        ata = a @ a.transpose(0, 2, 1)
+        trace, diff = ata[:, 0, 0] + ata[:, 1, 1], ata[:, 0, 0] - ata[:, 1, 1]
+        gamma = np.sqrt((trace + np.hypot(diff, 2 * ata[:, 0, 1])) / 2)
+        r = a / gamma[:, None, None]
+
+    # 回転の3行目の成分は符号の違う2通り (鏡像の解) がある
+    b0 = np.sqrt(np.clip(1 - r[:, 0, 0] ** 2 - r[:, 1, 0] ** 2, 0, None))
+    b1 = np.sqrt(np.clip(1 - r[:, 0, 1] ** 2 - r[:, 1, 1] ** 2, 0, None))
+    b1 = np.where(r[:, 0, 0] * r[:, 0, 1] + r[:, 1, 0] * r[:, 1, 1] > 0, -b1, b1)
+    rotations = np.empty((n, 2, 3, 3))
+    for k, sign in enumerate((1.0, -1.0)):
+        c1 = np.stack([r[:, 0, 0], r[:, 1, 0], sign * b0], 1)
+        c2 = np.stack([r[:, 0, 1], r[:, 1, 1], sign * b1], 1)
+        rotations[:, k] = rv @ np.stack([c1, c2, np.cross(c1, c2)], 2)
+
+    # 回転を固定すると並進は線形の最小二乗で求まる
+    model = _model_points(marker_length)
+    u, v = quads[:, None, :, 0], quads[:, None, :, 1]
+    rotated = np.einsum("nkij,mj->nkmi", rotations, model)
+    rows = np.zeros((n, 2, 8, 3))
+    rows[:, :, 0::2, 0] = 1
+    rows[:, :, 0::2, 2] = -u
+    rows[:, :, 1::2, 1] = 1
+    rows[:, :, 1::2, 2] = -v
+    rhs = np.empty((n, 2, 8))
+    rhs[:, :, 0::2] = u * rotated[..., 2] - rotated[..., 0]
+    rhs[:, :, 1::2] = v * rotated[..., 2] - rotated[..., 1]
+    normal = rows.transpose(0, 1, 3, 2)
+    translations = np.linalg.solve(normal @ rows, (normal @ rhs[..., None]))[..., 0]
+    rotations[~valid] = np.nan
+    translations[~valid] = np.nan
+
+    camera = rotated + translations[:, :, None, :]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        projected = camera[..., :2] / camera[..., 2:]
+    errors = ((projected - quads[:, None]) ** 2).sum(axis=(2, 3))
+    errors = np.where(np.isfinite(errors), errors, np.inf)
+
+    order = np.argsort(errors, axis=1)
+    take = order[:, :, None, None]
+    return (
+        np.take_along_axis(rotations, take, axis=1),
+        np.take_along_axis(translations, order[:, :, None], axis=1),
+        np.take_along_axis(errors, order, axis=1),
+    )
+
+
+def _model_points(marker_length: float) -> np.ndarray:
+    """
+    マーカー座標 (中心原点, 左上から時計回り) での四隅 (4, 3)
+    """
+    half = marker_length / 2
+    return np.array(
+        [[-half, half, 0], [half, half, 0], [half, -half, 0], [-half, -half, 0]]
+    )
+
+
+def _model_to_square(marker_length: float) -> np.ndarray:
+    """
+    マーカー座標 (中心原点, 左上から時計回り) を単位正方形へ写す行列
+    """
+    return np.array(
+        [
+            [1 / marker_length, 0, 0.5],
+            [0, -1 / marker_length, 0.5],
+            [0, 0, 1],
+        ]
+    )
+
+
+def _square_to_quad(quads: np.ndarray) -> np.ndarray:
+    """
+    単位正方形 (0,0), (1,0), (1,1), (0,1) を各四角形へ写すホモグラフィを求める
+
+    Args:
+        quads (np.ndarray): 四角形の頂点 (N, 4, 2)
+
+    Returns:
+        np.ndarray: ホモグラフィ (N, 3, 3)
+    """
+    x0, x1, x2, x3 = (quads[:, i, 0] for i in range(4))
+    y0, y1, y2, y3 = (quads[:, i, 1] for i in range(4))
+    dx1, dx2, dx3 = x1 - x2, x3 - x2, x0 - x1 + x2 - x3
+    dy1, dy2, dy3 = y1 - y2, y3 - y2, y0 - y1 + y2 - y3
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        den = dx1 * dy2 - dx2 * dy1
+        g = (dx3 * dy2 - dx2 * dy3) / den
+        h = (dx1 * dy3 - dx3 * dy1) / den
+
+    homographies = np.empty((len(quads), 3, 3))
+    homographies[:, 0] = np.stack([x1 - x0 + g * x1, x3 - x0 + h * x3, x0], axis=1)
+    homographies[:, 1] = np.stack([y1 - y0 + g * y1, y3 - y0 + h * y3, y0], axis=1)
+    homographies[:, 2] = np.stack([g, h, np.ones_like(g)], axis=1)
+    return homographies
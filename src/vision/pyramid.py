@@ -0,0 +1,108 @@
+import cv2
+import cv2.aruco as aruco
+import numpy as np
+from cv2.typing import MatLike
+
+from vision.tracking import Detection
+
+SUBPIX_CRITERIA = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 0.01)
+
+
+class PyramidDetector:
+    """
+    縮小画像でARマーカーを検出し、見つかったマーカーの四隅だけを
+    元の解像度で補正する検出器
+    縮小率は前回検出したマーカーの画素サイズから決める
+    縮小画像では小さく写ったマーカーが見えないので、full_intervalフレームごとに元の解像度でも探す
+    """
+
+    __detector: aruco.ArucoDetector
+    __target_side: float
+    __min_scale: float
+    __full_interval: int
+
+    __last_side: float | None
+    __since_full: int
+
+    def __init__(
+        self,
+        detector: aruco.ArucoDetector,
+        target_side: float = 48,
+        min_scale: float = 0.25,
+        full_interval: int = 10,
+    ):
+        """
+        Args:
+            detector (aruco.ArucoDetector): 検出に使用するArucoDetector
+            target_side (float, optional): 縮小画像上でのマーカーの一辺の目標画素数. デフォルトは48.
+            min_scale (float, optional): 縮小率の下限. デフォルトは0.25.
+            full_interval (int, optional): 元の解像度で探し直すまでの縮小画像での検出回数. デフォルトは10.
+        """
+        self.__detector = detector
+        self.__target_side = target_side
+        self.__min_scale = min_scale
+        self.__full_interval = full_interval
+        self.__last_side = None
+        self.__since_full = 0
+
+    @property
+    def scale(self) -> float:
+        """
+        次の検出で使う縮小率 (1で縮小なし)
+        """
+        if self.__last_side is None:
+            return 1.0
+        scale = self.__target_side / self.__last_side
+        return float(np.clip(scale, self.__min_scale, 1.0))
+
+    def detect(self, gray: MatLike) -> Detection:
+        """
+        グレースケール画像からARマーカーを検出する
+        縮小画像で見つからない場合と、full_intervalフレームごとには元の解像度で探す
+        (近くのマーカーが見えている間に現れた遠くの小さなマーカーも見逃さない)
+
+        Args:
+            gray (MatLike): グレースケール画像
+
+        Returns:
+            Detection: detectMarkersと同じ形式の (corners, ids)
+        """
+        scale = self.scale
+        if scale < 1.0 and self.__since_full < self.__full_interval:
+            self.__since_full += 1
+            small = cv2.resize(
+                gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA
+            )
+            corners, ids, _ = self.__detector.detectMarkers(small)
+            if ids is not None:
+                corners = self.__refine(gray, corners, scale)
+                self.__update(corners)
+                return corners, ids
+
+        self.__since_full = 0
+        corners, ids, _ = self.__detector.detectMarkers(gray)
+        if ids is None:
+            self.__last_side = None
+            return [], None
+        corners = list(corners)
+        self.__update(corners)
+        return corners, ids
+
+    def __refine(
+        self, gray: MatLike, corners: tuple[MatLike, ...], scale: float
+    ) -> list[np.ndarray]:
+        """
+        縮小画像での四隅を元の解像度に戻し、サブピクセル精度で補正する
+        """
+        points = np.concatenate(corners).reshape(-1, 1, 2) / np.float32(scale)
+        window = int(np.ceil(1 / scale)) + 2
+        cv2.cornerSubPix(gray, points, (window, window), (-1, -1), SUBPIX_CRITERIA)
+        return list(points.reshape(-1, 1, 4, 2))
+
+    def __update(self, corners: list[np.ndarray]) -> None:
+        """
+        最も小さく写ったマーカーの一辺の画素数を記録する
+        """
+        points = np.concatenate(corners).reshape(-1, 4, 2)
+        sides = np.linalg.norm(points - np.roll(points, 1, axis=1), axis=2)
+        self.__last_side = float(sides.mean(axis=1).min())
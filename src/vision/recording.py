@@ -0,0 +1,152 @@
+import time
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+Pose = tuple[tuple[float, float], float]
+
+
+def _record_dtype(frame_shape: tuple[int, ...]) -> np.dtype:
+    return np.dtype(
+        [
+            ("timestamp", np.float64),
+            ("pose", np.float64, 3),
+            ("frame", np.uint8, frame_shape),
+        ]
+    )
+
+
+class FrameRecorder:
+    """
+    カメラのフレームを時刻とロボットの姿勢と一緒にメモリマップしたNumPyファイル (.npy) へ書き出すクラス
+    ファイルは最初にcapacity枚分確保し、未使用のレコードは時刻をNaNにしておく
+    """
+
+    __path: Path
+    __capacity: int
+    __records: np.memmap | None
+    __count: int
+
+    def __init__(self, path: Path, capacity: int = 1000):
+        """
+        Args:
+            path (Path): 書き出し先
+            capacity (int, optional): 記録できる最大フレーム数. デフォルトは1000.
+        """
+        self.__path = path
+        self.__capacity = capacity
+        self.__records = None
+        self.__count = 0
+
+    def __len__(self) -> int:
+        return self.__count
+
+    def record(
+        self,
+        frame: np.ndarray,
+        pose: Pose | None = None,
+        timestamp: float | None = None,
+    ) -> bool:
+        """
+        1フレームを記録する
+
+        Args:
+            frame (np.ndarray): カメラのフレーム (最初のフレームで形が決まる)
+            pose (Pose | None, optional): 撮影時のロボットの ((x, y), rotation). デフォルトはNone (不明).
+            timestamp (float | None, optional): 撮影時刻 (s). デフォルトはNone (time.monotonic()).
+
+        Returns:
+            bool: 記録できたかどうか (容量を超えたら記録しない)
+        """
+        if self.__records is None:
+            self.__path.parent.mkdir(parents=True, exist_ok=True)
+            self.__records = open_memmap(
+                self.__path,
+                mode="w+",
+                dtype=_record_dtype(frame.shape),
+                shape=(self.__capacity,),
+            )
+            self.__records["timestamp"] = np.nan
+        if self.__count >= self.__capacity:
+            return False
+
+        record = self.__records[self.__count]
+        record["timestamp"] = time.monotonic() if timestamp is None else timestamp
+        record["pose"] = (np.nan,) * 3 if pose is None else (*pose[0], pose[1])
+        record["frame"] = frame
+        self.__count += 1
+        return True
+
+    def close(self) -> None:
+        """
+        書き込みを確定してファイルを閉じる
+        """
+        if self.__records is not None:
+            self.__records.flush()
+            self.__records = None
+
+
+class ReplaySource:
+    """
+    FrameRecorderで記録したファイルをPicamera2の代わりに再生するクラス
+    フレームはメモリマップのビューとして返すため、デコードもコピーも発生しない
+    Attributes:
+        timestamps (np.ndarray): 各フレームの撮影時刻 (N,)
+        poses (np.ndarray): 各フレームの撮影時のロボットの姿勢 (N, 3) (x, y, rotation)
+        frames (np.ndarray): フレーム (N, ...)
+    """
+
+    timestamps: np.ndarray
+    poses: np.ndarray
+    frames: np.ndarray
+
+    __loop: bool
+    __index: int
+
+    def __init__(self, path: Path, loop: bool = True):
+        """
+        Args:
+            path (Path): FrameRecorderで記録したファイル
+            loop (bool, optional): 最後まで再生したら先頭に戻るかどうか. デフォルトはTrue.
+        """
+        records = np.load(path, mmap_mode="r")
+        unused = np.isnan(records["timestamp"])
+        count = int(np.argmax(unused)) if unused.any() else len(records)
+        records = records[:count]
+        if not count:
+            raise ValueError(f"フレームが記録されていません: {path}")
+
+        self.timestamps = records["timestamp"]
+        self.poses = records["pose"]
+        self.frames = records["frame"]
+        self.__loop = loop
+        self.__index = 0
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        return iter(self.frames)
+
+    def start(self) -> None:
+        self.__index = 0
+
+    def stop(self) -> None:
+        pass
+
+    def capture_array(self) -> np.ndarray:
+        """
+        次のフレームを返す
+
+        Returns:
+            np.ndarray: フレーム (読み取り専用のビュー)
+        """
+        if self.__index >= len(self.frames):
+            if not self.__loop:
+                raise EOFError("記録したフレームを全て再生しました")
+            self.__index = 0
+        frame = self.frames[self.__index]
+        self.__index += 1
+        return frame
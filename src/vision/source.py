@@ -0,0 +1,61 @@
+from typing import Literal, Protocol
+
+import cv2
+import numpy as np
+
+CaptureFormat = Literal["YUV420", "RGB888"]
+
+
+class FrameSource(Protocol):
+    """
+    Picamera2と同じ呼び出し方でフレームを返すもの
+    """
+
+    def start(self) -> None: ...
+
+    def stop(self) -> None: ...
+
+    def capture_array(self) -> np.ndarray: ...
+
+
+def open_picamera(size: tuple[int, int], capture_format: CaptureFormat) -> FrameSource:
+    """
+    Picamera2を設定して返す (開始はしない)
+
+    Args:
+        size (tuple[int, int]): 画像サイズ (width, height)
+        capture_format (CaptureFormat): 画像の形式
+
+    Returns:
+        FrameSource: 設定済みのPicamera2
+    """
+    from picamera2 import Picamera2
+
+    camera = Picamera2()
+    camera.configure(
+        camera.create_preview_configuration(
+            main={"size": size, "format": capture_format}
+        )
+    )
+    return camera
+
+
+def to_gray(
+    frame: np.ndarray, size: tuple[int, int], dst: np.ndarray | None = None
+) -> np.ndarray:
+    """
+    フレームをグレースケール画像にする
+    YUV420ではY平面のビューを返すため変換もコピーも発生しない
+
+    Args:
+        frame (np.ndarray): YUV420またはRGBのフレーム
+        size (tuple[int, int]): 画像サイズ (width, height)
+        dst (np.ndarray | None, optional): RGBの場合の変換先. デフォルトはNone (新しく確保する).
+
+    Returns:
+        np.ndarray: グレースケール画像
+    """
+    if frame.ndim == 2:
+        # YUV420は先頭の高さ分の行がY平面
+        return frame[: size[1], : size[0]]
+    return cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY, dst=dst)
@@ -0,0 +1,167 @@
+from dataclasses import dataclass
+
+import cv2.aruco as aruco
+import numpy as np
+from cv2.typing import MatLike
+
+Detection = tuple[list[np.ndarray], np.ndarray | None]
+
+
+@dataclass
+class _Track:
+    """
+    追跡中のARマーカーの情報
+    Attributes:
+        marker_id (int): ARマーカーの識別子
+        corners (np.ndarray): 最後に検出した四隅の画素座標 (4, 2)
+    """
+
+    marker_id: int
+    corners: np.ndarray
+
+
+class ARTracker:
+    """
+    前フレームの検出結果とロボットの移動量からマーカー周辺の領域を予測し、
+    その切り出し画像だけを検出するトラッカー
+    一定フレームごと、または追跡を失った時点で全画面検出に戻る
+    """
+
+    __detector: aruco.ArucoDetector
+    __fx: float
+    __principal: np.ndarray
+    __marker_length: float
+    __padding: float
+    __full_scan_interval: int
+
+    __tracks: list[_Track]
+    __frames_since_full_scan: int
+
+    def __init__(
+        self,
+        detector: aruco.ArucoDetector,
+        camera_matrix: np.ndarray,
+        marker_length: float,
+        padding: float = 0.5,
+        full_scan_interval: int = 15,
+    ):
+        """
+        Args:
+            detector (aruco.ArucoDetector): 検出に使用するArucoDetector
+            camera_matrix (np.ndarray): カメラ行列
+            marker_length (float): ARマーカーの一辺の長さ (m)
+            padding (float, optional): 予測領域に足す余白 (マーカーの大きさに対する比). デフォルトは0.5.
+            full_scan_interval (int, optional): 全画面検出を行う間隔 (フレーム数). デフォルトは15.
+        """
+        self.__detector = detector
+        self.__fx = float(camera_matrix[0, 0])
+        self.__principal = np.array(
+            [camera_matrix[0, 2], camera_matrix[1, 2]], dtype=np.float32
+        )
+        self.__marker_length = marker_length
+        self.__padding = padding
+        self.__full_scan_interval = full_scan_interval
+        self.__tracks = []
+        self.__frames_since_full_scan = 0
+
+    def reset(self) -> None:
+        """
+        追跡状態を破棄し、次のフレームで全画面検出を行う
+        """
+        self.__tracks = []
+        self.__frames_since_full_scan = 0
+
+    def detect(self, gray: MatLike, forward: float = 0, yaw: float = 0) -> Detection:
+        """
+        グレースケール画像からARマーカーを検出する
+
+        Args:
+            gray (MatLike): グレースケール画像
+            forward (float, optional): 前フレームからの前進量 (mm). デフォルトは0.
+            yaw (float, optional): 前フレームからの回転量 (rad, 反時計回りが正). デフォルトは0.
+
+        Returns:
+            Detection: detectMarkersと同じ形式の (corners, ids)
+        """
+        self.__frames_since_full_scan += 1
+        if (
+            not self.__tracks
+            or self.__frames_since_full_scan >= self.__full_scan_interval
+        ):
+            return self.__full_scan(gray)
+
+        height, width = gray.shape[:2]
+        corners: list[np.ndarray] = []
+        ids: list[int] = []
+        for track in self.__tracks:
+            predicted = self.__predict(track.corners, forward, yaw)
+            x0, y0, x1, y1 = self.__roi(predicted, width, height)
+            if x1 - x0 < 8 or y1 - y0 < 8:
+                return self.__full_scan(gray)
+
+            roi_corners, roi_ids, _ = self.__detector.detectMarkers(gray[y0:y1, x0:x1])
+            if roi_ids is None or track.marker_id not in roi_ids:
+                # 一つでも見失ったら全画面から探し直す
+                return self.__full_scan(gray)
+
+            index = int(np.flatnonzero(roi_ids.ravel() == track.marker_id)[0])
+            found = roi_corners[index].reshape(4, 2) + np.float32((x0, y0))
+            track.corners = found
+            corners.append(found.reshape(1, 4, 2))
+            ids.append(track.marker_id)
+
+        return corners, np.array(ids, dtype=np.int32).reshape(-1, 1)
+
+    def __full_scan(self, gray: MatLike) -> Detection:
+        corners, ids, _ = self.__detector.detectMarkers(gray)
+        self.__frames_since_full_scan = 0
+        if ids is None:
+            self.__tracks = []
+            return [], None
+
+        self.__tracks = [
+            _Track(int(marker_id), corner.reshape(4, 2).copy())
+            for corner, marker_id in zip(corners, ids.ravel())
+        ]
+        return list(corners), ids
+
+    def __predict(self, corners: np.ndarray, forward: float, yaw: float) -> np.ndarray:
+        """
+        ロボットの移動量から次フレームでの四隅の位置を予測する
+
+        Args:
+            corners (np.ndarray): 前フレームの四隅 (4, 2)
+            forward (float): 前進量 (mm)
+            yaw (float): 回転量 (rad)
+
+        Returns:
+            np.ndarray: 予測した四隅 (4, 2)
+        """
+        predicted = corners
+        if forward:
+            side = np.linalg.norm(corners[1] - corners[0])
+            depth = self.__fx * self.__marker_length * 1000 / max(float(side), 1.0)
+            scale = depth / max(depth - forward, 1.0)
+            predicted = self.__principal + (predicted - self.__principal) * scale
+        if yaw:
+            # 左に回ると像は右へ流れる
+            predicted = predicted + np.float32((self.__fx * np.tan(yaw), 0))
+        return predicted
+
+    def __roi(
+        self, corners: np.ndarray, width: int, height: int
+    ) -> tuple[int, int, int, int]:
+        """
+        予測した四隅を余白付きで囲む切り出し領域を求める
+
+        Returns:
+            tuple[int, int, int, int]: 切り出し領域 (x0, y0, x1, y1)
+        """
+        (min_x, min_y), (max_x, max_y) = corners.min(axis=0), corners.max(axis=0)
+        pad = self.__padding * max(max_x - min_x, max_y - min_y)
+        return (
+            max(int(min_x - pad), 0),
+            max(int(min_y - pad), 0),
+            min(int(max_x + pad) + 1, width),
+            min(int(max_y + pad) + 1, height),
+        )
@@ -0,0 +1,287 @@
+import argparse
+import itertools
+import json
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable
+
+import cv2
+import cv2.aruco as aruco
+import numpy as np
+
+from vision.recording import ReplaySource
+from vision.source import to_gray
+
+DETECTOR_PARAMETERS_PATH = (
+    Path(__file__).resolve().parents[2] / "config" / "detector.json"
+)
+SAMPLE_IMAGE_PATH = Path(__file__).resolve().parents[2] / "stub" / "ar-sample.jpg"
+
+# (adaptiveThreshWinSizeMin, adaptiveThreshWinSizeMax, adaptiveThreshWinSizeStep)
+WINDOW_SIZES = [(3, 23, 10), (3, 13, 10), (5, 15, 5), (7, 7, 1), (3, 33, 10)]
+CORNER_REFINEMENTS = {
+    "none": aruco.CORNER_REFINE_NONE,
+    "subpix": aruco.CORNER_REFINE_SUBPIX,
+    "contour": aruco.CORNER_REFINE_CONTOUR,
+    "apriltag": aruco.CORNER_REFINE_APRILTAG,
+}
+MIN_PERIMETER_RATES = [0.01, 0.03, 0.06]
+
+
+def detector_parameters(values: dict[str, float]) -> aruco.DetectorParameters:
+    """
+    値の辞書からDetectorParametersを作る
+
+    Args:
+        values (dict[str, float]): DetectorParametersの属性名と値
+
+    Returns:
+        aruco.DetectorParameters: 値を設定したパラメータ
+    """
+    parameters = aruco.DetectorParameters()
+    for name, value in values.items():
+        setattr(parameters, name, value)
+    return parameters
+
+
+def load_detector_parameters(path: Path = DETECTOR_PARAMETERS_PATH) -> dict[str, float]:
+    """
+    チューナーが書き出したパラメータを読み込む
+
+    Args:
+        path (Path, optional): 読み込むファイル. デフォルトはDETECTOR_PARAMETERS_PATH.
+
+    Returns:
+        dict[str, float]: パラメータ (ファイルが無ければ空)
+    """
+    if not path.exists():
+        return {}
+    with path.open() as f:
+        return json.load(f)["parameters"]
+
+
+@dataclass
+class TuningResult:
+    """
+    1つの設定の評価結果
+    Attributes:
+        parameters (dict[str, float]): 試したパラメータ
+        detection_rate (float): 全設定で見つかったマーカーのうち検出できた割合
+        ms_per_frame (float): 1フレームあたりの検出時間 (ms)
+    """
+
+    parameters: dict[str, float]
+    detection_rate: float
+    ms_per_frame: float
+
+
+def candidates() -> list[dict[str, float]]:
+    """
+    探索するパラメータの組み合わせを列挙する
+    """
+    return [
+        {
+            "adaptiveThreshWinSizeMin": win_min,
+            "adaptiveThreshWinSizeMax": win_max,
+            "adaptiveThreshWinSizeStep": win_step,
+            "cornerRefinementMethod": refinement,
+            "minMarkerPerimeterRate": perimeter,
+        }
+        for (win_min, win_max, win_step), refinement, perimeter in itertools.product(
+            WINDOW_SIZES, CORNER_REFINEMENTS.values(), MIN_PERIMETER_RATES
+        )
+    ]
+
+
+def _recording_size(
+    shape: tuple[int, ...], size: tuple[int, int] | None
+) -> tuple[int, int]:
+    """
+    記録したフレームの形から、グレースケールにしたときのサイズ (width, height) を決める
+    (H, W) の記録は、sizeに対してYUV420 (H = height * 3 / 2) かグレースケール (H = height) のどちらかとみなす
+
+    Raises:
+        ValueError: どの形式とも判断できない場合
+    """
+    if len(shape) == 3 and shape[2] == 3:
+        # RGB
+        return shape[1], shape[0]
+    if len(shape) == 2 and size is not None:
+        width, height = size
+        if shape in ((height * 3 // 2, width), (height, width)):
+            return size
+    raise ValueError(
+        f"記録したフレームの形{shape}はサイズ{size}のYUV420, グレースケール, RGBのどれでもありません"
+    )
+
+
+def load_frames(
+    paths: Iterable[Path], size: tuple[int, int] | None
+) -> list[np.ndarray]:
+    """
+    画像ファイルとFrameRecorderの記録からグレースケールのフレームを読み込む
+
+    Args:
+        paths (Iterable[Path]): 画像ファイル (.jpg, .png など) または記録ファイル (.npy)
+        size (tuple[int, int] | None): 画像ファイルを縮小するサイズ, 記録したフレームのサイズ (width, height). Noneなら画像ファイルはそのまま (記録はRGBのみ読める).
+
+    Returns:
+        list[np.ndarray]: グレースケールのフレーム
+
+    Raises:
+        ValueError: 記録したフレームの形式が分からない場合
+    """
+    frames: list[np.ndarray] = []
+    for path in paths:
+        if path.suffix == ".npy":
+            replay = ReplaySource(path)
+            gray_size = _recording_size(replay.frames.shape[1:], size)
+            frames += [np.ascontiguousarray(to_gray(f, gray_size)) for f in replay]
+            continue
+        image = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            raise FileNotFoundError(f"画像が見つかりません: {path}")
+        if size is not None:
+            image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        frames.append(image)
+    return frames
+
+
+def evaluate(
+    frames: list[np.ndarray],
+    parameter_sets: list[dict[str, float]],
+    dictionary: int = aruco.DICT_4X4_50,
+    repeat: int = 3,
+) -> list[TuningResult]:
+    """
+    各パラメータでフレームを検出し、検出率と処理時間を測る
+    検出率の基準は、どれかの設定で見つかったマーカーIDの和集合とする
+
+    Args:
+        frames (list[np.ndarray]): グレースケールのフレーム
+        parameter_sets (list[dict[str, float]]): 試すパラメータ
+        dictionary (int, optional): ArUco辞書. デフォルトはDICT_4X4_50.
+        repeat (int, optional): 時間計測の繰り返し回数 (最小値を採る). デフォルトは3.
+
+    Returns:
+        list[TuningResult]: 評価結果 (parameter_setsと同じ順)
+    """
+    aruco_dict = aruco.getPredefinedDictionary(dictionary)
+    found: list[list[set[int]]] = []
+    times: list[float] = []
+    for values in parameter_sets:
+        detector = aruco.ArucoDetector(aruco_dict, detector_parameters(values))
+        best = np.inf
+        for _ in range(repeat):
+            start = time.perf_counter()
+            detections = [detector.detectMarkers(frame)[1] for frame in frames]
+            best = min(best, time.perf_counter() - start)
+        times.append(best * 1000 / len(frames))
+        found.append(
+            [set() if ids is None else set(ids.ravel().tolist()) for ids in detections]
+        )
+
+    reference = [set().union(*per_frame) for per_frame in zip(*found)]
+    total = max(sum(len(ids) for ids in reference), 1)
+    return [
+        TuningResult(
+            values,
+            sum(len(ids & ref) for ids, ref in zip(per_config, reference)) / total,
+            ms,
+        )
+        for values, per_config, ms in zip(parameter_sets, found, times)
+    ]
+
+
+def pareto_front(results: list[TuningResult]) -> list[TuningResult]:
+    """
+    検出率が高く処理時間が短い方向でパレート最適な結果を取り出す
+
+    Returns:
+        list[TuningResult]: パレート最適な結果 (処理時間の昇順)
+    """
+    front: list[TuningResult] = []
+    for result in sorted(results, key=lambda r: (r.ms_per_frame, -r.detection_rate)):
+        if not front or result.detection_rate > front[-1].detection_rate:
+            front.append(result)
+    return front
+
+
+def choose(front: list[TuningResult], tolerance: float = 0.0) -> TuningResult:
+    """
+    パレート最適な結果から、最高の検出率との差がtolerance以内で最も速いものを選ぶ
+    """
+    best_rate = max(r.detection_rate for r in front)
+    return next(r for r in front if r.detection_rate >= best_rate - tolerance)
+
+
+def save_detector_parameters(
+    result: TuningResult, path: Path = DETECTOR_PARAMETERS_PATH
+) -> None:
+    """
+    選んだパラメータをカメラモジュールが読み込む形式で書き出す
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w") as f:
+        json.dump(
+            {
+                "parameters": result.parameters,
+                "detection_rate": result.detection_rate,
+                "ms_per_frame": result.ms_per_frame,
+            },
+            f,
+            indent=2,
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="記録したフレームでArucoDetectorのパラメータを探索する"
+    )
+    parser.add_argument(
+        "frames",
+        nargs="*",
+        type=Path,
+        default=[SAMPLE_IMAGE_PATH],
+        help="画像ファイルまたはFrameRecorderの記録 (.npy)",
+    )
+    parser.add_argument(
+        "--size",
+        default="640x480",
+        help="画像ファイルの縮小サイズと、記録したフレームのサイズ",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--tolerance", type=float, default=0.0, help="許容する検出率の低下"
+    )
+    parser.add_argument("-o", "--output", type=Path, default=DETECTOR_PARAMETERS_PATH)
+    args = parser.parse_args()
+
+    width, height = (int(n) for n in args.size.split("x"))
+    frames = load_frames(args.frames, (width, height))
+    results = evaluate(frames, candidates(), repeat=args.repeat)
+    front = pareto_front(results)
+
+    names = {v: k for k, v in CORNER_REFINEMENTS.items()}
+    print(f"{len(frames)}フレーム, {len(results)}通りを評価 (パレート最適のみ表示)")
+    for r in front:
+        p = r.parameters
+        window = (
+            p["adaptiveThreshWinSizeMin"],
+            p["adaptiveThreshWinSizeMax"],
+            p["adaptiveThreshWinSizeStep"],
+        )
+        print(
+            f"検出率 {r.detection_rate:6.1%}  {r.ms_per_frame:7.2f}ms/frame  "
+            f"窓 {window}  補正 {names[p['cornerRefinementMethod']]}  "
+            f"最小周長 {p['minMarkerPerimeterRate']}"
+        )
+
+    chosen = choose(front, args.tolerance)
+    save_detector_parameters(chosen, args.output)
+    print(f"保存先: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
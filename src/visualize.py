@@ -1,10 +1,16 @@
+import itertools
+import weakref
 from abc import ABCMeta
-from typing import Callable
+from enum import IntEnum
+from typing import Callable, ClassVar, Iterator
 
+import numpy as np
 from matplotlib import pyplot as plt
 from matplotlib.animation import FuncAnimation
 from matplotlib.artist import Artist
 from matplotlib.axes import Axes
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 
 
 class _InstanceTracker(ABCMeta):
@@ -14,15 +20,34 @@ class _InstanceTracker(ABCMeta):
 
     def __call__(cls, *args, **kwargs):
         instance = super().__call__(*args, **kwargs)
-        VISUALIZABLES.append(instance)
+        VISUALIZABLES.add(instance)
         return instance
 
 
+class Layer(IntEnum):
+    """
+    描画するレイヤー (小さいものから順に描画する)
+    """
+
+    STAGE = 0
+    AREA = 10
+    OBSTACLE = 20
+    MARKER = 30
+    PLANNER = 40
+    ROBOT = 100
+
+
 class Visualizable(metaclass=_InstanceTracker):
     """
     MatplotlibのAxesにオブジェクトを描画するための抽象基底クラス
+    Attributes:
+        layer (Layer): 描画するレイヤー
+        dynamic (bool): アニメーションで状態が変わるかどうか (Falseなら背景として一度だけ描画する)
     """
 
+    layer: ClassVar[Layer] = Layer.STAGE
+    dynamic: ClassVar[bool] = False
+
     def visualize(self, ax: Axes) -> None:
         """
         MatplotlibのAxesにオブジェクトを描画する抽象メソッド
@@ -31,24 +56,140 @@ class Visualizable(metaclass=_InstanceTracker):
             ax (Axes): 描画先のMatplotlibのAxesオブジェクト
         """
 
+    def init_animation(self, ax: Axes) -> list[Artist]:
+        """
+        アニメーション用のArtistを作成してAxesに追加する抽象メソッド
+        Artistは一度だけ作り、以降はanimateでその場で更新する
+        (ブリッティングの都合で複数回呼ばれることがあるため、作成済みなら同じものを返すこと)
+
+        Args:
+            ax (Axes): 描画先のMatplotlibのAxesオブジェクト
+
+        Returns:
+            list[Artist]: 作成したArtistのリスト
+        """
+        return []
+
     def animate(self, ax: Axes) -> list[Artist]:
         """
-        アニメーション用にMatplotlibのAxesにオブジェクトを描画する抽象メソッド
+        init_animationで作成したArtistを現在の状態に合わせて更新する抽象メソッド
 
         Args:
             ax (Axes): 描画先のMatplotlibのAxesオブジェクト
 
         Returns:
-            list[Artist]: 描画したオブジェクトのリスト
+            list[Artist]: 更新したArtistのリスト
         """
         return []
 
 
-VISUALIZABLES: list[Visualizable] = []
+class VisualizableRegistry:
+    """
+    Visualizableを弱参照でレイヤーごとに管理するクラス
+    参照されなくなったオブジェクトは自動的に取り除かれる
+    """
+
+    __layers: dict[Layer, "weakref.WeakValueDictionary[int, Visualizable]"]
+    __counter: Iterator[int]
+
+    def __init__(self):
+        self.__layers = {}
+        self.__counter = itertools.count()
+
+    def add(self, visualizable: Visualizable) -> None:
+        """
+        Visualizableを登録する
+
+        Args:
+            visualizable (Visualizable): 登録するオブジェクト
+        """
+        layer = self.__layers.setdefault(
+            visualizable.layer, weakref.WeakValueDictionary()
+        )
+        layer[next(self.__counter)] = visualizable
+
+    def items(self, dynamic: bool | None = None) -> list[Visualizable]:
+        """
+        生きているVisualizableをレイヤー順 (同じレイヤーでは登録順) に返す
+
+        Args:
+            dynamic (bool | None, optional): 動的/静的なものだけに絞る. デフォルトはNone (全て).
+
+        Returns:
+            list[Visualizable]: Visualizableのリスト
+        """
+        return [
+            visualizable
+            for _, layer in sorted(self.__layers.items())
+            for visualizable in list(layer.values())
+            if dynamic is None or visualizable.dynamic == dynamic
+        ]
+
+    def __iter__(self) -> Iterator[Visualizable]:
+        return iter(self.items())
+
+    def __len__(self) -> int:
+        return sum(len(layer) for layer in self.__layers.values())
+
+
+VISUALIZABLES = VisualizableRegistry()
+
+
+def render_background(ax: Axes, visualizables: list[Visualizable], scale: float = 2):
+    """
+    静的なVisualizableを画面外のFigureに描画し、1枚の画像としてAxesに貼り付ける
+    再描画のたびに個々のパッチを描かずに済む
+
+    Args:
+        ax (Axes): 貼り付け先のAxes
+        visualizables (list[Visualizable]): 背景に描画するオブジェクト
+        scale (float, optional): 画面の解像度に対する背景画像の倍率. デフォルトは2.
+    """
+    fig = ax.get_figure()
+    if fig is None:
+        return
+    offscreen = Figure(dpi=fig.dpi * scale)
+    canvas = FigureCanvasAgg(offscreen)
+    off_ax = offscreen.add_axes((0, 0, 1, 1))
+    for visualizable in visualizables:
+        visualizable.visualize(off_ax)
+    off_ax.autoscale_view()
+    xlim, ylim = off_ax.get_xlim(), off_ax.get_ylim()
+
+    # 背景と同じ見た目になるようにAxesの設定を写す
+    ax.set_title(off_ax.get_title())
+    ax.set_aspect(off_ax.get_aspect(), adjustable="box")
+    if not off_ax.axison:
+        ax.axis("off")
+
+    # データ領域だけが画像いっぱいに描かれるようにする
+    width = fig.get_figwidth() * ax.get_position().width
+    offscreen.set_size_inches(
+        width, width * abs(ylim[1] - ylim[0]) / abs(xlim[1] - xlim[0])
+    )
+    off_ax.set_title("")
+    off_ax.set_aspect("auto")
+    off_ax.set_axis_off()
+    off_ax.set_xlim(xlim)
+    off_ax.set_ylim(ylim)
+    offscreen.patch.set_alpha(0)
+    canvas.draw()
+
+    ax.imshow(
+        np.asarray(canvas.buffer_rgba()).copy(),
+        extent=(*xlim, *ylim),
+        origin="upper",
+        zorder=0,
+    )
+    ax.set_xlim(xlim)
+    ax.set_ylim(ylim)
 
 
 def visualize(
-    frame_rate: int, additional_plot: Callable[[Axes], None] = lambda _: None
+    frame_rate: int,
+    additional_plot: Callable[[Axes], None] = lambda _: None,
+    before_update: Callable[[], None] = lambda: None,
+    cache_background: bool = True,
 ) -> None:
     """
     Matplotlibを使用してオブジェクトを可視化する関数
@@ -56,22 +197,41 @@ def visualize(
     Args:
         frame_rate (int): フレームレート (FPS)
         additional_plot (Callable[[Axes], None], optional): 追加の描画を行う関数. デフォルトは空の関数.
+        before_update (Callable[[], None], optional): 各フレームの更新前に呼ぶ関数. デフォルトは空の関数.
+        cache_background (bool, optional): 静的なレイヤーを1枚の画像にまとめるかどうか. デフォルトはTrue.
     """
     fig, ax = plt.subplots()
 
-    for visualizable in VISUALIZABLES:
-        visualizable.visualize(ax)
+    if cache_background:
+        render_background(ax, VISUALIZABLES.items(dynamic=False))
+        for visualizable in VISUALIZABLES.items(dynamic=True):
+            visualizable.visualize(ax)
+    else:
+        for visualizable in VISUALIZABLES:
+            visualizable.visualize(ax)
 
     additional_plot(ax)
 
+    def init() -> list[Artist]:
+        animated = []
+        for visualizable in VISUALIZABLES.items(dynamic=True):
+            animated.extend(visualizable.init_animation(ax))
+        return animated
+
     def update(_: int) -> list[Artist]:
+        before_update()
         animated = []
-        for visualizable in VISUALIZABLES:
+        for visualizable in VISUALIZABLES.items(dynamic=True):
             animated.extend(visualizable.animate(ax))
         return animated
 
     _ = FuncAnimation(
-        fig, update, frames=range(100), blit=True, interval=1000 / frame_rate
+        fig,
+        update,
+        init_func=init,
+        blit=True,
+        interval=1000 / frame_rate,
+        cache_frame_data=False,
     )
 
     plt.show()
@@ -0,0 +1,71 @@
+import asyncio
+from collections.abc import Callable, Coroutine
+from typing import Any
+
+import pytest
+
+from gpio import GPIO
+from main import create_stage
+from simulation import VirtualClockLoop
+from stage import Stage, StartArea
+from stage_loader import StageLayout
+
+# mockのGPIOのログはテストの出力に混ぜない
+GPIO.VERBOSE = False
+
+
+@pytest.fixture
+def run_virtual() -> Callable[[Coroutine[Any, Any, Any]], Any]:
+    """
+    仮想時計のイベントループでコルーチンを最後まで動かす関数 (asyncio.sleepは実時間を待たない)
+    """
+
+    def run(coroutine: Coroutine[Any, Any, Any]) -> Any:
+        with asyncio.Runner(loop_factory=VirtualClockLoop) as runner:
+            return runner.run(coroutine)
+
+    return run
+
+
+@pytest.fixture
+def make_layout() -> Callable[..., StageLayout]:
+    """
+    5000x3000のステージの配置を作る関数 (障害物やARマーカーはキーワード引数で渡す)
+    """
+
+    def make(**fields: Any) -> StageLayout:
+        return StageLayout(
+            **{
+                "x_size": 5000,
+                "y_size": 3000,
+                "start_area": StartArea(position=(4000, 0), size=1000),
+                "walls": [],
+                "goals": [],
+                "ar_markers": [],
+                "obstacles": [],
+                "robot_position": (4500, 500),
+                "robot_rotation": 0,
+                "digest": "",
+            }
+            | fields
+        )
+
+    return make
+
+
+@pytest.fixture
+def make_stage(make_layout, run_virtual) -> Callable[..., Stage]:
+    """
+    5000x3000のステージを作る関数 (障害物やARマーカーはキーワード引数で渡す)
+    ロボットは別のループで作るので、アームを動かすテストではmake_layoutとcreate_stageを使う
+    """
+
+    def make(**fields: Any) -> Stage:
+        layout = make_layout(**fields)
+
+        async def create() -> Stage:
+            return create_stage(layout)
+
+        return run_virtual(create())
+
+    return make
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from robot_parts.arm import HAND_PULSE, SHOULDER_PULSE, Arm, ArmState, Hand, Shoulder
+
+HOME = ArmState(0)
+HOLDING = ArmState.SHOULDERS_OPEN | ArmState.HANDS_GRIPPED
+
+
+def _arm() -> Arm:
+    """
+    main.create_stageと同じピンのアーム (Handの初期化でタスクを作るので、ループの中で呼ぶ)
+    """
+    return Arm(
+        r_shoulder=Shoulder(open_pin=9, close_pin=11),
+        l_shoulder=Shoulder(open_pin=8, close_pin=25),
+        r_hand=Hand(pin_num=18, release_angle=160, grip_angle=120),
+        l_hand=Hand(pin_num=17, release_angle=0, grip_angle=40),
+    )
+
+
+async def _timed(arm: Arm, state: ArmState) -> tuple[ArmState, float]:
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    moved = await arm.goto(state)
+    return moved, loop.time() - start
+
+
+def test_first_goto_moves_every_part(run_virtual):
+    async def main() -> tuple[ArmState, float]:
+        # 起動時の位置は確かめていないので、初期状態へのgotoでも全部品を動かす
+        return await _timed(_arm(), HOME)
+
+    moved, elapsed = run_virtual(main())
+    assert moved == HOLDING
+    # 肩と手は同時に動く
+    assert elapsed == pytest.approx(max(SHOULDER_PULSE, 2 * HAND_PULSE))
+
+
+def test_repeated_goto_is_free(run_virtual):
+    async def main() -> list[tuple[ArmState, float]]:
+        arm = _arm()
+        return [
+            await _timed(arm, HOLDING),
+            await _timed(arm, HOLDING),
+            await _timed(arm, ArmState.HANDS_GRIPPED),
+        ]
+
+    (first, _), (second, elapsed), (third, _) = run_virtual(main())
+    assert first == HOLDING
+    assert second == ArmState(0) and elapsed == 0
+    assert third == ArmState.SHOULDERS_OPEN
+
+
+def test_cancelled_part_moves_again(run_virtual):
+    async def main() -> tuple[bool, bool, ArmState]:
+        arm = _arm()
+        await arm.goto(HOME)
+        task = asyncio.get_running_loop().create_task(arm.open_shoulders())
+        await asyncio.sleep(SHOULDER_PULSE / 2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # 途中で止めた肩は閉じていると記録されていても動かす
+        closed = await arm.close_shoulders()
+        again = await arm.close_shoulders()
+        return closed, again, arm.state
+
+    closed, again, state = run_virtual(main())
+    assert closed and not again
+    assert state == HOME
@@ -0,0 +1,64 @@
+import json
+
+import numpy as np
+import pytest
+
+from benchmark import compare, run_benchmarks, summarize
+
+
+def test_summarize_statistics():
+    summary = summarize(np.arange(1, 101), "ms", failures=2)
+
+    assert summary["unit"] == "ms"
+    assert summary["count"] == 100
+    assert summary["mean"] == pytest.approx(50.5)
+    assert summary["min"] == 1 and summary["max"] == 100
+    assert summary["p50"] == pytest.approx(50.5)
+    assert summary["p99"] == pytest.approx(99.01)
+    assert summary["failures"] == 2
+    json.dumps(summary)
+
+
+def test_summarize_empty():
+    assert summarize([], "us") == {"unit": "us", "count": 0}
+
+
+def test_compare_marks_regressions():
+    def report(commit, p50s):
+        results = {name: summarize([p50], "ms") for name, p50 in p50s.items()}
+        results["empty"] = summarize([], "ms")
+        return {"commit": commit, "results": results}
+
+    baseline = report("aaa", {"fast": 10.0, "slow": 10.0})
+    current = report("bbb", {"fast": 10.5, "slow": 12.0, "new": 1.0})
+
+    lines = compare(baseline, current)
+
+    assert lines[0].startswith("aaa -> bbb")
+    # 比べられないもの (元の結果にない, 計測値がない) は表に出さない
+    assert len(lines) == 3
+    fast, slow = lines[1:]
+    assert "fast" in fast and "x1.05" in fast and "遅くなった" not in fast
+    assert "slow" in slow and "x1.20" in slow and "遅くなった" in slow
+
+
+def test_run_benchmarks_quick():
+    report = run_benchmarks(["planner", "gpio", "drive"], quick=True)
+    results = report["results"]
+
+    assert set(results) == {
+        "planner_init",
+        "plan_path",
+        "gpio_output",
+        "gpio_pwm",
+        "drive_jitter",
+    }
+    assert results["planner_init"]["nodes"] > 0
+    assert results["plan_path"]["count"] + results["plan_path"]["failures"] == 50
+    assert results["gpio_output"]["count"] == 10_000
+    # 指令の間隔は予定より (タイマーの分解能を除いて) 短くならない
+    assert results["drive_jitter"]["count"] > 0
+    assert results["drive_jitter"]["min"] > -1
+    # 結果はそのままJSONに書けて, 同じ結果同士なら遅くなったものはない
+    restored = json.loads(json.dumps(report))
+    assert not any("遅くなった" in line for line in compare(restored, report))
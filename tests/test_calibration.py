@@ -0,0 +1,74 @@
+import sys
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+from vision import calibration
+from vision.calibration import Calibration
+
+PATTERN = (7, 5)
+SQUARE = 40
+
+
+def _board() -> np.ndarray:
+    """
+    内側の交点がPATTERN個のチェッカーボード (1マスSQUARE画素, 白い余白付き)
+    """
+    cols, rows = PATTERN[0] + 1, PATTERN[1] + 1
+    squares = (np.indices((rows, cols)).sum(axis=0) % 2) * 255
+    board = np.kron(squares, np.ones((SQUARE, SQUARE))).astype(np.uint8)
+    return cv2.copyMakeBorder(board, SQUARE, SQUARE, SQUARE, SQUARE, 0, value=255)
+
+
+def _views(tmp_path: Path) -> list[Path]:
+    """
+    ボードを斜めから見た640x480の画像を書き出す
+    """
+    board = _board()
+    h, w = board.shape
+    source = np.float32([[0, 0], [w, 0], [w, h], [0, h]])
+    quads = [
+        [[100, 60], [540, 90], [520, 420], [120, 400]],
+        [[80, 100], [500, 50], [560, 380], [90, 430]],
+        [[150, 40], [560, 80], [480, 440], [60, 380]],
+        [[60, 60], [580, 60], [520, 400], [120, 400]],
+        [[120, 80], [520, 80], [580, 420], [60, 420]],
+    ]
+    paths = []
+    for i, quad in enumerate(quads):
+        homography = cv2.getPerspectiveTransform(source, np.float32(quad))
+        image = cv2.warpPerspective(
+            board, homography, (640, 480), borderValue=255, flags=cv2.INTER_AREA
+        )
+        paths.append(tmp_path / f"view{i}.png")
+        cv2.imwrite(str(paths[-1]), image)
+    return paths
+
+
+def test_cli_skips_unreadable_images(tmp_path, monkeypatch, capsys):
+    broken = tmp_path / "broken.png"
+    broken.write_bytes(b"not an image")
+    output = tmp_path / "camera.npz"
+    images = [str(path) for path in [broken, *_views(tmp_path)]]
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        ["calibration", "checkerboard", *images, "--size", "7x5", "-o", str(output)],
+    )
+
+    calibration.main()
+
+    assert f"画像を読み込めないので飛ばします: {broken}" in capsys.readouterr().out
+    loaded = Calibration.load(output, (640, 480))
+    assert loaded.image_size == (640, 480)
+
+
+def test_load_rejects_other_image_size(tmp_path):
+    path = tmp_path / "camera.npz"
+    Calibration(np.eye(3), np.zeros(5), (1280, 720), 0.3).save(path)
+
+    assert Calibration.load(path).image_size == (1280, 720)
+    with pytest.raises(ValueError, match="画像サイズ"):
+        Calibration.load(path, (640, 480))
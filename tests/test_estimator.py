@@ -0,0 +1,141 @@
+import asyncio
+
+import numpy as np
+import shapely
+
+from estimator import StateEstimator
+from stage import Obstacle, Stage, Wall
+
+OBSTACLE = Obstacle(vertices=[(2500, 1200), (3000, 1200), (3000, 1700)])
+WALL = Wall(x=1000, obstacled_y=[(0, 1000), (2000, 3000)])
+
+
+def _range(stage: Stage, x: float, y: float, rotation: float) -> float:
+    """
+    shapelyで求めた、姿勢 (x, y, rotation) から前方の線分までの距離
+    """
+    ray = shapely.LineString(
+        [(x, y), (x + 1e5 * np.cos(rotation), y + 1e5 * np.sin(rotation))]
+    )
+    hits = shapely.intersection(ray, shapely.MultiLineString(stage.segments()))
+    return float(shapely.distance(shapely.Point(x, y), hits))
+
+
+def test_range_jacobian_matches_finite_difference(make_stage):
+    stage = make_stage(walls=[WALL], obstacles=[OBSTACLE])
+    robot = stage.robot
+    for pose in [(2000, 1400, 0.1), (3500, 2500, -2.0), (1500, 1500, 2.7)]:
+        robot.position, robot.rotation = pose[:2], pose[2]
+        estimator = StateEstimator(robot, stage)
+        # expected_rangeが返す距離とヤコビアンを、差分近似と比べる
+        distance, h = estimator.expected_range()
+
+        np.testing.assert_allclose(distance, _range(stage, *pose))
+        step = np.array([1e-3, 1e-3, 1e-6])
+        numeric = [
+            (
+                _range(stage, *(np.array(pose) + np.eye(3)[i] * step[i]))
+                - _range(stage, *(np.array(pose) - np.eye(3)[i] * step[i]))
+            )
+            / (2 * step[i])
+            for i in range(3)
+        ]
+        np.testing.assert_allclose(h, numeric, rtol=1e-4, atol=1e-6)
+
+
+def test_predict_propagates_covariance_with_motion_jacobian(make_stage):
+    stage = make_stage()
+    robot = stage.robot
+    robot.position, robot.rotation = (2000, 1000), 0.7
+    estimator = StateEstimator(robot, stage, motion_noise=(0, 0))
+    covariance = np.array([[40.0, 5, 0.1], [5, 30, -0.2], [0.1, -0.2, 0.01]])
+    estimator.covariance = covariance.copy()
+    robot.driver.linear_velocity, robot.driver.angular_velocity = 500, 0.4
+    dt = 0.02
+
+    def motion(state: np.ndarray) -> np.ndarray:
+        x, y, rotation = state
+        return np.array(
+            [
+                x + 500 * dt * np.cos(rotation),
+                y + 500 * dt * np.sin(rotation),
+                rotation + 0.4 * dt,
+            ]
+        )
+
+    state = np.array([2000, 1000, 0.7])
+    jacobian = np.column_stack(
+        [
+            (motion(state + e * 1e-6) - motion(state - e * 1e-6)) / 2e-6
+            for e in np.eye(3)
+        ]
+    )
+    estimator.predict(dt)
+
+    (x, y), rotation = estimator.state
+    np.testing.assert_allclose([x, y, rotation], motion(state))
+    np.testing.assert_allclose(
+        estimator.covariance, jacobian @ covariance @ jacobian.T, rtol=1e-6
+    )
+    assert robot.position == (x, y) and robot.rotation == rotation
+
+
+def test_range_update_moves_toward_measurement(make_stage):
+    stage = make_stage(walls=[WALL])
+    robot = stage.robot
+    robot.position, robot.rotation = (2000, 1500), 0.0
+    estimator = StateEstimator(robot, stage)
+    before = estimator.covariance.copy()
+
+    # 推定では右の枠まで3000mmだが、実際は2980mmだった
+    assert estimator.update_range(2980)
+    (x, _), _ = estimator.state
+    assert 2000 < x <= 2020
+    assert np.all(np.diag(estimator.covariance) <= np.diag(before))
+    # 外れ値は棄却する
+    assert not estimator.update_range(1000)
+
+
+def test_pose_update_matches_kalman_equations(make_stage):
+    stage = make_stage()
+    robot = stage.robot
+    robot.position, robot.rotation = (2000, 1000), 0.3
+    estimator = StateEstimator(robot, stage, pose_noise=(30, 0.1))
+    covariance = np.array([[400.0, 50, 1], [50, 300, -2], [1, -2, 0.05]])
+    estimator.covariance = covariance.copy()
+
+    measurement = np.array([2020, 990, 0.35])
+    assert estimator.update_pose(((2020, 990), 0.35))
+
+    s = covariance + np.diag([30**2, 30**2, 0.1**2])
+    k = covariance @ np.linalg.inv(s)
+    (x, y), rotation = estimator.state
+    np.testing.assert_allclose(
+        [x, y, rotation],
+        np.array([2000, 1000, 0.3]) + k @ (measurement - [2000, 1000, 0.3]),
+    )
+    np.testing.assert_allclose(estimator.covariance, (np.eye(3) - k) @ covariance)
+    # 外れ値は棄却し、状態も共分散も変えない
+    before = estimator.covariance.copy()
+    assert not estimator.update_pose(((3000, 990), 0.35))
+    assert estimator.state == ((x, y), rotation)
+    np.testing.assert_array_equal(estimator.covariance, before)
+
+
+def test_run_predicts_on_event_loop_clock(make_stage, run_virtual):
+    stage = make_stage()
+    robot = stage.robot
+    robot.position, robot.rotation = (500, 1500), 0.0
+    estimator = StateEstimator(robot, stage)
+
+    async def drive() -> None:
+        task = asyncio.create_task(estimator.run())
+        await asyncio.sleep(0)
+        await robot.drive([(2500, 1500)])
+        task.cancel()
+
+    # 仮想時計では実時間がほとんど進まないので、time.monotonicで測るとほぼ動かない
+    run_virtual(drive())
+    (x, y), _ = estimator.state
+    assert abs(x - 2500) < 20
+    assert abs(y - 1500) < 1
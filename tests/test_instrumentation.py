@@ -0,0 +1,129 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+import instrumentation
+from instrumentation import MAX_VALUE, HdrHistogram, Instrumentation, pulse
+
+
+@pytest.fixture(autouse=True)
+def disabled():
+    instrumentation.disable()
+    yield
+    instrumentation.disable()
+
+
+def _block(seconds: float) -> None:
+    """
+    イベントループがseconds秒止まったことにする (仮想時計を進める)
+    """
+    asyncio.get_running_loop().advance(seconds)
+
+
+def test_histogram_percentiles_within_relative_error():
+    values = np.random.default_rng(0).lognormal(np.log(1e-3), 1.5, 10_000)
+    histogram = HdrHistogram()
+    for value in values:
+        histogram.record(value)
+
+    assert len(histogram) == len(values)
+    assert histogram.mean == pytest.approx(values.mean(), rel=1e-3)
+    assert histogram.min == pytest.approx(values.min(), abs=1e-6)
+    assert histogram.max == pytest.approx(values.max(), abs=1e-6)
+    for q in (50, 90, 99, 99.9):
+        expected = np.percentile(values, q, method="inverted_cdf")
+        assert histogram.percentile(q) == pytest.approx(expected, rel=0.01, abs=1e-6)
+
+
+def test_histogram_clamps_out_of_range():
+    histogram = HdrHistogram()
+    histogram.record(-1)
+    histogram.record(MAX_VALUE * 2)
+
+    assert histogram.min == 0
+    assert histogram.max == MAX_VALUE
+    assert histogram.percentile(100) == pytest.approx(MAX_VALUE, rel=0.01)
+
+
+def test_histogram_merge_and_reset():
+    a, b = HdrHistogram(), HdrHistogram()
+    for value in (0.001, 0.002):
+        a.record(value)
+    b.record(0.5)
+    a.merge(b)
+
+    assert len(a) == 3
+    assert a.max == pytest.approx(0.5)
+    assert a.percentile(50) == pytest.approx(0.002, rel=0.01)
+    with pytest.raises(ValueError):
+        a.merge(HdrHistogram(significant_digits=3))
+
+    a.reset()
+    assert len(a) == 0
+    assert a.summary()["p99"] == 0 and a.max == 0
+
+
+def test_loop_lag_records_blocking(run_virtual):
+    async def run() -> Instrumentation:
+        monitor = Instrumentation(interval=0.01)
+        monitor.start()
+        await asyncio.sleep(0.5)
+        # ループを50ms止める処理
+        asyncio.get_running_loop().call_soon(_block, 0.05)
+        await asyncio.sleep(0.5)
+        monitor.stop()
+        return monitor
+
+    lag = run_virtual(run()).loop_lag
+
+    assert len(lag) >= 90
+    assert lag.percentile(50) == 0
+    assert lag.max == pytest.approx(0.05 - 0.01, abs=0.011)
+
+
+def test_pulse_records_only_when_enabled(run_virtual):
+    async def run() -> Instrumentation:
+        await pulse("wheel", 0.1)
+        monitor = instrumentation.enable()
+        await pulse("wheel", 0.1)
+        await pulse("hand", 0.2)
+        # 終わる10ms前からループが30ms止まると、パルスが20ms伸びる
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.19, _block, 0.03)
+        await pulse("hand", 0.2)
+        # 途中でキャンセルされたパルスは記録しない
+        task = loop.create_task(pulse("wheel", 1.0))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return monitor
+
+    monitor = run_virtual(run())
+
+    assert set(monitor.pulses) == {"wheel", "hand"}
+    wheel, hand = monitor.pulses["wheel"], monitor.pulses["hand"]
+    assert len(wheel.overshoot) == 1
+    assert wheel.requested == pytest.approx(0.1)
+    assert wheel.drift == pytest.approx(0)
+    assert len(hand.overshoot) == 2
+    assert hand.overshoot.max == pytest.approx(0.02, abs=1e-5)
+    assert hand.drift == pytest.approx(0.02 / 0.4, abs=1e-4)
+
+    summary = monitor.summary()
+    assert summary["pulse[hand]"]["requested"] == pytest.approx(0.4)
+    assert "drift +5.00%" in monitor.report()
+
+
+def test_disable_stops_monitor(run_virtual):
+    async def run() -> int:
+        monitor = instrumentation.enable(interval=0.01)
+        monitor.start()
+        await asyncio.sleep(0.1)
+        instrumentation.disable()
+        count = len(monitor.loop_lag)
+        await asyncio.sleep(0.1)
+        assert instrumentation.INSTRUMENTATION is None
+        return len(monitor.loop_lag) - count
+
+    assert run_virtual(run()) == 0
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from localization import Localizer
+from stage import ARMarker
+
+MARKERS = [
+    ARMarker(position=(2500, 3000), normal=(0, -1), marker_id=3),
+    ARMarker(position=(3500, 3000), normal=(0, -1), marker_id=5),
+    ARMarker(position=(5000, 1500), normal=(-1, 0), marker_id=8),
+]
+
+
+def _observe(
+    pose: tuple[float, float, float], camera_offset: float, markers: list[ARMarker]
+) -> list[tuple[float, float, int]]:
+    """
+    姿勢poseのロボットから見たマーカーの (dx: 右, dy: 前, id)
+    """
+    x, y, theta = pose
+    observations = []
+    for marker in markers:
+        wx, wy = marker.position[0] - x, marker.position[1] - y
+        forward = np.cos(theta) * wx + np.sin(theta) * wy
+        left = -np.sin(theta) * wx + np.cos(theta) * wy
+        observations.append((-left, forward - camera_offset, marker.marker_id))
+    return observations
+
+
+@pytest.mark.parametrize("pose", [(1200, 800, 0.3), (4000, 1500, -2.8)])
+def test_round_trip_with_several_markers(make_stage, pose):
+    localizer = Localizer(make_stage(ar_markers=MARKERS), camera_offset=120)
+    result = localizer.localize(_observe(pose, 120, MARKERS))
+
+    assert result is not None
+    (x, y), rotation = result
+    np.testing.assert_allclose([x, y, rotation], pose, atol=1e-6)
+
+
+def test_single_marker_uses_known_rotation(make_stage):
+    pose = (3000, 2000, 1.1)
+    localizer = Localizer(make_stage(ar_markers=MARKERS), camera_offset=120)
+    observations = _observe(pose, 120, MARKERS[1:2])
+
+    assert localizer.localize(observations) is None
+    result = localizer.localize(observations, rotation=pose[2])
+    assert result is not None
+    (x, y), rotation = result
+    np.testing.assert_allclose([x, y, rotation], pose, atol=1e-6)
+
+
+def test_unknown_markers_are_ignored(make_stage):
+    pose = (2000, 1000, 0.5)
+    localizer = Localizer(make_stage(ar_markers=MARKERS), camera_offset=120)
+    observations = _observe(pose, 120, MARKERS) + [(10.0, 500.0, 4), (0, 0, 99)]
+
+    result = localizer.localize(observations)
+    assert result is not None
+    (x, y), rotation = result
+    np.testing.assert_allclose([x, y, rotation], pose, atol=1e-6)
+    assert localizer.localize([(10.0, 500.0, 4)], rotation=0) is None
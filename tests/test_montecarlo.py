@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+
+from main import delivery_strategy, scheduled_strategy
+from montecarlo import (
+    PERCENTILES,
+    Evaluation,
+    MatchOutcome,
+    MatchParameters,
+    Perturbation,
+    evaluate,
+    score_timeline,
+)
+from robot_parts.arm import ArmState
+from scheduler import MATCH_DURATION
+from simulation import TimelineEvent
+from stage import GoalArea, StartArea
+from stage_loader import StageLayout
+
+GRIPPED = ArmState.HANDS_GRIPPED
+LAYOUT = StageLayout(
+    x_size=5000,
+    y_size=3000,
+    start_area=StartArea(position=(4000, 0), size=1000),
+    walls=[],
+    goals=[
+        GoalArea(position=(1500, 0), size=1000, goal_id=1),
+        GoalArea(position=(0, 2000), size=1000, goal_id=3),
+    ],
+    ar_markers=[],
+    obstacles=[],
+    robot_position=(4500, 500),
+    robot_rotation=0,
+    digest="",
+)
+
+
+def _event(time: float, position: tuple[float, float], arm: ArmState):
+    return TimelineEvent(time, "arm", position, 0.0, arm, [])
+
+
+def test_score_timeline_counts_grips_at_start_and_releases_at_goals():
+    start, goal1, goal3, elsewhere = (4500, 500), (2000, 500), (500, 2500), (3000, 2000)
+    events = [
+        _event(1, start, GRIPPED),
+        _event(5, goal1, ArmState(0)),
+        _event(8, start, GRIPPED),
+        _event(12, elsewhere, ArmState(0)),  # ゴールの外で離した
+        _event(15, elsewhere, GRIPPED),  # スタートエリアの外ではつかめない
+        _event(18, goal3, ArmState(0)),
+        _event(20, start, GRIPPED),
+        _event(25, goal3, ArmState(0)),
+    ]
+    rng = np.random.default_rng(0)
+    assert score_timeline(events, LAYOUT, 1.0, rng) == ([(5, 1), (25, 3)], 0)
+    # つかみ損ねたら届けられない
+    assert score_timeline(events, LAYOUT, 0.0, rng) == ([], 3)
+
+
+def _outcome(deliveries: list[float], finished: bool, duration: float) -> MatchOutcome:
+    return MatchOutcome(
+        parameters=MatchParameters(),
+        deliveries=[(time, 1) for time in deliveries],
+        failed_grips=0,
+        finished=finished,
+        duration=duration,
+    )
+
+
+def test_evaluation_aggregates_outcomes():
+    outcomes = [
+        _outcome([20, 50, 80], False, 180),
+        _outcome([30, 70], False, 180),
+        _outcome([], False, 180),
+    ]
+    evaluation = Evaluation("loop", outcomes[0], outcomes)
+
+    assert evaluation.scores.tolist() == [3, 2, 0]
+    assert evaluation.score_distribution() == pytest.approx(
+        {0: 1 / 3, 2: 1 / 3, 3: 1 / 3}
+    )
+    timings = evaluation.timing_percentiles()
+    np.testing.assert_allclose(
+        timings["first_delivery"], np.percentile([20, 30], PERCENTILES)
+    )
+    np.testing.assert_allclose(
+        timings["cycle"], np.percentile([30, 30, 40], PERCENTILES)
+    )
+    # 時間内に終わった試合が無いので、finishは値が無い
+    assert np.isnan(timings["finish"]).all()
+    finish_row = next(
+        line for line in evaluation.report().splitlines() if "finish" in line
+    )
+    assert finish_row.split()[2:] == ["-"] * len(PERCENTILES)
+
+
+def test_evaluate_compares_strategies_on_the_same_parameters():
+    evaluations = evaluate(
+        {"delivery": delivery_strategy, "scheduled": scheduled_strategy},
+        matches=4,
+        perturbation=Perturbation(speed=0.05),
+        workers=2,
+        seed=1,
+    )
+
+    delivery, scheduled = evaluations["delivery"], evaluations["scheduled"]
+    # どちらの戦略も同じ性能の組で試合をする
+    assert [o.parameters for o in delivery.outcomes] == [
+        o.parameters for o in scheduled.outcomes
+    ]
+    # delivery_strategyは打ち切られるまで運び続け、scheduled_strategyは間に合わない前に止まる
+    assert not any(o.finished for o in delivery.outcomes)
+    assert np.isnan(delivery.timing_percentiles()["finish"]).all()
+    assert all(o.finished and o.duration <= MATCH_DURATION for o in scheduled.outcomes)
+    assert np.isfinite(scheduled.timing_percentiles()["finish"]).all()
+    assert delivery.nominal.score >= 1 and scheduled.nominal.score >= 1
@@ -0,0 +1,56 @@
+import numpy as np
+import shapely
+from shapely import Polygon, box
+
+from pathfinding import PathPlanner
+from stage import Obstacle
+
+OBSTACLES = [
+    [(1200, 600), (1700, 500), (1800, 1100), (1300, 1200)],
+    [(2500, 1200), (3000, 1200), (3000, 1700)],
+    [(3600, 1800), (4100, 2000), (4000, 2500), (3500, 2400), (3400, 2100)],
+    [(700, 2000), (1000, 1800), (1200, 2300)],
+    [(2200, 300), (2600, 400), (2400, 800)],
+]
+
+
+def _planner(make_stage, obstacles) -> PathPlanner:
+    return PathPlanner(
+        make_stage(obstacles=[Obstacle(vertices=vertices) for vertices in obstacles])
+    )
+
+
+def _components(count: int, edges: np.ndarray) -> int:
+    parent = list(range(count))
+
+    def root(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for a, b in edges.tolist():
+        parent[root(a)] = root(b)
+    return len({root(i) for i in range(count)})
+
+
+def test_graph_is_connected_around_polygon_obstacles(make_stage):
+    for obstacles in [OBSTACLES[:1], OBSTACLES]:
+        planner = _planner(make_stage, obstacles)
+        free = box(0, 0, 5000, 3000).difference(planner.shape)
+        assert isinstance(free, Polygon)
+        nodes, edges = planner.graph
+        assert _components(len(nodes), edges) == 1
+
+
+def test_plan_path_reaches_every_free_point(make_stage):
+    planner = _planner(make_stage, OBSTACLES)
+    free = box(0, 0, 5000, 3000).difference(planner.shape.buffer(1))
+    rng = np.random.default_rng(0)
+    points = rng.uniform((0, 0), (5000, 3000), (400, 2))
+    points = points[shapely.contains_xy(free, points[:, 0], points[:, 1])]
+    for start, end in zip(points[::2].tolist(), points[1::2].tolist()):
+        path = planner.plan_path(tuple(start), tuple(end))
+        assert path[0] == tuple(start) and path[-1] == tuple(end)
+        segments = shapely.linestrings(path)
+        assert not shapely.intersects(segments, planner.shape)
@@ -0,0 +1,75 @@
+import asyncio
+import functools
+from pathlib import Path
+
+import cv2.aruco as aruco
+import numpy as np
+import pytest
+
+from vision.pipeline import DetectorConfig, VisionPipeline
+from vision.recording import FrameRecorder, ReplaySource
+
+SIZE = (320, 240)
+FRAMES = 120
+CONFIG = DetectorConfig(
+    camera_matrix=np.array([[300.0, 0, 160], [0, 300.0, 120], [0, 0, 1]]),
+    dist_coeffs=None,
+    marker_length=0.1,
+)
+
+
+@pytest.fixture
+def recording(tmp_path: Path) -> Path:
+    """
+    フレームiにID (i % 50) のマーカーが1つ写った記録ファイル
+    """
+    dictionary = aruco.getPredefinedDictionary(CONFIG.dictionary)
+    path = tmp_path / "frames.npy"
+    recorder = FrameRecorder(path, capacity=FRAMES)
+    for i in range(FRAMES):
+        frame = np.full(SIZE[::-1], 255, dtype=np.uint8)
+        frame[60:180, 100:220] = aruco.generateImageMarker(dictionary, i % 50, 120)
+        recorder.record(frame, timestamp=float(i))
+    recorder.close()
+    return path
+
+
+def _pipeline(path: Path, workers: int) -> VisionPipeline:
+    return VisionPipeline(
+        functools.partial(ReplaySource, path, loop=False),
+        CONFIG,
+        size=SIZE,
+        workers=workers,
+        max_pending=1,
+    )
+
+
+def test_results_are_in_capture_order_and_skip_dropped_frames(recording):
+    with _pipeline(recording, workers=3) as pipeline:
+        results = []
+        while (result := pipeline.get(timeout=10)) is not None:
+            results.append(result)
+
+    seqs = [result.seq for result in results]
+    assert seqs == sorted(set(seqs))
+    assert all(0 <= seq < FRAMES for seq in seqs)
+    # 検出が撮影に追いつかないので、古いフレームは捨てられる
+    assert 0 < len(results) < FRAMES
+    for result in results:
+        assert result.poses.ids.tolist() == [result.seq % 50]
+
+
+def test_concurrent_next_calls_share_the_reordering_state(recording):
+    async def collect() -> list[int]:
+        seqs = []
+        with _pipeline(recording, workers=2) as pipeline:
+            while True:
+                batch = await asyncio.gather(*(pipeline.next() for _ in range(4)))
+                seqs += [result.seq for result in batch if result is not None]
+                if None in batch:
+                    return seqs
+
+    seqs = asyncio.run(collect())
+    # 同じ結果を2度返したり、順序を飛ばしたりしない
+    assert len(seqs) == len(set(seqs)) > 0
+    assert all(0 <= seq < FRAMES for seq in seqs)
@@ -0,0 +1,140 @@
+import cv2
+import numpy as np
+
+from vision.pose import estimate_poses, solve_ippe
+
+MARKER_LENGTH = 0.1
+CAMERA_MATRIX = np.array([[600.0, 0, 320], [0, 600.0, 240], [0, 0, 1]])
+DIST_COEFFS = np.array([0.05, -0.1, 0.001, -0.002, 0.0])
+# ArUcoの四隅の順 (左上から時計回り) のマーカー座標 (m)
+OBJECT_POINTS = (
+    np.array([[-1, 1, 0], [1, 1, 0], [1, -1, 0], [-1, -1, 0]], dtype=np.float64)
+    * MARKER_LENGTH
+    / 2
+)
+
+
+def _random_poses(count: int) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(0)
+    rvecs = rng.normal(0, 0.4, (count, 3))
+    tvecs = np.column_stack(
+        [rng.uniform(-0.3, 0.3, count), rng.uniform(-0.2, 0.2, count)]
+        + [rng.uniform(0.5, 2.0, count)]
+    )
+    return rvecs, tvecs
+
+
+def _project(rvec: np.ndarray, tvec: np.ndarray) -> np.ndarray:
+    corners, _ = cv2.projectPoints(
+        OBJECT_POINTS, rvec, tvec, CAMERA_MATRIX, DIST_COEFFS
+    )
+    return corners.reshape(1, 4, 2).astype(np.float32)
+
+
+def test_matches_projected_ground_truth():
+    rvecs, tvecs = _random_poses(20)
+    corners = [_project(r, t) for r, t in zip(rvecs, tvecs)]
+    poses = estimate_poses(
+        corners, np.arange(20), CAMERA_MATRIX, DIST_COEFFS, MARKER_LENGTH
+    )
+
+    assert poses.ids.tolist() == list(range(20))
+    np.testing.assert_allclose(poses.positions, tvecs * 1000, atol=1.0)
+    for rvec, rotation in zip(rvecs, poses.rotations):
+        expected, _ = cv2.Rodrigues(rvec)
+        np.testing.assert_allclose(rotation, expected, atol=1e-3)
+
+
+def test_agrees_with_solve_pnp():
+    rvecs, tvecs = _random_poses(10)
+    corners = [_project(r, t) for r, t in zip(rvecs, tvecs)]
+    poses = estimate_poses(
+        corners, np.arange(10), CAMERA_MATRIX, DIST_COEFFS, MARKER_LENGTH
+    )
+
+    for quad, position, rotation in zip(corners, poses.positions, poses.rotations):
+        ok, rvec, tvec = cv2.solvePnP(
+            OBJECT_POINTS,
+            quad.reshape(4, 2),
+            CAMERA_MATRIX,
+            DIST_COEFFS,
+            flags=cv2.SOLVEPNP_IPPE_SQUARE,
+        )
+        assert ok
+        np.testing.assert_allclose(position, tvec.reshape(3) * 1000, atol=1.0)
+        np.testing.assert_allclose(rotation, cv2.Rodrigues(rvec)[0], atol=1e-3)
+
+
+def test_both_ippe_solutions_match_opencv_with_noisy_corners():
+    rng = np.random.default_rng(1)
+    rvecs, tvecs = _random_poses(20)
+    corners = [
+        _project(r, t) + rng.normal(0, 0.5, (1, 4, 2)).astype(np.float32)
+        for r, t in zip(rvecs, tvecs)
+    ]
+    quads = cv2.undistortPoints(
+        np.concatenate(corners).reshape(-1, 1, 2).astype(np.float64),
+        CAMERA_MATRIX,
+        DIST_COEFFS,
+    ).reshape(-1, 4, 2)
+    rotations, translations, errors = solve_ippe(quads, MARKER_LENGTH)
+    poses = estimate_poses(
+        corners, np.arange(20), CAMERA_MATRIX, DIST_COEFFS, MARKER_LENGTH
+    )
+
+    assert np.all(errors[:, 0] <= errors[:, 1])
+    for i, quad in enumerate(corners):
+        _, cv_rvecs, cv_tvecs, _ = cv2.solvePnPGeneric(
+            OBJECT_POINTS,
+            quad.reshape(4, 2),
+            CAMERA_MATRIX,
+            DIST_COEFFS,
+            flags=cv2.SOLVEPNP_IPPE_SQUARE,
+        )
+        # 2つの解は (順序によらず) OpenCVのIPPEの2つの解と一致する
+        for rvec, tvec in zip(cv_rvecs, cv_tvecs):
+            expected, _ = cv2.Rodrigues(rvec)
+            k = int(np.argmin(np.abs(rotations[i] - expected).sum(axis=(1, 2))))
+            np.testing.assert_allclose(rotations[i, k], expected, atol=1e-6)
+            np.testing.assert_allclose(translations[i, k], tvec.ravel(), atol=1e-6)
+        # 採用するのは再投影誤差の小さい方
+        np.testing.assert_allclose(poses.rotations[i], rotations[i, 0])
+        np.testing.assert_allclose(poses.positions[i], translations[i, 0] * 1000)
+
+
+def test_yaw_is_zero_when_facing_camera():
+    # マーカーのz軸がカメラの方を向いている (x軸周りに180度回した) 姿勢
+    quad = _project(np.array([np.pi, 0, 0]), np.array([0.0, 0.0, 1.0]))
+    poses = estimate_poses(
+        [quad], np.array([7]), CAMERA_MATRIX, DIST_COEFFS, MARKER_LENGTH
+    )
+    # 正対では四隅の丸め誤差で傾きがわずかにぶれる (OpenCVのIPPEも同じ値になる)
+    _, rvec, _ = cv2.solvePnP(
+        OBJECT_POINTS,
+        quad.reshape(4, 2),
+        CAMERA_MATRIX,
+        DIST_COEFFS,
+        flags=cv2.SOLVEPNP_IPPE_SQUARE,
+    )
+    rotation, _ = cv2.Rodrigues(rvec)
+    np.testing.assert_allclose(
+        poses.yaw, [np.arctan2(rotation[0, 2], -rotation[2, 2])], atol=1e-5
+    )
+    np.testing.assert_allclose(poses.yaw, [0.0], atol=2e-3)
+
+
+def test_no_markers():
+    poses = estimate_poses([], None, CAMERA_MATRIX, DIST_COEFFS, MARKER_LENGTH)
+    assert len(poses) == 0
+    assert poses.positions.shape == (0, 3)
+
+
+def test_degenerate_quads_are_dropped():
+    corners = [
+        _project(np.zeros(3), np.array([0.0, 0.0, 1.0])),
+        np.full((1, 4, 2), 50, dtype=np.float32),
+    ]
+    poses = estimate_poses(
+        corners, np.array([1, 2]), CAMERA_MATRIX, DIST_COEFFS, MARKER_LENGTH
+    )
+    assert poses.ids.tolist() == [1]
@@ -0,0 +1,54 @@
+import cv2
+import cv2.aruco as aruco
+import numpy as np
+
+from vision.pyramid import PyramidDetector
+
+DICTIONARY = aruco.getPredefinedDictionary(aruco.DICT_4X4_50)
+NEAR_ID, FAR_ID = 3, 7
+
+
+def _frame(markers: list[tuple[int, int, int, int]]) -> np.ndarray:
+    """
+    白い640x480の画像に (id, x, y, 一辺の画素数) のマーカーを描く
+    """
+    frame = np.full((480, 640), 255, dtype=np.uint8)
+    for marker_id, x, y, side in markers:
+        frame[y : y + side, x : x + side] = aruco.generateImageMarker(
+            DICTIONARY, marker_id, side
+        )
+    return frame
+
+
+def _ids(detection) -> set[int]:
+    _, ids = detection
+    return set() if ids is None else {int(i) for i in ids.ravel()}
+
+
+def test_far_marker_found_by_periodic_full_resolution_pass():
+    detector = PyramidDetector(aruco.ArucoDetector(DICTIONARY), full_interval=4)
+    near = (NEAR_ID, 80, 100, 240)
+    far = (FAR_ID, 500, 60, 18)
+
+    # 近くのマーカーだけが見えていると、縮小画像で探すようになる
+    assert _ids(detector.detect(_frame([near]))) == {NEAR_ID}
+    assert detector.scale < 0.5
+
+    # 遠くのマーカーは縮小画像では小さすぎて見えないが、
+    # full_intervalフレーム以内に元の解像度の検出で見つかる
+    frame = _frame([near, far])
+    found = [_ids(detector.detect(frame)) for _ in range(5)]
+    assert found[0] == {NEAR_ID}
+    assert found[4] == {NEAR_ID, FAR_ID}
+    # 見つかった後は小さいマーカーに合わせて縮小をやめる
+    assert detector.scale == 1.0
+    assert _ids(detector.detect(frame)) == {NEAR_ID, FAR_ID}
+
+
+def test_downscaled_corners_are_refined_to_full_resolution():
+    detector = PyramidDetector(aruco.ArucoDetector(DICTIONARY))
+    frame = cv2.GaussianBlur(_frame([(NEAR_ID, 81, 103, 240)]), (3, 3), 0)
+    full, _ = detector.detect(frame)
+    assert detector.scale < 1.0
+    small, _ = detector.detect(frame)
+    np.testing.assert_allclose(small[0], full[0], atol=0.5)
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from vision.recording import FrameRecorder, ReplaySource
+
+
+def _frames(count: int) -> list[np.ndarray]:
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, (72, 64), dtype=np.uint8) for _ in range(count)]
+
+
+def test_record_and_replay_round_trip(tmp_path):
+    path = tmp_path / "frames.npy"
+    frames = _frames(5)
+    recorder = FrameRecorder(path, capacity=8)
+    for i, frame in enumerate(frames):
+        pose = None if i == 0 else ((100.0 * i, 50.0), 0.1 * i)
+        assert recorder.record(frame, pose, timestamp=0.5 * i)
+    assert len(recorder) == 5
+    recorder.close()
+
+    # 確保した8枚のうち、記録した5枚だけを再生する
+    source = ReplaySource(path, loop=False)
+    assert len(source) == 5
+    np.testing.assert_array_equal(source.timestamps, 0.5 * np.arange(5))
+    assert np.isnan(source.poses[0]).all()
+    np.testing.assert_allclose(source.poses[3], [300, 50, 0.3])
+
+    source.start()
+    for frame in frames:
+        replayed = source.capture_array()
+        np.testing.assert_array_equal(replayed, frame)
+        # メモリマップのビューなので書き換えられない
+        assert not replayed.flags.writeable
+    with pytest.raises(EOFError):
+        source.capture_array()
+
+
+def test_replay_loops_and_restarts(tmp_path):
+    path = tmp_path / "frames.npy"
+    frames = _frames(2)
+    recorder = FrameRecorder(path, capacity=2)
+    for frame in frames:
+        recorder.record(frame)
+    # 容量を超えたフレームは記録しない
+    assert not recorder.record(frames[0])
+    recorder.close()
+
+    source = ReplaySource(path)
+    replayed = [source.capture_array() for _ in range(3)]
+    np.testing.assert_array_equal(replayed[2], frames[0])
+    source.start()
+    np.testing.assert_array_equal(source.capture_array(), frames[0])
+
+
+def test_empty_recording_is_rejected(tmp_path):
+    path = tmp_path / "frames.npy"
+    recorder = FrameRecorder(path, capacity=4)
+    recorder.record(_frames(1)[0])
+    recorder.close()
+    # 記録を空にする (時刻がNaNのレコードは未使用)
+    records = np.load(path, mmap_mode="r+")
+    records["timestamp"] = np.nan
+    records.flush()
+    del records
+
+    with pytest.raises(ValueError, match="フレームが記録されていません"):
+        ReplaySource(path)
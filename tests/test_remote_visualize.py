@@ -0,0 +1,26 @@
+import pytest
+
+from remote_visualize import SharedRobotState
+
+
+def test_round_trip_and_truncation_warning(make_stage):
+    writer_robot, reader_robot = make_stage().robot, make_stage().robot
+    writer = SharedRobotState(max_path=4)
+    reader = SharedRobotState(writer.name, max_path=4)
+    try:
+        writer_robot.position, writer_robot.rotation = (1200.5, 800.0), 0.25
+        writer_robot.path = [(0, 0), (1, 1), (2, 2)]
+        writer.write(writer_robot)
+        assert reader.read_into(reader_robot)
+        assert reader_robot.position == (1200.5, 800.0)
+        assert reader_robot.rotation == 0.25
+        assert reader_robot.path == [(0, 0), (1, 1), (2, 2)]
+
+        writer_robot.path = [(float(i), 0.0) for i in range(6)]
+        with pytest.warns(RuntimeWarning, match="6点"):
+            writer.write(writer_robot)
+        assert reader.read_into(reader_robot)
+        assert reader_robot.path == writer_robot.path[:4]
+    finally:
+        reader.close()
+        writer.close()
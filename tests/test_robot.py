@@ -0,0 +1,85 @@
+import asyncio
+
+import numpy as np
+import pytest
+from matplotlib.figure import Figure
+
+from robot import Robot
+
+
+async def _cancel_after(robot: Robot, path: list[tuple[float, float]], delay: float):
+    task = asyncio.get_running_loop().create_task(robot.drive(path))
+    await asyncio.sleep(delay)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+
+def test_cancelled_straight_keeps_travelled_fraction(make_stage, run_virtual):
+    robot = make_stage().robot
+    robot.position, robot.rotation = (500, 500), 0.0
+    driver = robot.driver
+    duration = 2000 / driver.mm_per_sec
+
+    # 向きはそろっているので、0度の旋回の待ち時間の後に直進が始まる
+    run_virtual(_cancel_after(robot, [(2500, 500)], driver.settle_time + duration / 4))
+
+    assert driver.progress == pytest.approx(0.25)
+    assert robot.position == pytest.approx((500 + 2000 * driver.progress, 500))
+    assert robot.rotation == 0
+    assert driver.linear_velocity == 0
+
+
+def test_cancelled_turn_keeps_turned_fraction(make_stage, run_virtual):
+    robot = make_stage().robot
+    robot.position, robot.rotation = (500, 500), 0.0
+    driver = robot.driver
+    duration = (np.pi / 2) / driver.rad_per_sec
+
+    run_virtual(_cancel_after(robot, [(500, 2500)], duration * 0.4))
+
+    assert driver.progress == pytest.approx(0.4)
+    assert robot.rotation == pytest.approx(np.pi / 2 * driver.progress)
+    assert robot.position == (500, 500)
+    assert driver.angular_velocity == 0
+
+
+def test_retarget_starts_from_stopped_pose(make_stage, run_virtual):
+    robot = make_stage().robot
+    robot.position, robot.rotation = (500, 500), 0.0
+    driver = robot.driver
+
+    async def main() -> None:
+        await robot.retarget(lambda start: [start, (2500, 500)])
+        await asyncio.sleep(driver.settle_time + 1000 / driver.mm_per_sec)
+        # 止まった位置 (半分進んだ所) から新しい経路を計画する
+        task = await robot.retarget(lambda start: [start, (start[0], 1500)])
+        assert robot.position == pytest.approx((1500, 500))
+        await task
+
+    run_virtual(main())
+    assert robot.position == pytest.approx((1500, 1500))
+
+
+def test_artists_are_created_once_and_updated_in_place(make_stage):
+    robot = make_stage().robot
+    ax = Figure().add_subplot()
+
+    artists = robot.init_animation(ax)
+    # ブリッティングで何度呼ばれても同じArtistを返し、Axesに追加し直さない
+    assert robot.init_animation(ax) == artists
+    assert robot.animate(ax) == artists
+    assert len(ax.patches) == 3 and len(ax.lines) == 1
+
+    path_line, body, _, _ = artists
+    robot.position, robot.rotation = (1000, 2000), np.pi / 2
+    robot.path = [(4500, 500), (1000, 2000)]
+    assert robot.animate(ax) == artists
+    assert body.get_center() == (1000, 2000)
+    assert list(path_line.get_xdata()) == [4500, 1000]
+
+    # 同じ経路のリストなら線のデータは作り直さない
+    data = path_line.get_xydata()
+    robot.animate(ax)
+    assert path_line.get_xydata() is data
+    assert len(ax.patches) == 3 and len(ax.lines) == 1
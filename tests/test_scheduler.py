@@ -0,0 +1,146 @@
+import asyncio
+
+import pytest
+
+from main import create_stage
+from robot import SETTLE_TIME
+from robot_parts.arm import HAND_PULSE, SHOULDER_PULSE, ArmState
+from scheduler import MatchScheduler, ScheduledAction, predict_arm
+from stage_loader import compile_stage
+
+
+def _action(kind, predicted: float, actual: float, log: list[str]) -> ScheduledAction:
+    async def run() -> None:
+        log.append(kind)
+        await asyncio.sleep(actual)
+
+    return ScheduledAction(kind, kind, predicted, run)
+
+
+@pytest.fixture
+def scheduler_for(make_stage):
+    stage = make_stage()
+    compiled = compile_stage(stage, "", cache_dir=None)
+
+    def create(remaining: float) -> MatchScheduler:
+        return MatchScheduler(
+            stage,
+            compiled,
+            asyncio.get_running_loop().time() + remaining,
+            margin=1.0,
+        )
+
+    return create
+
+
+def test_refuses_actions_past_deadline(scheduler_for, run_virtual):
+    log: list[str] = []
+
+    async def main() -> tuple[bool, float]:
+        scheduler = scheduler_for(5)
+        actions = [
+            _action("drive", 2, 2, log),
+            _action("pickup", 1, 1, log),
+            _action("drive", 2, 2, log),
+            _action("release", 1, 1, log),
+        ]
+        return await scheduler.execute(actions), scheduler.remaining
+
+    executed, remaining = run_virtual(main())
+    assert not executed
+    assert log == []
+    assert remaining == 5
+
+
+def test_stops_before_pickup_when_drive_overruns(scheduler_for, run_virtual):
+    log: list[str] = []
+
+    async def main() -> bool:
+        scheduler = scheduler_for(10)
+        # 予測2sの走行が6sかかったので、残りの4sでは届けきれない
+        return await scheduler.execute(
+            [
+                _action("drive", 2, 6, log),
+                _action("pickup", 1, 1, log),
+                _action("drive", 2, 2, log),
+                _action("release", 1, 1, log),
+            ]
+        )
+
+    assert not run_virtual(main())
+    assert log == ["drive"]
+
+
+def test_finishes_delivery_once_committed(scheduler_for, run_virtual):
+    log: list[str] = []
+
+    async def main() -> MatchScheduler:
+        scheduler = scheduler_for(10)
+        # つかんだ後の走行が予測より大きく遅れても、離すところまでは実行する
+        assert await scheduler.execute(
+            [
+                _action("pickup", 1, 1, log),
+                _action("drive", 2, 8.5, log),
+                _action("release", 1, 1, log),
+            ]
+        )
+        return scheduler
+
+    scheduler = run_virtual(main())
+    assert log == ["pickup", "drive", "release"]
+    assert [label for _, label, _, _ in scheduler.history] == log
+    assert scheduler.history[1][3] == pytest.approx(8.5)
+
+
+def test_stats_scale_predictions(scheduler_for, run_virtual):
+    async def main() -> MatchScheduler:
+        scheduler = scheduler_for(100)
+        for _ in range(3):
+            await scheduler.execute([_action("drive", 1, 2, [])])
+        return scheduler
+
+    scheduler = run_virtual(main())
+    assert scheduler.stats.factor("drive") == pytest.approx(2)
+    assert scheduler.stats.factor("pickup") == 1
+    assert scheduler.budget([_action("drive", 3, 0, [])]) == pytest.approx(7)
+
+
+def test_arm_prediction_follows_arm_state(make_layout, run_virtual):
+    layout = make_layout()
+
+    async def main() -> list[tuple[float, float]]:
+        robot = create_stage(layout).robot
+        await robot.arm.goto(ArmState(0))
+        loop = asyncio.get_running_loop()
+        timings = []
+        # 1回目のpickupは全部品が動き、2回目は既につかんでいるので手は動かない
+        for hands, step in [
+            (ArmState.HANDS_GRIPPED, robot.pickup_parcel),
+            (ArmState.HANDS_GRIPPED, robot.pickup_parcel),
+            (ArmState(0), robot.release_parcel),
+        ]:
+            predicted, _ = predict_arm(robot, hands)
+            start = loop.time()
+            await step()
+            timings.append((predicted, loop.time() - start))
+        return timings
+
+    timings = run_virtual(main())
+    for predicted, actual in timings:
+        assert predicted == pytest.approx(actual)
+    full = 2 * SHOULDER_PULSE + HAND_PULSE + 3 * SETTLE_TIME
+    assert [predicted for predicted, _ in timings] == pytest.approx(
+        [full, full - HAND_PULSE - SETTLE_TIME, full]
+    )
+
+
+def test_release_prediction_uses_state_after_pickup(make_stage):
+    robot = make_stage().robot
+    pickup, state = predict_arm(robot, ArmState.HANDS_GRIPPED)
+    assert state == ArmState.HANDS_GRIPPED
+    release, state = predict_arm(robot, ArmState(0), state)
+    assert state == ArmState(0)
+    # つかんだ後の状態から予測するので、release_parcelは全部品を動かす
+    assert release == pytest.approx(pickup)
+    again, _ = predict_arm(robot, ArmState(0), ArmState(0))
+    assert again == pytest.approx(release - HAND_PULSE - SETTLE_TIME)
@@ -0,0 +1,22 @@
+from main import delivery_strategy, strategy
+from simulation import simulate
+
+
+def test_timeline_is_deterministic(tmp_path):
+    first = simulate(delivery_strategy, duration=60, cache_dir=tmp_path)
+    second = simulate(delivery_strategy, duration=60, cache_dir=tmp_path)
+
+    assert not first.finished
+    assert first.duration == second.duration == 60
+    assert first.events == second.events
+    assert first.gpio == second.gpio
+    assert first.actions("arm")
+
+
+def test_strategy_finishes_before_deadline(tmp_path):
+    result = simulate(strategy, cache_dir=tmp_path)
+
+    assert result.finished
+    assert result.events[-1].action == "end"
+    x, y, _ = result.pose_at(result.duration)
+    assert (x, y) == result.events[-1].position
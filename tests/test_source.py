@@ -0,0 +1,38 @@
+import cv2
+import numpy as np
+
+from vision.source import to_gray
+
+SIZE = (64, 48)
+
+
+def _rgb() -> np.ndarray:
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 256, (SIZE[1], SIZE[0], 3), dtype=np.uint8)
+
+
+def test_yuv420_uses_y_plane_without_copy():
+    rgb = _rgb()
+    yuv = cv2.cvtColor(rgb, cv2.COLOR_RGB2YUV_I420)
+    # Picamera2のYUV420は行の幅が揃えられていることがある
+    padded = np.zeros((yuv.shape[0], SIZE[0] + 16), dtype=np.uint8)
+    padded[:, : SIZE[0]] = yuv
+
+    gray = to_gray(padded, SIZE)
+
+    assert gray.shape == (SIZE[1], SIZE[0])
+    assert np.shares_memory(gray, padded)
+    np.testing.assert_array_equal(gray, yuv[: SIZE[1]])
+    # Y平面はRGBから変換したグレースケールを16-235の範囲に縮めた明るさ
+    expected = 16 + cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY) * (219 / 255)
+    assert np.abs(gray - expected).max() <= 2
+
+
+def test_rgb_is_converted_into_destination():
+    rgb = _rgb()
+    dst = np.empty((SIZE[1], SIZE[0]), dtype=np.uint8)
+
+    gray = to_gray(rgb, SIZE, dst)
+
+    assert np.shares_memory(gray, dst)
+    np.testing.assert_array_equal(gray, cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY))
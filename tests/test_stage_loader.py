@@ -0,0 +1,118 @@
+import json
+import math
+
+import pytest
+
+import stage_loader
+from main import create_stage
+from stage_loader import compile_stage, read_layout
+
+STAGE = """
+x_size = 5000
+y_size = 3000
+
+[start_area]
+position = [4000, 0]
+size = 1000
+
+[[walls]]
+x = 1000
+obstacled_y = [[0, 1000], [2000, 3000]]
+
+[[obstacles]]
+vertices = [[2500, 1200], [3000, 1200], [3000, 1700]]
+
+[[goals]]
+goal_id = 1
+position = [1500, 0]
+size = 1000
+
+[[goals]]
+goal_id = 3
+position = [0, 2000]
+size = 1000
+
+[[ar_markers]]
+marker_id = 4
+position = [2500, 3000]
+normal = [0, -1]
+
+[robot]
+position = [4050, 500]
+rotation = 90
+"""
+
+
+@pytest.fixture
+def stage_file(tmp_path):
+    path = tmp_path / "stage.toml"
+    path.write_text(STAGE)
+    return path
+
+
+def test_toml_and_json_layouts_match(stage_file, tmp_path):
+    layout = read_layout(stage_file)
+    assert (layout.x_size, layout.y_size) == (5000, 3000)
+    assert layout.start_area.position == (4000, 0)
+    assert layout.walls[0].obstacled_y == [(0, 1000), (2000, 3000)]
+    assert layout.obstacles[0].vertices == [(2500, 1200), (3000, 1200), (3000, 1700)]
+    assert [goal.goal_id for goal in layout.goals] == [1, 3]
+    assert layout.ar_markers[0].normal == (0, -1)
+    assert layout.robot_position == (4050, 500)
+    assert layout.robot_rotation == pytest.approx(math.pi / 2)
+
+    data = {
+        "x_size": 5000,
+        "y_size": 3000,
+        "start_area": {"position": [4000, 0], "size": 1000},
+        "goals": [{"goal_id": 1, "position": [1500, 0], "size": 1000}],
+        "robot": {"position": [4050, 500]},
+    }
+    json_path = tmp_path / "stage.json"
+    json_path.write_text(json.dumps(data))
+    minimal = read_layout(json_path)
+    assert minimal.walls == [] and minimal.obstacles == [] and minimal.ar_markers == []
+    assert minimal.robot_rotation == 0
+    assert minimal.digest != layout.digest
+
+
+def test_compiled_stage_is_cached_per_layout(
+    stage_file, tmp_path, run_virtual, monkeypatch
+):
+    cache_dir = tmp_path / "cache"
+
+    def compile_from_file():
+        async def build():
+            layout = read_layout(stage_file)
+            stage = create_stage(layout)
+            return compile_stage(stage, layout.digest, cache_dir=cache_dir)
+
+        return run_virtual(build())
+
+    compiled = compile_from_file()
+    assert len(list(cache_dir.glob("*.json"))) == 1
+    assert set(compiled.routes) == {
+        (a, b)
+        for a in ("start", "goal1", "goal3")
+        for b in ("start", "goal1", "goal3")
+        if a != b
+    }
+
+    # キャッシュがあれば経路を計算し直さない
+    def fail(_):
+        raise AssertionError("キャッシュを使わずに計算し直した")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(stage_loader, "waypoints", fail)
+        cached = compile_from_file()
+    assert cached.routes == compiled.routes
+    assert cached.planner.shape.equals(compiled.planner.shape)
+    route = cached.route("start", "goal3")
+    route.append((0, 0))
+    assert cached.route("start", "goal3") != route
+
+    # ステージファイルを変えたら別のキャッシュになる
+    stage_file.write_text(STAGE.replace("[3000, 1700]", "[3000, 1900]"))
+    changed = compile_from_file()
+    assert len(list(cache_dir.glob("*.json"))) == 2
+    assert not changed.planner.shape.equals(compiled.planner.shape)
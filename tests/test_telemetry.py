@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from robot_parts.arm import ArmState
+from telemetry import MAGIC, SAMPLE_DTYPE, Telemetry, TelemetryLog, load_telemetry
+
+
+def test_log_round_trip(make_stage, tmp_path):
+    robot = make_stage().robot
+    path = tmp_path / "match.bin"
+    first = [(4500.0, 500.0), (2000.0, 1500.0)]
+
+    with TelemetryLog(path, robot) as log:
+        assert robot.telemetry is log and robot.driver.telemetry is log
+        robot.path = first
+        log.record(linear_velocity=250, duration=2)
+        robot.position, robot.rotation = (4000.0, 700.0), 0.5
+        robot.arm.state = ArmState.HANDS_GRIPPED
+        log.record(angular_velocity=-1.5, duration=0.25)
+        # 同じ経路のリストは書き直さない
+        log.record()
+        robot.path = first[::-1]
+        log.record()
+    assert robot.telemetry is None and robot.driver.telemetry is None
+
+    telemetry = load_telemetry(path)
+    samples = telemetry.samples
+    # start, 4回のrecord, closeの6件
+    assert len(samples) == 6
+    assert np.all(np.diff(samples["timestamp"]) >= 0)
+    assert samples["path_id"].tolist() == [0, 1, 1, 1, 2, 2]
+    np.testing.assert_array_equal(telemetry.paths[1], first)
+    np.testing.assert_array_equal(telemetry.paths[2], first[::-1])
+    assert samples[1]["linear_velocity"] == 250 and samples[1]["duration"] == 2
+    assert samples[2]["angular_velocity"] == -1.5
+    np.testing.assert_allclose(
+        [samples[2]["x"], samples[2]["y"], samples[2]["rotation"]], [4000, 700, 0.5]
+    )
+    assert samples["arm"].tolist() == [0, 0, 2, 2, 2, 2]
+
+
+def test_truncated_log_keeps_complete_records(make_stage, tmp_path):
+    robot = make_stage().robot
+    path = tmp_path / "match.bin"
+    with TelemetryLog(path, robot) as log:
+        log.record(linear_velocity=100, duration=1)
+    data = path.read_bytes()
+    path.write_bytes(data[:-5])
+
+    assert len(load_telemetry(path).samples) == 2
+
+    path.write_bytes(b"NOPE" + data[len(MAGIC) :])
+    with pytest.raises(ValueError, match="テレメトリの記録ではありません"):
+        load_telemetry(path)
+
+
+def test_poses_dead_reckon_from_last_sample():
+    samples = np.zeros(2, dtype=SAMPLE_DTYPE)
+    samples[0] = (0, 1000, 1000, np.pi / 2, 0, 0, 200, 0, 1)
+    samples[1] = (2, 1000, 1200, np.pi / 2, 0, 0, 0, np.pi, 0.5)
+    telemetry = Telemetry(samples=samples, paths={})
+
+    poses = telemetry.poses(np.array([0.5, 1.5, 2.25, 3]))
+    # 指令の時間を過ぎたら止まっている
+    np.testing.assert_allclose(
+        poses,
+        [
+            [1000, 1100, np.pi / 2],
+            [1000, 1200, np.pi / 2],
+            [1000, 1200, np.pi / 4 * 3],
+            [1000, 1200, -np.pi],
+        ],
+        atol=1e-3,
+    )
+    assert telemetry.duration == 2
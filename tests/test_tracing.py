@@ -0,0 +1,54 @@
+import asyncio
+import gc
+import weakref
+
+import tracing
+from tracing import Tracer
+
+
+def test_finished_tasks_are_not_kept_alive(run_virtual):
+    tracer = Tracer(clock=lambda: asyncio.get_running_loop().time())
+    refs: list[weakref.ref] = []
+
+    async def step(i: int) -> None:
+        with tracer.span("step", index=i):
+            await asyncio.sleep(0.1)
+
+    async def main() -> None:
+        for i in range(3):
+            task = asyncio.create_task(step(i), name=f"step-{i}")
+            refs.append(weakref.ref(task))
+            await task
+        tracer.instant("done")
+
+    run_virtual(main())
+    gc.collect()
+
+    assert all(ref() is None for ref in refs)
+    events = tracer.trace_events()
+    names = {e["tid"]: e["args"]["name"] for e in events if e["ph"] == "M"}
+    # 終わったタスクの名前も残る (mainのタスクと3つのstep)
+    assert len(names) == 4
+    assert {"step-0", "step-1", "step-2"} <= set(names.values())
+    spans = [e for e in events if e["ph"] == "X"]
+    assert [names[e["tid"]] for e in spans] == ["step-0", "step-1", "step-2"]
+    assert [round(e["dur"]) for e in spans] == [100000] * 3
+
+
+def test_traced_records_only_when_enabled(run_virtual):
+    @tracing.traced()
+    async def move(distance: float) -> float:
+        await asyncio.sleep(0.5)
+        return distance
+
+    assert run_virtual(move(10)) == 10
+    tracer = tracing.enable(clock=lambda: asyncio.get_running_loop().time())
+    try:
+        assert run_virtual(move(distance=20)) == 20
+    finally:
+        tracing.disable()
+
+    (event,) = [e for e in tracer.trace_events() if e["ph"] == "X"]
+    assert event["name"].endswith("move")
+    assert event["args"] == {"distance": 20}
+    assert round(event["dur"]) == 500000
@@ -0,0 +1,82 @@
+import cv2.aruco as aruco
+import numpy as np
+
+from vision.tracking import ARTracker
+
+DICTIONARY = aruco.getPredefinedDictionary(aruco.DICT_4X4_50)
+CAMERA_MATRIX = np.array([[600.0, 0, 320], [0, 600.0, 240], [0, 0, 1]])
+SIDE = 80
+
+
+class _CountingDetector:
+    """
+    detectMarkersに渡された画像の大きさを記録するArucoDetector
+    """
+
+    def __init__(self) -> None:
+        self.detector = aruco.ArucoDetector(DICTIONARY)
+        self.shapes: list[tuple[int, ...]] = []
+
+    def detectMarkers(self, image):
+        self.shapes.append(image.shape)
+        return self.detector.detectMarkers(image)
+
+
+def _frame(x: int, y: int, marker_id: int = 4) -> np.ndarray:
+    frame = np.full((480, 640), 255, dtype=np.uint8)
+    frame[y : y + SIDE, x : x + SIDE] = aruco.generateImageMarker(
+        DICTIONARY, marker_id, SIDE
+    )
+    return frame
+
+
+def _tracker(detector: _CountingDetector, **kwargs) -> ARTracker:
+    return ARTracker(detector, CAMERA_MATRIX, 0.1, **kwargs)  # type: ignore[arg-type]
+
+
+def test_small_motion_is_tracked_in_roi():
+    detector = _CountingDetector()
+    tracker = _tracker(detector)
+    tracker.detect(_frame(200, 150))
+    assert detector.shapes == [(480, 640)]
+
+    corners, ids = tracker.detect(_frame(210, 155))
+    assert ids is not None and ids.ravel().tolist() == [4]
+    # 切り出した領域だけを検出し、四隅は全画面の座標に戻す
+    assert detector.shapes[-1][0] < 480 and detector.shapes[-1][1] < 640
+    full, _, _ = aruco.ArucoDetector(DICTIONARY).detectMarkers(_frame(210, 155))
+    np.testing.assert_allclose(corners[0], full[0], atol=1e-3)
+
+
+def test_yaw_shifts_the_roi():
+    detector = _CountingDetector()
+    tracker = _tracker(detector, padding=0.2)
+    tracker.detect(_frame(200, 150))
+
+    # 左に回ると像は右へ流れる (fx * tan(yaw) ≈ 150px)
+    yaw = float(np.arctan(150 / 600))
+    _, ids = tracker.detect(_frame(350, 150), yaw=yaw)
+    assert ids is not None and ids.ravel().tolist() == [4]
+    assert len(detector.shapes) == 2 and detector.shapes[-1] != (480, 640)
+
+
+def test_lost_marker_falls_back_to_full_scan():
+    detector = _CountingDetector()
+    tracker = _tracker(detector)
+    tracker.detect(_frame(100, 100))
+
+    corners, ids = tracker.detect(_frame(450, 320))
+    assert ids is not None and ids.ravel().tolist() == [4]
+    # 切り出しで見失ったので、同じフレームを全画面で探し直した
+    assert detector.shapes[-1] == (480, 640) and len(detector.shapes) == 3
+    assert corners[0].reshape(4, 2).min(axis=0).tolist() == [450, 320]
+
+
+def test_full_scan_every_interval():
+    detector = _CountingDetector()
+    tracker = _tracker(detector, full_scan_interval=3)
+    frame = _frame(200, 150)
+    for _ in range(7):
+        tracker.detect(frame)
+    full = [i for i, shape in enumerate(detector.shapes) if shape == (480, 640)]
+    assert full == [0, 3, 6]
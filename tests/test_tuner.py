@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from vision.recording import FrameRecorder
+from vision.tuner import load_frames
+
+
+def _record(path, frames: list[np.ndarray]) -> None:
+    recorder = FrameRecorder(path, capacity=len(frames))
+    for frame in frames:
+        recorder.record(frame)
+    recorder.close()
+
+
+@pytest.fixture
+def gray() -> np.ndarray:
+    return np.random.default_rng(0).integers(0, 256, (48, 64), dtype=np.uint8)
+
+
+def test_yuv420_recording_keeps_y_plane(tmp_path, gray):
+    yuv = np.vstack([gray, np.full((24, 64), 128, dtype=np.uint8)])
+    _record(tmp_path / "yuv.npy", [yuv])
+
+    (frame,) = load_frames([tmp_path / "yuv.npy"], (64, 48))
+    np.testing.assert_array_equal(frame, gray)
+
+
+def test_grayscale_recording_is_not_cropped(tmp_path, gray):
+    _record(tmp_path / "gray.npy", [gray, gray])
+
+    frames = load_frames([tmp_path / "gray.npy"], (64, 48))
+    assert len(frames) == 2
+    np.testing.assert_array_equal(frames[0], gray)
+
+
+def test_unknown_shape_is_rejected(tmp_path, gray):
+    _record(tmp_path / "gray.npy", [gray])
+
+    with pytest.raises(ValueError):
+        load_frames([tmp_path / "gray.npy"], (640, 480))
+    with pytest.raises(ValueError):
+        load_frames([tmp_path / "gray.npy"], None)
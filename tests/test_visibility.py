@@ -0,0 +1,25 @@
+import numpy as np
+
+from stage import ARMarker
+from visibility import cached_visibility
+
+CAMERA_MATRIX = np.array([[600.0, 0, 320], [0, 600.0, 240], [0, 0, 1]])
+MARKERS = [ARMarker(position=(2500, 3000), normal=(0, -1), marker_id=0)]
+
+
+def test_cached_visibility_is_saved_and_reused(make_stage, tmp_path):
+    stage = make_stage(ar_markers=MARKERS)
+    first = cached_visibility(stage, "digest", CAMERA_MATRIX, 640, cache_dir=tmp_path)
+    (saved,) = tmp_path.glob("*.npz")
+
+    second = cached_visibility(stage, "digest", CAMERA_MATRIX, 640, cache_dir=tmp_path)
+    np.testing.assert_array_equal(first.pixel_sizes, second.pixel_sizes)
+    assert list(tmp_path.glob("*.npz")) == [saved]
+    # 正面から見える位置と向きでは映る
+    assert first.visible_markers((2500, 1500), np.pi / 2).tolist() == [0]
+
+    # 設定が変われば別のキャッシュになる
+    cached_visibility(
+        stage, "digest", CAMERA_MATRIX, 640, cache_dir=tmp_path, cell_size=200
+    )
+    assert len(list(tmp_path.glob("*.npz"))) == 2
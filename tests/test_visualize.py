@@ -0,0 +1,50 @@
+import gc
+
+from visualize import VISUALIZABLES, Layer, Visualizable, VisualizableRegistry
+
+
+class _Marker(Visualizable):
+    layer = Layer.MARKER
+
+
+class _Mover(Visualizable):
+    layer = Layer.ROBOT
+    dynamic = True
+
+
+class _Background(Visualizable):
+    layer = Layer.STAGE
+
+
+def test_items_are_ordered_by_layer_then_registration():
+    registry = VisualizableRegistry()
+    mover, first, background, second = _Mover(), _Marker(), _Background(), _Marker()
+    for visualizable in (mover, first, background, second):
+        registry.add(visualizable)
+
+    assert registry.items() == [background, first, second, mover]
+    assert registry.items(dynamic=False) == [background, first, second]
+    assert registry.items(dynamic=True) == [mover]
+    assert len(registry) == 4
+
+
+def test_dead_visualizables_are_dropped():
+    registry = VisualizableRegistry()
+    kept, dropped = _Marker(), _Marker()
+    registry.add(kept)
+    registry.add(dropped)
+
+    del dropped
+    gc.collect()
+
+    assert registry.items() == [kept]
+    assert len(registry) == 1
+
+
+def test_instances_register_themselves_weakly():
+    marker = _Marker()
+    assert any(visualizable is marker for visualizable in VISUALIZABLES)
+
+    del marker
+    gc.collect()
+    assert not any(isinstance(visualizable, _Marker) for visualizable in VISUALIZABLES)